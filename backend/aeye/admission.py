@@ -0,0 +1,199 @@
+import asyncio, httpx, math, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from .config import (
+    ADMISSION_BACKOFF_RATIO,
+    ADMISSION_INITIAL_LIMIT,
+    ADMISSION_LATENCY_TOLERANCE,
+    ADMISSION_MAX_ACTIVE_REQUESTS,
+    ADMISSION_MAX_LIMIT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MIN_LIMIT,
+    ADMISSION_QUEUE_TIMEOUT,
+)
+from .resilience import CircuitOpen, DeadlineExceeded, remaining_budget
+from .telemetry import register_stats
+
+
+class Overloaded(Exception):
+    """Raised when a limiter rejects work; `retry_after` is a hint in seconds for the client."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"{stage} is overloaded, retry after {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+OVERLOAD_STATUS_CODES = (429, 503)  # Downstream responses that mean "too much load", like a timeout
+
+
+def is_congestion(e: BaseException) -> bool:
+    """
+    Whether a failed call says the downstream is congested: a timeout or an overload response, also when
+    wrapped (e.g. in DownstreamError). An open circuit, the request's own deadline and rejected input do not.
+    """
+    while e is not None:
+        if isinstance(e, (CircuitOpen, DeadlineExceeded)):
+            return False
+        if (
+            isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException, Overloaded))
+            or getattr(e, "status_code", None) in OVERLOAD_STATUS_CODES
+        ):
+            return True
+        e = e.__cause__
+    return False
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds how many calls of one pipeline stage run at once, with a bounded wait queue in front.
+
+    Callers beyond the limit wait in FIFO order for at most `queue_timeout` seconds; when `max_queue`
+    callers are already waiting, or the wait times out, `Overloaded` is raised instead. With `adaptive`
+    the limit follows AIMD on the observed latency of the guarded calls: every call that completes
+    within `latency_tolerance` times the baseline (the lowest recent latency) while the limit is in use
+    raises the limit by about one per round trip, and a slower call, or one that failed with a timeout
+    or an overload (see `is_congestion`), multiplies it by `backoff_ratio`, at most once per round trip.
+    Other failures leave the limit alone. All state is only touched from the event loop.
+    """
+
+    baseline_drift = 0.01  # Relative growth of the baseline per call, so it can follow a downstream that got slower for good
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float,
+        min_limit: float = 1,
+        max_limit: float = 1,
+        max_queue: int = 0,
+        queue_timeout: float = 0.0,
+        adaptive: bool = False,
+        latency_tolerance: float = ADMISSION_LATENCY_TOLERANCE,
+        backoff_ratio: float = ADMISSION_BACKOFF_RATIO,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, initial_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.counters = {"admitted": 0, "rejected": 0, "timeouts": 0, "decreases": 0}
+
+    async def acquire(self):
+        """Takes a slot, waiting in the queue if needed; raises `Overloaded` if the stage cannot take more work."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise Overloaded(self.name, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            remaining = remaining_budget()  # Do not queue past the request's deadline
+            await asyncio.wait_for(waiter, self.queue_timeout if remaining is None else max(0.0, min(self.queue_timeout, remaining)))
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)  # The slot was handed over just as the wait ended; pass it on
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters["timeouts"] += 1
+                raise Overloaded(self.name, self.retry_after()) from None
+            raise
+        self.counters["admitted"] += 1
+
+    def release(self, latency: Optional[float], congested: bool = False):
+        """Frees a slot; `latency` (None if the call did not complete) drives the adaptive limit."""
+        if latency is not None:
+            self._observe(latency, congested)
+
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1  # The slot passes directly to the waiter
+                waiter.set_result(None)
+
+    async def run(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """Awaits `fn(*args)` inside a slot, measuring its latency."""
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            result = await fn(*args)
+        except Exception as e:
+            # An open circuit, a spent deadline or bad input fail fast whatever the load; they say nothing about the limit
+            self.release(time.monotonic() - start if is_congestion(e) else None, congested=True)
+            raise
+        except BaseException:
+            self.release(None)
+            raise
+        self.release(time.monotonic() - start)
+        return result
+
+    def retry_after(self) -> int:
+        """Estimates in whole seconds how long it takes until the current queue has drained."""
+        latency = self.latency_ewma or 1.0
+        return max(1, math.ceil(latency * (len(self._waiters) + 1) / max(int(self.limit), 1)))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.counters,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "latency_ewma": round(self.latency_ewma or 0.0, 6),
+        }
+
+    def _observe(self, latency: float, congested: bool):
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        if not self.adaptive:
+            return
+
+        self.baseline = latency if self.baseline is None else min(latency, self.baseline * (1 + self.baseline_drift))
+        now = time.monotonic()
+        if congested or latency > self.latency_tolerance * self.baseline:
+            # Back off once per round trip, not once per call that was in flight when latency went up
+            if now - self._last_decrease >= latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                self._last_decrease = now
+                self.counters["decreases"] += 1
+        elif self.in_flight >= int(self.limit):
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)  # Only grow while the limit is actually reached
+
+
+def stage_limiter(name: str) -> ConcurrencyLimiter:
+    """Creates an adaptive limiter for a downstream stage using the configured bounds."""
+    return ConcurrencyLimiter(
+        name,
+        ADMISSION_INITIAL_LIMIT,
+        min_limit=ADMISSION_MIN_LIMIT,
+        max_limit=ADMISSION_MAX_LIMIT,
+        max_queue=ADMISSION_MAX_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+        adaptive=True,
+    )
+
+
+# Requests processed at once by this server process; requests beyond it are turned away immediately
+request_gate = ConcurrencyLimiter("request", ADMISSION_MAX_ACTIVE_REQUESTS, max_limit=ADMISSION_MAX_ACTIVE_REQUESTS)
+quality_limiter = stage_limiter("image_quality")
+diagnose_limiter = stage_limiter("diagnose")
+report_limiter = stage_limiter("report")
+
+for _limiter in (request_gate, quality_limiter, diagnose_limiter, report_limiter):
+    register_stats("admission", _limiter.stats, stage=_limiter.name)
@@ -2,5 +2,8 @@ from django.apps import AppConfig
 
 
 class AeyeConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'aeye'
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "aeye"
+
+    def ready(self):
+        from . import signals  # noqa: F401 Connects the rollup receivers
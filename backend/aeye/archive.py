@@ -0,0 +1,277 @@
+import datetime, fcntl, functools, mmap, os, struct, threading
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import ARCHIVE_CHUNK_SIZE, ARCHIVE_PACK_MAX_BYTES, ARCHIVE_PREFIX
+from .models import DiagnoseReport, rollups_kept
+from .storage import ContentAddressedStorage, fundus_storage
+from .telemetry import register_stats
+
+INDEX_ENTRY = struct.Struct("<II")  # (pack number, row within the pack); pack 0 marks an id that is not archived
+EPOCH, MICROSECOND = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc), datetime.timedelta(microseconds=1)
+
+# Metadata columns of a pack, in the order they are read from the database
+COLUMNS = (
+    "id",
+    "created_at",
+    "camera_type",
+    "diagnose_result",
+    "confidence",
+    "age",
+    "gender",
+    "diabetes_history",
+    "family_diabetes_history",
+    "weight",
+    "height",
+    "fundus_image",
+)
+COLUMN_TYPES = {
+    "id": np.int64,
+    "diagnose_result": np.bool_,
+    "confidence": np.float64,
+    "age": np.int16,
+    "weight": np.float64,
+    "height": np.float64,
+}
+
+
+class PackWriter:
+    """
+    Appends report images to one pack file and collects the report metadata column by column.
+
+    Images are concatenated in `pack-NNNNNN.pack`; the metadata, including each image's offset and
+    length in the pack, is written on `close` as compressed NumPy columns in `pack-NNNNNN.meta.npz`.
+    Reports sharing an image (the store deduplicates by content) share its bytes in the pack.
+    """
+
+    def __init__(self, directory: str, number: int):
+        self.number = number
+        self.path = os.path.join(directory, f"pack-{number:06d}")
+        self._file = open(self.path + ".pack", "xb")
+        self.size = 0
+        self.ids: List[int] = []
+        self.columns: Dict[str, List[Any]] = {column: [] for column in (*COLUMNS, "image_offset", "image_length")}
+        self._offsets: Dict[str, Tuple[int, int]] = {}  # image name -> (offset, length) within this pack
+
+    def add(self, report: Dict[str, Any], storage: ContentAddressedStorage):
+        name = report["fundus_image"]
+        if name not in self._offsets:
+            image = b""
+            if name:
+                try:
+                    with storage.open(name, "rb") as f:
+                        image = f.read()
+                except FileNotFoundError:
+                    print(f"Image {name} of report {report['id']} is missing; archiving the report without it")
+            self._offsets[name] = (self.size, len(image))
+            self._file.write(image)
+            self.size += len(image)
+
+        self.ids.append(report["id"])
+        for column in COLUMNS:
+            self.columns[column].append(report[column])
+        offset, length = self._offsets[name]
+        self.columns["image_offset"].append(offset)
+        self.columns["image_length"].append(length)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def close(self):
+        """Makes the pack durable: images first, then the metadata, written under a temporary name and renamed into place."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        arrays = {column: np.asarray(values, dtype=COLUMN_TYPES.get(column)) for column, values in self.columns.items()}
+        arrays["created_at"] = np.array([(value - EPOCH) // MICROSECOND for value in self.columns["created_at"]], dtype=np.int64)
+        arrays["image_offset"] = np.asarray(self.columns["image_offset"], dtype=np.int64)
+        arrays["image_length"] = np.asarray(self.columns["image_length"], dtype=np.int64)
+        temp_path = self.path + ".meta.tmp.npz"
+        np.savez_compressed(temp_path, **arrays)
+        with open(temp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path + ".meta.npz")
+        self.columns = {}  # Only the ids and image offsets are needed from here on
+
+    def abort(self):
+        self._file.close()
+        os.unlink(self.path + ".pack")
+
+
+class ReportArchive:
+    """
+    Cold storage of old reports in append-only packfiles, with an O(1) lookup by report id.
+
+    `index.bin` is a direct-addressed table of fixed-size entries: the entry of report `id` lives at
+    byte `id * 8` and names its pack and row. The table is a sparse file, memory-mapped read-only by
+    readers and only ever grown, so a lookup is one slice of the map regardless of the archive size.
+    A pack's metadata is loaded and its pack file mapped on first access, and both are kept.
+    """
+
+    def __init__(self, storage: ContentAddressedStorage, prefix: str):
+        self.storage = storage
+        self.prefix = prefix
+        self._index: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0}
+
+    @property
+    def directory(self) -> str:
+        return self.storage.path(self.prefix)
+
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "index.bin")
+
+    def _locate(self, report_id: int) -> Optional[Tuple[int, int]]:
+        position = report_id * INDEX_ENTRY.size
+        with self._lock:
+            if self._index is None or position + INDEX_ENTRY.size > len(self._index):
+                # The archive job may have grown the index since it was mapped
+                try:
+                    with open(self._index_path(), "rb") as f:
+                        if os.fstat(f.fileno()).st_size == 0:
+                            return None
+                        index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except FileNotFoundError:
+                    return None
+                if self._index is not None:
+                    self._index.close()
+                self._index = index
+            if report_id < 0 or position + INDEX_ENTRY.size > len(self._index):
+                return None
+            pack, row = INDEX_ENTRY.unpack_from(self._index, position)
+        return (pack, row) if pack else None
+
+    @functools.lru_cache(maxsize=64)
+    def _pack(self, number: int) -> Tuple[Dict[str, np.ndarray], mmap.mmap]:
+        path = os.path.join(self.directory, f"pack-{number:06d}")
+        with np.load(path + ".meta.npz") as meta:
+            columns = {column: meta[column] for column in meta.files}
+        with open(path + ".pack", "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        return columns, data
+
+    def get(self, report_id: int) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """Returns the metadata and image of an archived report, or None if the id is not archived."""
+        self.counters["lookups"] += 1
+        location = self._locate(report_id)
+        if location is None:
+            return None
+        columns, data = self._pack(location[0])
+        row = location[1]
+        record = {column: columns[column][row].item() for column in COLUMNS}
+        record["created_at"] = EPOCH + datetime.timedelta(microseconds=record["created_at"])
+        offset, length = int(columns["image_offset"][row]), int(columns["image_length"][row])
+        self.counters["hits"] += 1
+        return record, data[offset : offset + length]
+
+    def stats(self) -> Dict[str, int]:
+        return self.counters
+
+    def scan(self, *columns: str) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Yields the given metadata columns of every pack, one pack at a time, keeping only the rows the
+        index points at, so a report archived twice (after an interrupted job) is seen once.
+        """
+        try:
+            numbers = sorted(int(name[5:11]) for name in os.listdir(self.directory) if name.startswith("pack-") and name.endswith(".pack"))
+            index = np.fromfile(self._index_path(), dtype=np.dtype([("pack", "<u4"), ("row", "<u4")]))
+        except FileNotFoundError:
+            return
+        for number in numbers:
+            with np.load(os.path.join(self.directory, f"pack-{number:06d}.meta.npz")) as meta:
+                ids = meta["id"]
+                entries = index[ids]
+                current = (entries["pack"] == number) & (entries["row"] == np.arange(len(ids)))
+                yield {column: meta[column][current] for column in columns}
+
+    def archive(
+        self, cutoff: datetime.datetime, chunk_size: int = ARCHIVE_CHUNK_SIZE, pack_max_bytes: int = ARCHIVE_PACK_MAX_BYTES
+    ) -> Iterator[Dict[str, int]]:
+        """
+        Moves every report created before `cutoff` into packs and removes it from the hot database and store.
+
+        Reports are streamed with `.iterator()` in chunks of `chunk_size`, so memory stays flat however many
+        qualify. Each pack is made durable and indexed before its rows and images are deleted, so a crash
+        leaves reports at worst in both places, never in neither. An image is only deleted once no hot report
+        refers to it anymore. Rows are only deleted once the iteration is over, as SQLite does not isolate
+        a query from writes on the same connection. Yields a summary of every pack. Only one job runs at a time.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)  # Raises BlockingIOError if another job is running
+
+            reports = DiagnoseReport.objects.filter(created_at__lt=cutoff).order_by("id").values(*COLUMNS)
+            writer: Optional[PackWriter] = None
+            sealed: List[PackWriter] = []
+            try:
+                for report in reports.iterator(chunk_size=chunk_size):
+                    if writer is None:
+                        writer = PackWriter(self.directory, self._next_pack_number())
+                    writer.add(report, self.storage)
+                    if writer.size >= pack_max_bytes:
+                        self._seal(writer)
+                        sealed.append(writer)
+                        writer = None
+                if writer is not None:
+                    self._seal(writer)
+                    sealed.append(writer)
+                    writer = None
+            finally:
+                if writer is not None:
+                    writer.abort()  # Nothing was indexed for this pack
+
+            for writer in sealed:
+                yield self._release(writer, chunk_size)
+
+    def _next_pack_number(self) -> int:
+        numbers = [int(name[5:11]) for name in os.listdir(self.directory) if name.startswith("pack-") and name.endswith(".pack")]
+        return max(numbers, default=0) + 1
+
+    def _seal(self, writer: PackWriter):
+        """Makes a pack durable and points the index entries of its reports at it."""
+        writer.close()
+        index = os.open(self._index_path(), os.O_RDWR | os.O_CREAT, 0o644)  # Not O_APPEND, which would make pwrite append
+        try:
+            for row, report_id in enumerate(writer.ids):
+                os.pwrite(index, INDEX_ENTRY.pack(writer.number, row), report_id * INDEX_ENTRY.size)
+            os.fsync(index)
+        finally:
+            os.close(index)
+
+    def _release(self, writer: PackWriter, chunk_size: int) -> Dict[str, int]:
+        """Deletes the hot rows and images of a sealed pack."""
+        ids = writer.ids
+        with rollups_kept():  # Archived reports are still counted
+            for start in range(0, len(ids), chunk_size):
+                DiagnoseReport.objects.filter(id__in=ids[start : start + chunk_size]).delete()
+
+        deleted = self._delete_unreferenced_images(writer)
+        return {"pack": writer.number, "reports": len(writer), "bytes": writer.size, "images_deleted": deleted}
+
+    def _delete_unreferenced_images(self, writer: PackWriter) -> int:
+        names = sorted(name for name in writer._offsets if name)
+        deleted = 0
+        for start in range(0, len(names), ARCHIVE_CHUNK_SIZE):
+            chunk = names[start : start + ARCHIVE_CHUNK_SIZE]
+            referenced = set(DiagnoseReport.objects.filter(fundus_image__in=chunk).values_list("fundus_image", flat=True))
+            for name in chunk:
+                if name in referenced:
+                    continue  # A report that stays hot has the same image
+                self.storage.delete(name)
+                deleted += 1
+
+            # A report saved meanwhile may have been deduplicated against an image just deleted: put those back
+            revived = set(DiagnoseReport.objects.filter(fundus_image__in=chunk).values_list("fundus_image", flat=True))
+            for name in revived - referenced:
+                offset, length = writer._offsets[name]
+                with open(writer.path + ".pack", "rb") as f:
+                    f.seek(offset)
+                    self.storage.save_bytes(f.read(length), os.path.splitext(name)[1])
+                deleted -= 1
+        return deleted
+
+
+report_archive = ReportArchive(fundus_storage, ARCHIVE_PREFIX)
+register_stats("report_archive", report_archive.stats)
@@ -0,0 +1,104 @@
+import asyncio, queue, threading, time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """
+    Groups concurrent calls to a batch function and runs them together on a dedicated thread.
+
+    The batching thread takes the first waiting item, then keeps collecting items until either
+    `max_batch_size` items are gathered or `max_wait` seconds have passed since the first one. With
+    `max_wait = 0` it only batches whatever is already queued, which adds no latency at low load while
+    still forming batches when requests pile up behind a running batch. `fn` receives the list of items
+    and must return one result per item, in order; each result is routed back to its caller.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch_size: int, max_wait: float, name: str = "micro-batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[Tuple[Any, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.counters = {"batches": 0, "items": 0, "max_batch_size_seen": 0}
+
+    def submit(self, item: Any) -> Any:
+        """Adds an item to the next batch and blocks until its result is available."""
+        return self._enqueue(item).result()
+
+    async def submit_async(self, item: Any) -> Any:
+        """Adds an item to the next batch and waits for its result without blocking the event loop."""
+        return await asyncio.wrap_future(self._enqueue(item))
+
+    def stats(self) -> Dict[str, float]:
+        """Returns batch counters, including the mean batch size so far."""
+        batches = self.counters["batches"]
+        return {**self.counters, "mean_batch_size": self.counters["items"] / batches if batches else 0.0, "queued": self._queue.qsize()}
+
+    def stop(self):
+        """Stops the batching thread once the items queued so far have been processed."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def _enqueue(self, item: Any) -> Future:
+        future: Future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _collect(self, first: Tuple[Any, Future]) -> List[Tuple[Any, Future]]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)  # Handle the stop request after this batch
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            try:
+                self._process(self._collect(first))
+            except Exception as e:  # Never let one batch end the thread: every later submit would hang
+                print(f"{self.name} failed to process a batch: {e!r}")
+
+    def _process(self, batch: List[Tuple[Any, Future]]):
+        # Callers that gave up (e.g. a cancelled `submit_async`) have cancelled their future; skip their items
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.counters["batches"] += 1
+        self.counters["items"] += len(batch)
+        self.counters["max_batch_size_seen"] = max(self.counters["max_batch_size_seen"], len(batch))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,123 @@
+import asyncio, hashlib, json, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from .config import RESULT_CACHE_ENABLED, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL
+from .resilience import DeadlineExceeded, remaining_budget, without_deadline
+from .telemetry import register_stats
+
+
+def content_key(image_data: bytes, form_data: Optional[Dict[str, Any]] = None, fields: Iterable[str] = ()) -> str:
+    """Builds a cache key from a hash of the image bytes plus the given form fields."""
+    digest = hashlib.blake2b(image_data, digest_size=16).hexdigest()
+    if not fields:
+        return digest
+    relevant = {field: (form_data or {}).get(field) for field in fields}
+    return digest + ":" + json.dumps(relevant, sort_keys=True, default=str)
+
+
+class ResultCache:
+    """
+    LRU cache with per-entry TTL and an approximate memory cap, for results of downstream calls.
+
+    Concurrent lookups of a key that is still being computed share the in-flight computation, so N
+    identical requests cost a single downstream call. The shared computation runs without the deadline
+    of the request that started it; each caller instead stops waiting when its own budget runs out
+    (raising `DeadlineExceeded`), and the computation is cancelled once no caller waits for it anymore.
+    Failed computations are never cached.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float, enabled: bool = True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._in_flight: Dict[str, list] = {}  # key -> [task, number of waiting callers]
+        self._bytes = 0
+
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0}
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns the cached value for `key`, joining or starting its computation if needed."""
+        if not self.enabled:
+            return await compute()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[2]
+            self._remove(key)
+            self.counters["expirations"] += 1
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is None or in_flight[0].cancelled():
+            self.counters["misses"] += 1
+            in_flight = self._in_flight[key] = [None, 0]
+            in_flight[0] = asyncio.ensure_future(self._compute(key, compute, in_flight))
+        else:
+            self.counters["coalesced"] += 1
+
+        task = in_flight[0]
+        in_flight[1] += 1  # Number of callers waiting on the shared computation
+        try:
+            # One caller going away must not cancel the call for the others
+            return await asyncio.wait_for(asyncio.shield(task), remaining_budget())
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            if in_flight[1] == 1 and not task.done():
+                task.cancel()  # Nobody else needs the result
+                if self._in_flight.get(key) is in_flight:
+                    del self._in_flight[key]  # Callers arriving before the cancellation lands start afresh
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded("Latency budget exhausted while waiting for a shared result") from None
+            raise
+        finally:
+            in_flight[1] -= 1
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], in_flight: list) -> Any:
+        try:
+            with without_deadline():
+                value = await compute()
+        finally:
+            if self._in_flight.get(key) is in_flight:
+                del self._in_flight[key]
+        self._store(key, value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """Returns hit/miss/eviction counters together with the current size of the cache."""
+        return {**self.counters, "entries": len(self._entries), "bytes": self._bytes, "in_flight": len(self._in_flight)}
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _store(self, key: str, value: Any):
+        size = len(key) + len(json.dumps(value, default=str))  # Rough in-memory footprint of the entry
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))  # Least recently used first
+            self.counters["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+# Process-wide caches for the two downstream calls
+quality_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, enabled=RESULT_CACHE_ENABLED)
+diagnose_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, enabled=RESULT_CACHE_ENABLED)
+register_stats("result_cache", quality_cache.stats, cache="image_quality")
+register_stats("result_cache", diagnose_cache.stats, cache="diagnose")
+
+# Form fields that influence the diagnosis and are therefore part of its cache key
+DIAGNOSE_KEY_FIELDS = ("cameraType", "customCameraType", "age", "gender", "diabetesHistory", "familyDiabetesHistory", "weight", "height")
@@ -0,0 +1,183 @@
+import httpx, json
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import (
+    DOWNSTREAM_BASE_URL,
+    DOWNSTREAM_BREAKER_FAILURES,
+    DOWNSTREAM_BREAKER_RESET_TIMEOUT,
+    DOWNSTREAM_CONNECT_TIMEOUT,
+    DOWNSTREAM_HEDGE_DEFAULT_DELAY,
+    DOWNSTREAM_HEDGE_MIN_SAMPLES,
+    DOWNSTREAM_HEDGE_PERCENTILE,
+    DOWNSTREAM_HEDGING,
+    DOWNSTREAM_KEEPALIVE_EXPIRY,
+    DOWNSTREAM_LATENCY_WINDOW,
+    DOWNSTREAM_MAX_CONNECTIONS,
+    DOWNSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    DOWNSTREAM_POOL_TIMEOUT,
+    DOWNSTREAM_TIMEOUT,
+    INFERENCE_TRANSPORT,
+    INFERENCE_UDS_PATH,
+)
+from .inference import check_image_quality_async, diagnose_async
+from .resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, HedgedEndpoint, bounded_timeout
+from .views import FORM_DATA_HEADER
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Creates a keep-alive client for the downstream inference APIs using the configured pool limits.
+
+    With the "uds" transport the client connects to the Unix-domain socket at INFERENCE_UDS_PATH instead
+    of DOWNSTREAM_BASE_URL's host and port; requests keep the base URL's path and Host header.
+    """
+    limits = httpx.Limits(
+        max_connections=DOWNSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=DOWNSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=DOWNSTREAM_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        base_url=DOWNSTREAM_BASE_URL,
+        limits=limits,
+        transport=httpx.AsyncHTTPTransport(uds=INFERENCE_UDS_PATH, limits=limits) if INFERENCE_TRANSPORT == "uds" else None,
+        timeout=httpx.Timeout(DOWNSTREAM_TIMEOUT, connect=DOWNSTREAM_CONNECT_TIMEOUT, pool=DOWNSTREAM_POOL_TIMEOUT),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide downstream client.
+
+    The client is opened on lifespan startup; servers that do not send lifespan events get it lazily on first use.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client():
+    """Closes the process-wide client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class DownstreamError(Exception):
+    """Raised when a downstream inference API does not return a usable response."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_timeout() -> httpx.Timeout:
+    """Per-attempt timeouts, capped at what is left of the request's latency budget."""
+    timeout = bounded_timeout(DOWNSTREAM_TIMEOUT)
+    return httpx.Timeout(timeout, connect=min(DOWNSTREAM_CONNECT_TIMEOUT, timeout), pool=min(DOWNSTREAM_POOL_TIMEOUT, timeout))
+
+
+def is_endpoint_failure(e: BaseException) -> bool:
+    """
+    Transport errors, timeouts and 5xx responses count against the circuit breaker; a rejected request does not,
+    nor does a timeout that only fired because the request's own budget was running out.
+    """
+    if isinstance(e, DeadlineExceeded):
+        return False
+    return not isinstance(e, DownstreamError) or e.status_code is None or e.status_code >= 500
+
+
+async def post_image(path: str, image_data: bytes, headers: Dict[str, str]) -> httpx.Response:
+    """Posts raw image bytes once; a timeout that was cut short by the request's budget raises DeadlineExceeded."""
+    timeout = request_timeout()
+    try:
+        # Host/port, pool limits and timeouts come from DOWNSTREAM_* in config.py; raw bytes are sent as-is, without copying
+        return await get_http_client().post(path, content=image_data, headers=headers, timeout=timeout)
+    except httpx.TimeoutException as e:
+        limit, full = {
+            httpx.ConnectTimeout: (timeout.connect, DOWNSTREAM_CONNECT_TIMEOUT),
+            httpx.PoolTimeout: (timeout.pool, DOWNSTREAM_POOL_TIMEOUT),
+        }.get(type(e), (timeout.read, DOWNSTREAM_TIMEOUT))
+        if limit < full:
+            raise DeadlineExceeded(f"{path} timed out after the {limit:.2f}s left of the latency budget") from e
+        raise
+
+
+def create_endpoint(name: str) -> HedgedEndpoint:
+    return HedgedEndpoint(
+        name,
+        CircuitBreaker(name, DOWNSTREAM_BREAKER_FAILURES, DOWNSTREAM_BREAKER_RESET_TIMEOUT),
+        hedge_percentile=DOWNSTREAM_HEDGE_PERCENTILE,
+        default_hedge_delay=DOWNSTREAM_HEDGE_DEFAULT_DELAY,
+        min_samples=DOWNSTREAM_HEDGE_MIN_SAMPLES,
+        window=DOWNSTREAM_LATENCY_WINDOW,
+        hedging=DOWNSTREAM_HEDGING and INFERENCE_TRANSPORT != "direct",  # There is no other replica to hedge to in-process
+        is_failure=is_endpoint_failure,
+    )
+
+
+image_quality_endpoint = create_endpoint("image_quality")
+diagnose_endpoint = create_endpoint("diagnose")
+
+
+async def call_endpoint(endpoint: HedgedEndpoint, send: Callable[..., Awaitable[Dict[str, Any]]], *args: Any) -> Dict[str, Any]:
+    """Calls an endpoint through its hedging and circuit breaker; every way the call can fail surfaces as DownstreamError."""
+    try:
+        return await endpoint.call(send, *args)
+    except (CircuitOpen, DeadlineExceeded, httpx.HTTPError) as e:
+        raise DownstreamError(f"{endpoint.name}: {e!r}") from e
+
+
+async def send_image_quality(image_data: bytes) -> Dict[str, Any]:
+    """Posts raw image bytes to the image quality API once and returns its JSON response."""
+    response = await post_image("/aeye/image-quality/", image_data, {"Content-Type": "application/octet-stream"})
+    if response.status_code != 200:
+        raise DownstreamError(f"Image quality API returned {response.status_code}", response.status_code)
+    return response.json()
+
+
+async def send_diagnose(form_data: Dict[str, Any], image_data: bytes) -> Dict[str, Any]:
+    """Posts raw image bytes and the form data to the diagnose API once and returns its JSON response."""
+    headers = {"Content-Type": "application/octet-stream", FORM_DATA_HEADER: json.dumps(form_data)}
+    response = await post_image("/aeye/diagnose/", image_data, headers)
+    if response.status_code != 200:
+        raise DownstreamError(f"Diagnose API returned {response.status_code}", response.status_code)
+    return response.json()
+
+
+async def run_image_quality(image_data: bytes) -> Dict[str, Any]:
+    """Runs the image quality check behind ImageQualityAPIView in this process, without an HTTP round trip."""
+    try:
+        return await check_image_quality_async(image_data)
+    except Exception as e:
+        raise DownstreamError(f"Image quality check failed: {e!r}", 500) from e
+
+
+async def run_diagnose(form_data: Dict[str, Any], image_data: bytes) -> Dict[str, Any]:
+    """Runs the diagnosis behind DiagnoseAPIView in this process, without an HTTP round trip."""
+    try:
+        return await diagnose_async(form_data, image_data)
+    except Exception as e:
+        raise DownstreamError(f"Diagnosis failed: {e!r}", 500) from e
+
+
+# How each INFERENCE_TRANSPORT reaches the inference logic: (image quality, diagnose)
+TRANSPORTS = {
+    "direct": (run_image_quality, run_diagnose),
+    "http": (send_image_quality, send_diagnose),
+    "uds": (send_image_quality, send_diagnose),  # Same requests, over the client's Unix-domain socket transport
+}
+image_quality_transport, diagnose_transport = TRANSPORTS[INFERENCE_TRANSPORT]
+
+
+async def post_image_quality(image_data: bytes) -> Dict[str, Any]:
+    """Checks image quality over the configured transport, circuit-broken (and hedged) within the current request's budget."""
+    return await call_endpoint(image_quality_endpoint, image_quality_transport, image_data)
+
+
+async def post_diagnose(form_data: Dict[str, Any], image_data: bytes) -> Dict[str, Any]:
+    """Diagnoses over the configured transport, circuit-broken (and hedged) within the current request's budget."""
+    return await call_endpoint(diagnose_endpoint, diagnose_transport, form_data, image_data)
@@ -1,2 +1,160 @@
+import os
+
 IMAGE_QUALITY_FAILED_RATE = 0.3
 PROBABILITY_DIABETES = 0.4
+
+# Metrics export
+GRAFANA_INFLUX_URL = "https://influx-prod-13-prod-us-east-0.grafana.net/api/v1/push/influx/write"
+METRICS_SINK = os.environ.get("AEYE_METRICS_SINK", "grafana")  # One of "grafana", "http", "file" or "null"
+METRICS_SINK_URL = "http://localhost:8086/api/v1/push/influx/write"  # Used by the "http" sink
+METRICS_FILE_PATH = "metrics.lp"  # Used by the "file" sink
+METRICS_QUEUE_SIZE = 10000  # Points buffered in memory before the overflow policy applies
+METRICS_BATCH_SIZE = 500  # Points per POST
+METRICS_FLUSH_INTERVAL = 1.0  # Seconds between flushes when the batch is not full
+METRICS_OVERFLOW_POLICY = "aggregate"  # "aggregate" sums overflowing points per series, "drop" discards them
+
+# Downstream inference API client
+# How the consumer reaches the inference logic: "direct" calls it in-process, "http" posts to DOWNSTREAM_BASE_URL,
+# "uds" posts the same requests over the Unix-domain socket at INFERENCE_UDS_PATH (e.g. `daphne -u <path>`)
+INFERENCE_TRANSPORT = os.environ.get("AEYE_INFERENCE_TRANSPORT", "direct")
+INFERENCE_UDS_PATH = os.environ.get("AEYE_INFERENCE_UDS_PATH", "/tmp/aeye-inference.sock")
+DOWNSTREAM_BASE_URL = os.environ.get("AEYE_DOWNSTREAM_BASE_URL", "http://localhost:8000")  # Change to appropriate host/port in production
+DOWNSTREAM_MAX_CONNECTIONS = 100  # Upper bound on open connections in the shared pool
+DOWNSTREAM_MAX_KEEPALIVE_CONNECTIONS = 20  # Idle connections kept open for reuse
+DOWNSTREAM_KEEPALIVE_EXPIRY = 30.0  # Seconds an idle connection is kept
+DOWNSTREAM_CONNECT_TIMEOUT = 5.0
+DOWNSTREAM_POOL_TIMEOUT = 5.0  # Seconds to wait for a free connection from the pool
+DOWNSTREAM_TIMEOUT = 30.0  # Read/write timeout for a single request, further capped by the remaining request budget
+DOWNSTREAM_HEDGING = True  # Send a second, identical request when the first is slower than usual; the first answer wins
+DOWNSTREAM_HEDGE_PERCENTILE = 95  # Recent-latency percentile after which the hedge is sent
+DOWNSTREAM_HEDGE_DEFAULT_DELAY = 1.0  # Hedge delay in seconds until enough latencies have been observed
+DOWNSTREAM_HEDGE_MIN_SAMPLES = 20  # Latencies needed before the percentile is trusted
+DOWNSTREAM_LATENCY_WINDOW = 1000  # Recent latencies kept per endpoint
+DOWNSTREAM_BREAKER_FAILURES = 5  # Consecutive failures (errors, 5xx or timeouts) that open an endpoint's circuit
+DOWNSTREAM_BREAKER_RESET_TIMEOUT = 10.0  # Seconds an open circuit fails fast before a trial request is let through
+REQUEST_BUDGET_SECONDS = 15.0  # Latency budget of one diagnosis request, shared by all of its stages
+
+# WebSocket uploads
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # Largest image accepted through the binary upload protocol
+IMAGE_MAX_PIXELS = 50_000_000  # Images with more pixels (read from the header) are rejected before they are decoded
+
+# Diagnosis pipeline
+PIPELINE_MODE = "sequential"  # "sequential" runs stages one after another, "concurrent" overlaps independent stages
+PIPELINE_SPECULATIVE_DIAGNOSIS = True  # In concurrent mode, start diagnosis before the quality check has passed
+# "local" runs the pipeline in the process holding the WebSocket; "worker" queues it on the channel layer for pipeline workers
+PIPELINE_EXECUTION = os.environ.get("AEYE_PIPELINE_EXECUTION", "local")
+PIPELINE_JOB_CHANNEL = "diagnosis-jobs"  # Channel-layer channel the jobs are queued on
+# Job slots of the worker started inside each server process in "worker" mode; 0 leaves the queue to separate workers
+PIPELINE_LOCAL_WORKERS = 8
+PIPELINE_WORKER_CONCURRENCY = 16  # Job slots of a `manage.py run_pipeline_worker` process
+PIPELINE_JOB_GRACE_SECONDS = 5.0  # Time past the request budget the consumer waits for a worker before giving up
+
+# Result cache for the downstream calls, keyed by image hash (plus the relevant form fields for diagnosis)
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MAX_ENTRIES = 10000
+RESULT_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Approximate memory cap across all entries of one cache
+RESULT_CACHE_TTL = 600.0  # Seconds before a cached result expires
+
+# Micro-batching of diagnose inference. Note that under ASGI Django runs sync (DRF) views on a single
+# shared thread, so HTTP requests only form batches with threaded WSGI workers or in-process async callers.
+DIAGNOSE_BATCHING_ENABLED = True
+DIAGNOSE_BATCH_MAX_SIZE = 32  # Largest batch handed to the model
+DIAGNOSE_BATCH_MAX_WAIT = 0.002  # Seconds to wait for more requests after the first; 0 batches only what is queued
+
+# Image quality engine. Metrics are computed on a QUALITY_ANALYSIS_SIZE x QUALITY_ANALYSIS_SIZE grayscale copy.
+QUALITY_ANALYSIS_SIZE = 256
+QUALITY_FOV_THRESHOLD = 0.06  # Brightness separating the fundus field of view from the black surround
+QUALITY_MIN_SHARPNESS = 2e-4  # Minimum Laplacian variance (blur detection)
+QUALITY_MIN_EXPOSURE = 0.1  # Mean brightness range inside the field of view
+QUALITY_MAX_EXPOSURE = 0.85
+QUALITY_MIN_CONTRAST = 0.03  # Minimum brightness standard deviation inside the field of view
+QUALITY_MIN_FOV_COVERAGE = 0.3  # Minimum fraction of the frame covered by the field of view
+IMAGE_QUALITY_MAX_BATCH = 64  # Most images accepted by /aeye/image-quality/batch/ in one call
+
+# Report persistence
+REPORT_ID_BLOCK_SIZE = 100  # Report ids reserved from the database at a time, so ids are known before the insert
+REPORT_WRITE_BEHIND = False  # Queue reports for a dedicated writer thread instead of inserting them on the request path
+REPORT_WRITE_BATCH_SIZE = 100  # Most reports inserted in one bulk_create transaction
+REPORT_WRITE_MAX_DELAY = 0.05  # Seconds the writer waits to fill a batch
+REPORT_WRITE_QUEUE_SIZE = 10000  # Reports queued before enqueueing blocks
+REPORT_DEAD_LETTER_PREFIX = "dead_letters"  # Directory (relative to MEDIA_ROOT) for reports the writer could not insert
+
+# Fundus image storage
+FUNDUS_STORAGE_PREFIX = "uploads"  # Directory (relative to MEDIA_ROOT) holding the sharded image tree
+FUNDUS_STORAGE_SHARD_DEPTH = 2  # Directory levels of two hex characters each, i.e. 65536 leaf directories
+FUNDUS_STORAGE_BUFFER_SIZE = 1024 * 1024  # Write buffer and chunk size in bytes
+FUNDUS_STORAGE_FSYNC = False  # fsync each image before it is renamed into place
+FUNDUS_STORAGE_IO_THREADS = 4  # Threads writing and reading images off the event loop
+
+# Telemetry
+STAGE_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Upper bounds (seconds) of the stage histogram
+KNOWN_CAMERA_TYPES = ("Topcon NW400", "Canon CX-1", "Optos Daytona Plus")  # Label values; other camera types become "other"
+
+# Admission control
+ADMISSION_MAX_ACTIVE_REQUESTS = 256  # Requests processed at once per server process; further requests get "Server busy"
+ADMISSION_INITIAL_LIMIT = 16  # Starting concurrency limit of each downstream stage (image quality, diagnose, report)
+ADMISSION_MIN_LIMIT = 1  # Bounds of the adaptive per-stage limits
+ADMISSION_MAX_LIMIT = 128
+ADMISSION_MAX_QUEUE = 64  # Calls waiting for a stage slot before further calls are rejected
+ADMISSION_QUEUE_TIMEOUT = 2.0  # Seconds a call waits for a stage slot before it is rejected
+ADMISSION_LATENCY_TOLERANCE = 2.0  # A call slower than this multiple of the baseline latency shrinks the limit
+ADMISSION_BACKOFF_RATIO = 0.9  # Multiplicative decrease applied to the limit on congestion
+
+# WebSocket sessions
+MAX_REQUESTS_PER_CONNECTION = 32  # Tagged requests processed concurrently on one connection
+PROGRESS_JSON_SUBPROTOCOL = "aeye.json"  # Subprotocol for JSON text progress messages, the default without one
+PROGRESS_MSGPACK_SUBPROTOCOL = "aeye.msgpack"  # Subprotocol for MessagePack progress messages in binary frames
+PROGRESS_COALESCING = True  # Send MessagePack messages queued within one event-loop pass in a single frame
+
+# CPU offload
+OFFLOAD_ENABLED = True  # Run base64 decoding, image quality scoring and preprocessing of large inputs in worker processes
+OFFLOAD_WORKERS = 0  # Worker processes; 0 means one per core, minus one for the event loop
+OFFLOAD_MIN_BYTES = 64 * 1024  # Smaller base64 inputs are decoded inline, where IPC would cost more than the work
+OFFLOAD_MIN_PIXELS = 768 * 768  # Images with fewer pixels are quality-scored inline (JPEGs are decoded at a reduced scale)
+PREPROCESS_OFFLOAD_MIN_PIXELS = 128 * 128  # Images with fewer pixels are preprocessed inline (full decode plus two encodes)
+OFFLOAD_START_METHOD = "spawn"  # multiprocessing start method; spawn avoids forking a process that runs threads
+
+# Models
+DIAGNOSE_MODEL_LOADER = "aeye.inference:RandomDiagnoseModel"  # "module:callable" that takes a version and returns the model
+DIAGNOSE_MODEL_VERSION = "random-1"  # Version loaded at startup; others can be swapped in at runtime
+MODEL_LOAD_ON_STARTUP = True  # Load and warm up models when the server starts instead of on the first request
+MODEL_WARMUP_BATCH_SIZE = 8  # Synthetic requests run through a freshly loaded model before it serves traffic
+
+# Report queries
+REPORT_PAGE_SIZE = 50  # Reports per page of /aeye/reports/ unless `limit` is given
+REPORT_PAGE_MAX_SIZE = 500  # Largest accepted `limit`
+
+# Quality monitor
+MONITOR_WINDOW_SECONDS = 300  # Length of the sliding window of the per-camera quality statistics
+MONITOR_BUCKET_SECONDS = 10  # Resolution of the window; events expire in steps of this size
+MONITOR_TICK_SECONDS = 1.0  # Interval between snapshots pushed to /ws/monitor/ subscribers
+MONITOR_GROUP = "quality_monitor"  # Prefix of the per-process channel-layer groups of the subscribers
+MONITOR_COUNTS_GROUP = "quality_monitor_counts"  # Channel-layer group through which processes exchange their window counts
+MONITOR_PEER_TIMEOUT_SECONDS = 5.0  # Counts of a process that stopped publishing for this long are left out of snapshots
+MONITOR_ALERT_LOW_QUALITY_RATE = 0.3  # Low-quality image rate per camera above which an alert fires
+MONITOR_ALERT_MIN_SAMPLES = 20  # Checked images needed within the window before an alert can fire
+
+# Image preprocessing
+PREPROCESS_ENABLED = True  # Decode each photo once into a downscaled inference copy and a recompressed archival copy
+INFERENCE_IMAGE_SIZE = 512  # Longest side in pixels of the JPEG sent to the inference APIs
+INFERENCE_IMAGE_QUALITY = 90
+ARCHIVE_IMAGE_SIZE = 2048  # Longest side in pixels of the stored copy
+ARCHIVE_IMAGE_FORMAT = "WEBP"  # "WEBP" or "JPEG"
+ARCHIVE_IMAGE_QUALITY = 80
+
+# Cold storage
+ARCHIVE_PREFIX = "archive"  # Directory (relative to MEDIA_ROOT) holding the packfiles and their index
+ARCHIVE_AFTER_DAYS = 365  # Default age in days after which `manage.py archive_reports` moves reports to cold storage
+ARCHIVE_CHUNK_SIZE = 500  # Rows fetched per database round trip, and deleted per statement, by the archive job
+ARCHIVE_PACK_MAX_BYTES = 256 * 1024 * 1024  # Image bytes per packfile before a new one is started
+
+# UX telemetry log
+UX_LOG_ENABLED = True  # Append each request's stepHistory and retakeCount to Arrow IPC files (needs pyarrow)
+UX_LOG_PREFIX = "uxlog"  # Directory (relative to MEDIA_ROOT) holding the log files
+UX_LOG_QUEUE_SIZE = 10000  # Rows buffered in memory before further rows are dropped
+UX_LOG_BATCH_SIZE = 1000  # Most rows written as one record batch
+UX_LOG_FLUSH_INTERVAL = 5.0  # Seconds the writer waits to fill a batch; an idle writer also checks for rotation this often
+UX_LOG_FILE_MAX_BYTES = 64 * 1024 * 1024  # A new file is started once the current one reaches this size
+UX_LOG_FILE_MAX_SECONDS = 3600  # ... or is this many seconds old
+UX_LOG_MAX_STEPS = 256  # Entries kept per stepHistory; the rest is dropped
+UX_LOG_COMPRESSION = "zstd"  # Record batch buffer compression: "zstd", "lz4" or None
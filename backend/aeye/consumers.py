@@ -1,67 +1,172 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json, asyncio, base64, random, httpx
-from typing import Tuple, Optional, Dict, Any
-from asgiref.sync import sync_to_async
-from django.core.files.base import ContentFile
+import json, asyncio, contextvars, random, time, uuid
+from channels.exceptions import ChannelFull
+from typing import Tuple, Optional, Dict, Any, List, Set, Union
 
+from .admission import Overloaded, diagnose_limiter, quality_limiter, report_limiter, request_gate
+from .cache import DIAGNOSE_KEY_FIELDS, content_key, diagnose_cache, quality_cache
+from .clients import DownstreamError, post_diagnose, post_image_quality
+from .codecs import CODECS, DEFAULT_CODEC, negotiate
+from .jobs import PipelineWorker, ensure_local_worker
 from .models import DiagnoseReport
+from .monitoring import quality_monitor, snapshot_broadcaster
+from .offload import offloader
+from .persistence import persist_report
+from .preprocess import PreparedImage, prepare_image
+from .pipeline import StageRunner, current_stage_buffer
+from .resilience import DeadlineExceeded, deadline
+from .telemetry import camera_label, request_labels, stage_span, timed_stage
 from .utils import send_metric_to_grafana
-from .config import IMAGE_QUALITY_FAILED_RATE, PROBABILITY_DIABETES
+from .uxlog import ux_log
+from .config import (
+    MAX_IMAGE_BYTES,
+    MAX_REQUESTS_PER_CONNECTION,
+    PIPELINE_EXECUTION,
+    PIPELINE_JOB_CHANNEL,
+    PIPELINE_JOB_GRACE_SECONDS,
+    PIPELINE_MODE,
+    PIPELINE_SPECULATIVE_DIAGNOSIS,
+    PROGRESS_COALESCING,
+    REQUEST_BUDGET_SECONDS,
+)
 
+# Client-chosen id of the request being handled, echoed in every message sent on its behalf
+_request_id: contextvars.ContextVar[Optional[Union[str, int]]] = contextvars.ContextVar("request_id", default=None)
+# Holds the last progress message delivered for the pipeline run in the current task, for the UX telemetry log
+_last_message: contextvars.ContextVar[Optional[List[Optional[str]]]] = contextvars.ContextVar("last_message", default=None)
 
-class ProcessConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        """Handles WebSocket connection establishment."""
-        await self.accept()  # Accepts the WebSocket connection request
-        await self.send_message("WebSocket connection established")
 
-    async def receive(self, text_data: str):
-        """Processes incoming WebSocket messages containing diagnosis requests."""
-        data = json.loads(text_data)  # Parse received JSON data
+class DiagnosisPipelineMixin:
+    """
+    The diagnosis pipeline stages, shared by the WebSocket consumer and the pipeline workers.
 
+    Hosts implement `deliver_message`, which gets every progress message of the request in order.
+    """
+
+    async def run_pipeline(self, data: Dict[str, Any], captured_photo: Union[str, bytes], budget: float = REQUEST_BUDGET_SECONDS):
+        """Runs the diagnosis pipeline for one request whose image is a base64 string or raw bytes."""
         # Extract relevant data from the received message
         form_data = data.get("formData", {})  # Basic information about the user
-        captured_photo = data.get("capturedPhoto", "")  # Base64-encoded image data
         step_history = data.get("stepHistory", [])  # History of users navigating different steps
         retake_count = data.get("retakeCount", 0)  # Number of times the user has retaken the photo
+        request_labels.set({"camera_type": camera_label(form_data.get("cameraType"))})  # Labels the stage latency histograms
 
+        pipeline = self.process_request_concurrently if PIPELINE_MODE == "concurrent" else self.process_request_sequentially
+        received_at, last_message = time.time(), [None]
+        token = _last_message.set(last_message)
+        try:
+            with deadline(budget):  # Downstream calls and stage queues of this request share one budget
+                await request_gate.run(pipeline, form_data, captured_photo)
+        except Overloaded as e:
+            # Admission control turned the request away, either up front or at a saturated downstream stage
+            await self.send_message("Server busy", {"retryAfter": e.retry_after})
+        except asyncio.CancelledError:
+            last_message[0] = "Cancelled"
+            raise
+        finally:
+            _last_message.reset(token)
+            # Only queued here; the columnar log is written off the request path
+            ux_log.record(received_at, form_data.get("cameraType"), last_message[0], time.time() - received_at, retake_count, step_history)
+
+    async def process_request_sequentially(self, form_data: Dict[str, Any], captured_photo: Union[str, bytes]):
+        """Runs the diagnosis pipeline one stage after the other."""
         # Step 1: Validate the received form data
         if not await self.verify_form_data(form_data):
             return
         await self.send_message("Basic information verified")
 
         # Step 2: Validate and decode the image
-        image_data = await self.verify_and_decode_image(captured_photo)
-        if image_data is None:
-            # TODO: Send a metric to Grafana for failed image verification (implementation shown below)
-            send_metric_to_grafana(
-                metric_name="image_verification_failed",
-                metric_value=1,
-                labels={"camera_type": form_data.get("cameraType")},
-            )
-
+        image, quality_scores = await self.verify_and_decode_image(captured_photo)
+        self.report_image_verification(form_data, image is not None, quality_scores)
+        if image is None:
             return  # If image does not pass the test, stop further processing
 
-        # TODO: Send a metric to Grafana for successful image verification with metric name "image_verification_pass"
-        ...
-
         await self.send_message("Image data verified")
 
         # Step 3: Diagnose the disease
-        diagnose_result, confidence = await self.call_diagnose_api(form_data, image_data)
+        diagnose_result, confidence = await self.call_diagnose_api(form_data, image.inference)
+        quality_monitor.record_diagnosis(form_data.get("cameraType"), diagnose_result)
         await self.send_message("Diagnosis complete")
 
         # Step 4: Generate and store the diagnosis report
-        report = await self.generate_and_save_report(form_data, image_data, diagnose_result, confidence)
+        report = await self.generate_and_save_report(form_data, image, diagnose_result, confidence)
+        await self.send_message("Report generated", {"diagnose": diagnose_result, "confidence": confidence, "id": report.id})
+
+    async def process_request_concurrently(self, form_data: Dict[str, Any], captured_photo: Union[str, bytes]):
+        """
+        Runs the diagnosis pipeline with independent stages overlapped.
+
+        Form validation runs alongside image decoding and the quality check, and (with
+        PIPELINE_SPECULATIVE_DIAGNOSIS) diagnosis starts as soon as the image is decoded. Progress
+        messages are released in the same order as the sequential pipeline, and a failed check
+        cancels all downstream work that is still in flight.
+        """
+        runner = StageRunner(self.send_message)
+        rejected = lambda passed: not passed
+        quality_rejected = lambda result: not result[0]
+
+        try:
+            form_stage = runner.start(self.verify_form_data(form_data), abort_when=rejected)
+            verify_start = time.perf_counter()
+            decode_stage = runner.start(self.decode_and_prepare_image(captured_photo), abort_when=lambda image: image is None)
+
+            image = await runner.wait(decode_stage)
+            quality_stage = diagnose_stage = None
+            if image is not None:
+                quality_stage = runner.start(self.call_image_quality_api(image.inference), abort_when=quality_rejected)
+                if PIPELINE_SPECULATIVE_DIAGNOSIS:
+                    diagnose_stage = runner.start(self.call_diagnose_api(form_data, image.inference))
+
+            # Step 1: Validate the received form data
+            if not await runner.finish(form_stage):
+                return
+            await self.send_message("Basic information verified")
+
+            # Step 2: Validate and decode the image, timed like verify_and_decode_image in sequential mode:
+            # from the start of decoding until the decode or quality stage finished, not until it was released
+            with stage_span("verify_and_decode_image", start=verify_start) as span:
+                image, quality_scores = await runner.finish(decode_stage), None
+                span.end = decode_stage.finished_at
+                if image is not None:
+                    quality_passed, quality_scores = await runner.finish(quality_stage)
+                    span.end = quality_stage.finished_at
+                    if not quality_passed:
+                        await self.send_message("Invalid image data", "Image quality is too low")
+                        image = None
+                span.outcome = "ok" if image is not None else "rejected"
+            self.report_image_verification(form_data, image is not None, quality_scores)
+            if image is None:
+                return
+
+            await self.send_message("Image data verified")
+
+            # Step 3: Diagnose the disease (possibly already finished speculatively)
+            diagnose_stage = diagnose_stage or runner.start(self.call_diagnose_api(form_data, image.inference))
+            diagnose_result, confidence = await runner.finish(diagnose_stage)
+            quality_monitor.record_diagnosis(form_data.get("cameraType"), diagnose_result)
+            await self.send_message("Diagnosis complete")
+        finally:
+            runner.abort()  # Cancel whatever is still running after a failed check or a disconnect
+
+        # Step 4: Generate and store the diagnosis report
+        report = await self.generate_and_save_report(form_data, image, diagnose_result, confidence)
         await self.send_message("Report generated", {"diagnose": diagnose_result, "confidence": confidence, "id": report.id})
 
     async def send_message(self, message: str, data: Optional[Any] = None):
-        """Helper function to send messages to the WebSocket client."""
-        response = {"message": message}
-        if data is not None:
-            response["data"] = data  # Include additional data if provided
-        await self.send(json.dumps(response))  # Send message as a JSON string
+        """Sends a progress message to the client, or holds it while a concurrent stage is still unfinished."""
+        buffer = current_stage_buffer()
+        if buffer is not None:
+            buffer.append((message, data))  # Held until the concurrent stage is finished in pipeline order
+            return
+        last_message = _last_message.get()
+        if last_message is not None:
+            last_message[0] = message
+        await self.deliver_message(message, data)
+
+    async def deliver_message(self, message: str, data: Optional[Any] = None):
+        raise NotImplementedError
 
+    @timed_stage("verify_form_data", rejected=lambda passed: not passed)
     async def verify_form_data(self, form_data: Dict[str, Any]) -> bool:
         """Validates the user-provided form data to ensure required fields are present."""
         await asyncio.sleep(random.uniform(0, 1))  # Simulate processing delay
@@ -77,82 +182,377 @@ class ProcessConsumer(AsyncWebsocketConsumer):
 
         return True  # Return True if validation passes
 
-    async def verify_and_decode_image(self, image_data: str) -> Optional[bytes]:
-        """Validates and decodes the base64-encoded image data."""
+    @timed_stage("verify_and_decode_image", rejected=lambda result: result[0] is None)
+    async def verify_and_decode_image(self, image_data: Union[str, bytes]) -> Tuple[Optional[PreparedImage], Optional[Dict[str, float]]]:
+        """
+        Validates and decodes the base64-encoded image data; raw bytes from the binary protocol are used as-is.
+
+        Returns the prepared image (None if it is invalid) and the quality scores, if the image could be scored.
+        """
+        image = await self.decode_and_prepare_image(image_data)
+        if image is None:
+            return None, None
+
+        # Reject images that fail the quality check
+        quality_passed, quality_scores = await self.call_image_quality_api(image.inference)
+        if not quality_passed:
+            await self.send_message("Invalid image data", "Image quality is too low")
+            return None, quality_scores
+
+        return image, quality_scores  # Return the prepared image if valid
+
+    async def decode_and_prepare_image(self, image_data: Union[str, bytes]) -> Optional[PreparedImage]:
+        """Decodes the image data and derives its inference and archival copies."""
+        decoded_image = await self.decode_image(image_data)
+        if decoded_image is None:
+            return None
+        return await self.prepare_image(decoded_image)
+
+    @timed_stage("prepare_image")
+    async def prepare_image(self, image_data: bytes) -> PreparedImage:
+        """Downscales the image for the inference APIs and recompresses it for storage, from a single decode."""
+        return await prepare_image(image_data)
+
+    @timed_stage("decode_image", rejected=lambda image: image is None)
+    async def decode_image(self, image_data: Union[str, bytes]) -> Optional[bytes]:
+        """Decodes the base64-encoded image data; raw bytes from the binary protocol are returned as-is."""
         await asyncio.sleep(random.uniform(0, 1))  # Simulate processing delay
 
+        if not isinstance(image_data, str):
+            return image_data
+
         try:
-            decoded_image = base64.b64decode(image_data.split("base64,")[-1])  # Decode the base64 image string
+            # Decode the base64 image string, in a worker process for large images
+            return await offloader.decode_base64_async(image_data.split("base64,")[-1])
         except Exception as e:
             await self.send_message("Invalid image data", f"Error decoding image: {e}")  # Send an error message if decoding fails
             return None
 
-        # Simulate random failure due to image quality issues
-        if not await self.call_image_quality_api(decoded_image):
-            await self.send_message("Invalid image data", "Image quality is too low")
-            return None
+    @timed_stage("call_image_quality_api", rejected=lambda result: not result[0])
+    async def call_image_quality_api(self, image_data: bytes) -> Tuple[bool, Optional[Dict[str, float]]]:
+        """
+        Calls an external API to check the quality of the captured image; identical images share one call.
 
-        return decoded_image  # Return decoded image data if valid
-
-    async def call_image_quality_api(self, image_data: bytes) -> bool:
-        """Calls an external API to check the quality of the captured image."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://localhost:8000/aeye/image-quality/",  # Change to appropriate host/port in production
-                data={"imageData": base64.b64encode(image_data).decode("utf-8")},
-                timeout=30.0,
+        Returns the pass/fail decision and the quality scores (sharpness, exposure, contrast, FOV coverage).
+        """
+        try:
+            response = await quality_cache.get_or_compute(
+                content_key(image_data), lambda: quality_limiter.run(post_image_quality, image_data)
             )
-
-        if response.status_code == 200:
-            return response.json().get("image_quality_passed", False)
-        else:
+        except (DownstreamError, DeadlineExceeded):
             await self.send_message("Image quality check failed", "Error from image quality API")
-            return False
+            return False, None
 
-    async def call_diagnose_api(self, form_data, image_data) -> Tuple[bool, float]:
-        """Calls the external diagnose API and retrieves the result."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://localhost:8000/aeye/diagnose/",  # Change to appropriate host/port in production
-                json={"formData": form_data, "imageData": base64.b64encode(image_data).decode("utf-8")},
-                timeout=30.0,
-            )
+        return response.get("image_quality_passed", False), response.get("scores")
 
-        if response.status_code == 200:
-            json_response = response.json()
-            return json_response["diagnose_result"], json_response["confidence"]
-        else:
+    def report_image_verification(self, form_data: Dict[str, Any], passed: bool, quality_scores: Optional[Dict[str, float]]):
+        """Sends the image verification outcome to Grafana, with the quality scores as extra fields, and to the local monitor."""
+        quality_monitor.record_quality(form_data.get("cameraType"), passed)
+        snapshot_broadcaster.start_exchange()  # Publish this process's counts to the monitors of the others
+        send_metric_to_grafana(
+            metric_name="image_verification_pass" if passed else "image_verification_failed",
+            metric_value=1,
+            labels={"camera_type": form_data.get("cameraType")},
+            fields=quality_scores,
+        )
+
+    @timed_stage("call_diagnose_api")
+    async def call_diagnose_api(self, form_data, image_data) -> Tuple[bool, float]:
+        """Calls the external diagnose API and retrieves the result; identical requests share one call."""
+        key = content_key(image_data, form_data, DIAGNOSE_KEY_FIELDS)
+        try:
+            response = await diagnose_cache.get_or_compute(key, lambda: diagnose_limiter.run(post_diagnose, form_data, image_data))
+        except (DownstreamError, DeadlineExceeded):
             await self.send_message("Diagnosis failed", "Error from diagnose API")
             return False, 0.0  # Default in case of failure
 
+        return response["diagnose_result"], response["confidence"]
+
+    @timed_stage("generate_and_save_report")
     async def generate_and_save_report(
         self,
         form_data: Dict[str, Any],
-        image_data: bytes,
+        image: PreparedImage,
         diagnose_result: bool,
         confidence: float,
     ) -> DiagnoseReport:
-        """Generates a diagnosis report and saves it to the database."""
-
-        # Create a new report entry asynchronously
-        report = await sync_to_async(DiagnoseReport.objects.create)(
-            diagnose_result=diagnose_result,
-            confidence=confidence,
-            camera_type=(form_data["customCameraType"] if form_data["cameraType"] == "Other" else form_data["cameraType"]),
-            age=int(form_data["age"]),
-            gender=form_data["gender"],
-            diabetes_history=form_data["diabetesHistory"],
-            family_diabetes_history=form_data["familyDiabetesHistory"],
-            weight=float(form_data["weight"]),
-            height=float(form_data["height"]),
-        )
+        """Generates a diagnosis report and saves it (archival image copy and row) with a single database write."""
+        return await report_limiter.run(persist_report, form_data, image.archive, diagnose_result, confidence, image.archive_extension)
+
+
+class ProcessConsumer(DiagnosisPipelineMixin, AsyncWebsocketConsumer):
+    async def connect(self):
+        """
+        Handles WebSocket connection establishment.
+
+        The encoding of the messages sent to the client is negotiated through the WebSocket subprotocol:
+        "aeye.msgpack" sends MessagePack maps in binary frames, "aeye.json" or no subprotocol sends JSON
+        text frames. Requests are sent as JSON either way.
+        """
+        self.subprotocol = negotiate(self.scope.get("subprotocols", []))
+        self.codec = CODECS[self.subprotocol] if self.subprotocol is not None else DEFAULT_CODEC
+        self.outbox: List[bytes] = []  # Binary frames waiting to be sent together
+        self.flushing = False
+        self.pending_upload: Optional[Dict[str, Any]] = None  # Binary upload in progress, if any
+        self.active_requests: Dict[Union[str, int], asyncio.Task] = {}  # Tagged requests still being processed
+        self.untagged_requests: Set[asyncio.Task] = set()  # Untagged requests queued for pipeline workers, in order
+        self.last_untagged_request: Optional[asyncio.Task] = None
+        self.jobs: Dict[str, Dict[str, Any]] = {}  # Requests handed to pipeline workers, by job id
+        await self.accept(subprotocol=self.subprotocol)  # Accepts the WebSocket connection request
+        await self.send_message("WebSocket connection established")
 
-        # Save the captured fundus image with a unique filename
-        image_file_name = f"fundus_image_{report.id}.jpg"
-        image_file = await sync_to_async(ContentFile)(image_data, name=image_file_name)
-        await sync_to_async(report.fundus_image.save)(image_file_name, image_file)
+    async def receive(self, text_data: Optional[str] = None, bytes_data: Optional[bytes] = None):
+        """
+        Processes incoming WebSocket messages containing diagnosis requests.
+
+        Two protocols are supported:
+        - Text: one JSON frame carrying the form and the image as a base64 data-URL in `capturedPhoto`.
+        - Binary: a JSON frame carrying the form and `imageSize` (in bytes), followed by the raw image
+          in one or more binary frames. Processing starts once `imageSize` bytes have arrived.
+
+        A request may carry a client-chosen `requestId` (string or integer). Tagged requests are processed
+        concurrently with any others on the same connection, and every message sent for them carries the
+        same `requestId`. Untagged requests are processed one at a time, as before. Binary uploads are
+        still received one after the other: the binary frames belong to the most recent metadata frame.
+        """
+        if bytes_data is not None:
+            request_id = self.pending_upload["request"].get("requestId") if self.pending_upload else None
+        else:
+            data = json.loads(text_data)  # Parse received JSON data
+            request_id = data.get("requestId")
+
+        token = _request_id.set(request_id)  # Tasks started below inherit the id, later frames do not
+        try:
+            if bytes_data is not None:
+                await self.receive_image_chunk(bytes_data)
+            elif "imageSize" in data:
+                await self.start_binary_upload(data)
+            else:
+                await self.submit_request(data, data.get("capturedPhoto", ""))  # Base64-encoded image data
+        finally:
+            _request_id.reset(token)
+
+    async def disconnect(self, close_code: int):
+        """Cancels the requests of this connection that are still being processed."""
+        for task in [*self.active_requests.values(), *self.untagged_requests]:
+            task.cancel()
+
+    async def submit_request(self, data: Dict[str, Any], captured_photo: Union[str, bytes]):
+        """Processes an untagged request right away, or starts a tagged one as its own task."""
+        request_id = data.get("requestId")
+        if request_id is None and PIPELINE_EXECUTION == "worker":
+            # Worker progress arrives as channel messages, which are only handled while receive() is not blocked
+            task = asyncio.ensure_future(self.process_request_after(self.last_untagged_request, data, captured_photo))
+            self.last_untagged_request = task
+            self.untagged_requests.add(task)
+            task.add_done_callback(self.untagged_requests.discard)
+            return
+        if request_id is None:
+            await self.process_request(data, captured_photo)
+            return
+
+        if isinstance(request_id, bool) or not isinstance(request_id, (str, int)):
+            await self.send_message("Invalid request", "requestId must be a string or an integer")
+            return
+        if request_id in self.active_requests:
+            await self.send_message("Invalid request", f"Request {request_id} is already being processed")
+            return
+        if len(self.active_requests) >= MAX_REQUESTS_PER_CONNECTION:
+            await self.send_message("Server busy", {"retryAfter": 1})
+            return
+
+        task = asyncio.ensure_future(self.process_request(data, captured_photo))
+        self.active_requests[request_id] = task
+        task.add_done_callback(lambda task: self.request_done(request_id, task))
+
+    def request_done(self, request_id: Union[str, int], task: asyncio.Task):
+        """Forgets a finished tagged request and logs its failure, if any."""
+        self.active_requests.pop(request_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Request {request_id} failed: {task.exception()!r}")
+
+    async def start_binary_upload(self, data: Dict[str, Any]):
+        """Prepares a buffer for an image announced by a binary-protocol metadata frame."""
+        image_size = data.get("imageSize")
+        if not isinstance(image_size, int) or image_size <= 0:
+            self.pending_upload = None
+            await self.send_message("Invalid image data", "imageSize must be a positive integer")
+            return
+        if image_size > MAX_IMAGE_BYTES:
+            # Reject before any image bytes are buffered
+            self.pending_upload = None
+            await self.send_message("Invalid image data", f"Image exceeds the maximum size of {MAX_IMAGE_BYTES} bytes")
+            return
+
+        # Any unfinished upload is discarded in favour of the new request
+        self.pending_upload = {"request": data, "chunks": [], "expected": image_size, "received": 0}
+
+    async def receive_image_chunk(self, chunk: bytes):
+        """Appends a binary frame to the pending upload and starts processing once it is complete."""
+        upload = self.pending_upload
+        if upload is None:
+            await self.send_message("Invalid image data", "Received image bytes without a preceding metadata frame")
+            return
+
+        upload["received"] += len(chunk)
+        if upload["received"] > upload["expected"]:
+            # Enforce the announced size (and thereby MAX_IMAGE_BYTES) while the data is still arriving
+            self.pending_upload = None
+            await self.send_message("Invalid image data", f"Image exceeds the announced size of {upload['expected']} bytes")
+            return
+
+        upload["chunks"].append(chunk)
+        if upload["received"] < upload["expected"]:
+            return  # Wait for more chunks
+
+        self.pending_upload = None
+        chunks = upload["chunks"]
+        image_data = chunks[0] if len(chunks) == 1 else b"".join(chunks)  # Single-frame uploads are used without copying
+        await self.submit_request(upload["request"], image_data)
+
+    async def process_request_after(self, previous: Optional[asyncio.Task], data: Dict[str, Any], captured_photo: Union[str, bytes]):
+        """Processes an untagged request once the one before it is done, so untagged requests stay sequential."""
+        if previous is not None:
+            await asyncio.wait([previous])
+        await self.process_request(data, captured_photo)
+
+    async def process_request(self, data: Dict[str, Any], captured_photo: Union[str, bytes]):
+        """Runs the diagnosis pipeline for one request, in this process or on a pipeline worker."""
+        if PIPELINE_EXECUTION == "worker":
+            await self.process_request_on_worker(data, captured_photo)
+        else:
+            await self.run_pipeline(data, captured_photo)
+
+    async def process_request_on_worker(self, data: Dict[str, Any], captured_photo: Union[str, bytes]):
+        """
+        Queues the request on the job channel and relays the progress the worker streams back until it is done.
+
+        The worker's messages arrive on this consumer's channel and are forwarded by the `job_*` handlers.
+        A worker that does not finish within the request budget (plus a grace period) is given up on, and
+        the job is cancelled on the worker when the request times out or the client disconnects.
+        """
+        ensure_local_worker(run_pipeline_job)
+        job_id = uuid.uuid4().hex
+        job = self.jobs[job_id] = {"request_id": _request_id.get(), "done": asyncio.get_running_loop().create_future(), "worker": None}
+        try:
+            request = {key: value for key, value in data.items() if key != "capturedPhoto"}
+            message = {"type": "diagnosis.job", "job_id": job_id, "reply_channel": self.channel_name, "request": request}
+            message.update(captured_photo=captured_photo, deadline=time.time() + REQUEST_BUDGET_SECONDS)
+            try:
+                await self.channel_layer.send(PIPELINE_JOB_CHANNEL, message)
+            except ChannelFull:
+                await self.send_message("Server busy", {"retryAfter": 1})
+                return
+
+            try:
+                done = await asyncio.wait_for(asyncio.shield(job["done"]), REQUEST_BUDGET_SECONDS + PIPELINE_JOB_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                await self.cancel_job(job_id)
+                await self.send_message("Diagnosis failed", "No pipeline worker finished the request in time")
+                return
+            if done.get("expired"):
+                await self.send_message("Diagnosis failed", "The request timed out before a pipeline worker could start it")
+        except asyncio.CancelledError:
+            await self.cancel_job(job_id)
+            raise
+        finally:
+            del self.jobs[job_id]
+
+    async def cancel_job(self, job_id: str):
+        worker = self.jobs[job_id]["worker"]
+        if worker is not None:
+            await self.channel_layer.send(worker, {"type": "job.cancel", "job_id": job_id})
+
+    async def job_started(self, event: Dict[str, Any]):
+        job = self.jobs.get(event["job_id"])
+        if job is not None:
+            job["worker"] = event["worker_channel"]
+
+    async def job_progress(self, event: Dict[str, Any]):
+        job = self.jobs.get(event["job_id"])
+        if job is not None:  # Messages of a job that was given up on are dropped
+            await self.send_response(event["message"], event.get("data"), job["request_id"])
+
+    async def job_done(self, event: Dict[str, Any]):
+        job = self.jobs.get(event["job_id"])
+        if job is not None and not job["done"].done():
+            job["done"].set_result(event)
+
+    async def deliver_message(self, message: str, data: Optional[Any] = None):
+        await self.send_response(message, data, _request_id.get())
+
+    async def send_response(self, message: str, data: Optional[Any], request_id: Optional[Union[str, int]]):
+        """Helper function to send messages to the WebSocket client, in the negotiated encoding."""
+        frame = self.codec.encode(message, data, request_id)
+        if not self.codec.binary:
+            await self.send(text_data=frame)
+        elif PROGRESS_COALESCING:
+            self.outbox.append(frame)
+            if not self.flushing:
+                self.flushing = True
+                await self.flush_outbox()
+        else:
+            await self.send(bytes_data=frame)
+
+    async def flush_outbox(self):
+        """Sends the queued binary frames as one frame, including those queued by other requests in the meantime."""
+        try:
+            await asyncio.sleep(0)  # Let the other tasks that are ready run first and add their messages
+            while self.outbox:
+                frames, self.outbox = self.outbox, []
+                await self.send(bytes_data=frames[0] if len(frames) == 1 else b"".join(frames))
+        finally:
+            self.flushing = False
+            if self.outbox:  # The sending task was cancelled; don't strand the other requests' messages
+                self.flushing = True
+                asyncio.ensure_future(self.flush_outbox())
+
+
+class PipelineJob(DiagnosisPipelineMixin):
+    """Runs one queued diagnosis job on a pipeline worker and streams its progress to the consumer that queued it."""
+
+    def __init__(self, worker: PipelineWorker, job: Dict[str, Any]):
+        self.channel_layer = worker.channel_layer
+        self.job_id = job["job_id"]
+        self.reply_channel = job["reply_channel"]
+
+    async def deliver_message(self, message: str, data: Optional[Any] = None):
+        await self.channel_layer.send(self.reply_channel, {"type": "job.progress", "job_id": self.job_id, "message": message, "data": data})
+
+
+async def run_pipeline_job(job: Dict[str, Any], worker: PipelineWorker):
+    """Job handler of the pipeline workers."""
+    layer, reply_channel = worker.channel_layer, job["reply_channel"]
+    done = {"type": "job.done", "job_id": job["job_id"], "error": None}
+    if job["deadline"] <= time.time():
+        # Sat in the queue past its budget; end the request now rather than when the consumer's wait runs out
+        await layer.send(reply_channel, {**done, "error": "DeadlineExceeded('expired in the job queue')", "expired": True})
+        return
+    await layer.send(reply_channel, {"type": "job.started", "job_id": job["job_id"], "worker_channel": worker.control_channel})
+    try:
+        # The budget was fixed when the request arrived, so time spent in the queue counts against it
+        await PipelineJob(worker, job).run_pipeline(job["request"], job["captured_photo"], budget=job["deadline"] - time.time())
+    except Exception as e:
+        await layer.send(reply_channel, {**done, "error": repr(e)})
+        raise
+    await layer.send(reply_channel, done)  # Not sent for a cancelled job, whose consumer has stopped waiting
+
+
+class MonitorConsumer(AsyncWebsocketConsumer):
+    """Streams sliding-window quality statistics and alerts to dashboards, one snapshot per tick."""
+
+    async def connect(self):
+        self.subscribed = False
+        await self.channel_layer.group_add(snapshot_broadcaster.group, self.channel_name)
+        await self.accept()
+        await self.send(json.dumps(quality_monitor.snapshot()))  # Don't make new subscribers wait for the next tick
+        snapshot_broadcaster.subscribe()
+        self.subscribed = True
 
-        # Ensure the report object is saved after updating the image field
-        await sync_to_async(report.save)()
+    async def disconnect(self, close_code: int):
+        if getattr(self, "subscribed", False):
+            snapshot_broadcaster.unsubscribe()
+        await self.channel_layer.group_discard(snapshot_broadcaster.group, self.channel_name)
 
-        return report  # Return the created report object
+    async def monitor_snapshot(self, event: Dict[str, Any]):
+        await self.send(event["payload"])  # Serialized once by the broadcaster for all subscribers
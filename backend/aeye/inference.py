@@ -0,0 +1,87 @@
+import numpy as np
+from asgiref.sync import sync_to_async
+from typing import Any, Dict, List, Tuple
+
+from .batching import MicroBatcher
+from .offload import offloader
+from .registry import model_registry
+from .config import (
+    DIAGNOSE_BATCH_MAX_SIZE,
+    DIAGNOSE_BATCH_MAX_WAIT,
+    DIAGNOSE_BATCHING_ENABLED,
+    DIAGNOSE_MODEL_LOADER,
+    DIAGNOSE_MODEL_VERSION,
+    MODEL_WARMUP_BATCH_SIZE,
+    PROBABILITY_DIABETES,
+)
+from .telemetry import register_stats
+
+
+class RandomDiagnoseModel:
+    """Stand-in diagnosis model: diagnoses diabetes with probability PROBABILITY_DIABETES."""
+
+    def __init__(self, version: str):
+        self.version = version
+
+    def predict_batch(self, requests: List[Tuple[Dict[str, Any], bytes]]) -> List[Dict[str, Any]]:
+        rng = np.random.default_rng()
+        count = len(requests)
+
+        # Simulate AI diagnostic process
+        diagnose_results = rng.random(count) < PROBABILITY_DIABETES
+        confidences = np.round(rng.uniform(0.5, 1.0, count), 2)
+
+        return [
+            {"diagnose_result": bool(diagnose_result), "confidence": float(confidence)}
+            for diagnose_result, confidence in zip(diagnose_results, confidences)
+        ]
+
+
+def warm_up_diagnose_model(model):
+    """Runs one batch of synthetic requests through a freshly loaded diagnosis model."""
+    form_data = {"cameraType": "Other", "age": 50, "gender": "Female", "diabetesHistory": "No", "weight": 70, "height": 170}
+    model.predict_batch([(form_data, b"")] * MODEL_WARMUP_BATCH_SIZE)
+
+
+model_registry.register("diagnose", DIAGNOSE_MODEL_LOADER, DIAGNOSE_MODEL_VERSION, warmup=warm_up_diagnose_model)
+
+
+def diagnose_batch(requests: List[Tuple[Dict[str, Any], bytes]]) -> List[Dict[str, Any]]:
+    """Runs the diagnosis model on a batch of (form data, image) pairs in one vectorized pass."""
+    loaded = model_registry.get("diagnose")  # The whole batch uses one version, even if a new one is swapped in meanwhile
+    return [{**result, "model_version": loaded.version} for result in loaded.model.predict_batch(requests)]
+
+
+# Collects concurrent diagnose calls into batches for diagnose_batch
+diagnose_batcher = MicroBatcher(diagnose_batch, DIAGNOSE_BATCH_MAX_SIZE, DIAGNOSE_BATCH_MAX_WAIT, name="diagnose-batcher")
+register_stats("batcher", diagnose_batcher.stats, batcher="diagnose")
+
+
+def diagnose(form_data: Dict[str, Any], image_data: bytes) -> Dict[str, Any]:
+    """Runs the diagnosis model on one image and returns the result and its confidence."""
+    if DIAGNOSE_BATCHING_ENABLED:
+        return diagnose_batcher.submit((form_data, image_data))
+    return diagnose_batch([(form_data, image_data)])[0]
+
+
+async def diagnose_async(form_data: Dict[str, Any], image_data: bytes) -> Dict[str, Any]:
+    """Like `diagnose`, for callers on the event loop: waits for the batcher without holding a thread."""
+    if DIAGNOSE_BATCHING_ENABLED:
+        return await diagnose_batcher.submit_async((form_data, image_data))
+    # Without the batcher the model still must not run on the event loop
+    return (await sync_to_async(diagnose_batch, thread_sensitive=False)([(form_data, image_data)]))[0]
+
+
+def check_image_quality(image_data: bytes) -> Dict[str, Any]:
+    """Checks whether an image is good enough to be diagnosed and returns the decision with its quality scores."""
+    return offloader.assess_images([image_data])[0]
+
+
+async def check_image_quality_async(image_data: bytes) -> Dict[str, Any]:
+    """Like `check_image_quality`, for callers on the event loop; large images are scored in a worker process."""
+    return (await offloader.assess_images_async([image_data]))[0]
+
+
+def check_image_quality_batch(images_data: List[bytes]) -> List[Dict[str, Any]]:
+    """Checks a batch of images in one vectorized pass (in a single worker process for large batches)."""
+    return offloader.assess_images(images_data)
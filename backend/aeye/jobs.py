@@ -0,0 +1,92 @@
+import asyncio
+from channels.layers import BaseChannelLayer, get_channel_layer
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import PIPELINE_JOB_CHANNEL, PIPELINE_LOCAL_WORKERS
+from .telemetry import register_stats
+
+JobHandler = Callable[[Dict[str, Any], "PipelineWorker"], Awaitable[None]]
+
+
+class PipelineWorker:
+    """
+    Pulls diagnosis jobs from a channel-layer channel and runs up to `concurrency` of them at a time.
+
+    The next job is only received once a slot is free, so a busy worker leaves queued jobs to idle workers
+    in other processes or on other nodes, and capacity scales with the number of worker processes. One
+    loop receives for all slots, as channel layers do not support concurrent receives on one channel
+    within a process. A job is cancelled when a `job.cancel` message for it arrives on the worker's own
+    `control_channel`, which the handler announces to whoever queued the job.
+    """
+
+    def __init__(self, handle_job: JobHandler, channel: str, concurrency: int, channel_layer: Optional[BaseChannelLayer] = None):
+        self.handle_job = handle_job
+        self.channel = channel
+        self.concurrency = concurrency
+        self.channel_layer = channel_layer
+        self.control_channel: Optional[str] = None
+        self.running: Dict[str, asyncio.Task] = {}
+        self.counters = {"started": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    async def run(self):
+        """Serves jobs until cancelled."""
+        self.channel_layer = self.channel_layer or get_channel_layer()
+        self.control_channel = await self.channel_layer.new_channel()
+        loops = [asyncio.ensure_future(self._control()), asyncio.ensure_future(self._receive())]
+        try:
+            await asyncio.gather(*loops)
+        finally:
+            for loop in loops:
+                loop.cancel()
+            for task in list(self.running.values()):
+                task.cancel()
+
+    async def _receive(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            job = await self.channel_layer.receive(self.channel)
+            task = asyncio.ensure_future(self.handle_job(job, self))
+            self.running[job["job_id"]] = task
+            self.counters["started"] += 1
+            task.add_done_callback(lambda task, job_id=job["job_id"]: self._job_done(job_id, task, slots))
+
+    def _job_done(self, job_id: str, task: asyncio.Task, slots: asyncio.Semaphore):
+        del self.running[job_id]
+        slots.release()
+        if task.cancelled():
+            self.counters["cancelled"] += 1
+        elif task.exception() is not None:
+            self.counters["failed"] += 1
+            print(f"Pipeline job {job_id} failed: {task.exception()!r}")
+        else:
+            self.counters["completed"] += 1
+
+    async def _control(self):
+        while True:
+            message = await self.channel_layer.receive(self.control_channel)
+            if message.get("type") == "job.cancel" and message.get("job_id") in self.running:
+                self.running[message["job_id"]].cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "running": len(self.running), "slots": self.concurrency}
+
+
+_local_worker: Optional[PipelineWorker] = None
+_local_worker_task: Optional[asyncio.Task] = None
+
+
+def ensure_local_worker(handle_job: JobHandler):
+    """
+    Starts the in-process worker (PIPELINE_LOCAL_WORKERS slots) on the running loop, if configured and not running yet.
+
+    With the in-memory channel layer this is the only worker that can see the queue; with a shared layer
+    it serves jobs alongside the `run_pipeline_worker` processes (or set PIPELINE_LOCAL_WORKERS to 0).
+    """
+    global _local_worker, _local_worker_task
+    if PIPELINE_LOCAL_WORKERS <= 0 or (_local_worker_task is not None and not _local_worker_task.done()):
+        return
+    if _local_worker is None:
+        _local_worker = PipelineWorker(handle_job, PIPELINE_JOB_CHANNEL, PIPELINE_LOCAL_WORKERS)
+        register_stats("pipeline_worker", _local_worker.stats, worker="local")
+    _local_worker_task = asyncio.ensure_future(_local_worker.run())
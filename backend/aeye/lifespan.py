@@ -0,0 +1,70 @@
+import atexit, threading
+from asgiref.sync import sync_to_async
+
+from .clients import close_http_client, get_http_client
+from .config import MODEL_LOAD_ON_STARTUP
+from .inference import model_registry
+from .metrics import get_exporter
+from .offload import offloader
+from .persistence import report_writer
+from .uxlog import ux_log
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def start_resources():
+    """
+    Warms up the process-wide resources that need no event loop and arranges for them to be drained at exit.
+
+    Daphne, which serves this project, does not send ASGI lifespan events, so backend/asgi.py calls this
+    when the application is loaded, before the server accepts traffic. Servers that do send lifespan
+    events call it again from `startup`; only the first call has an effect.
+    """
+    global _started
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    offloader.start()  # Spawn and warm up the worker processes
+    if MODEL_LOAD_ON_STARTUP:
+        model_registry.load_all()  # No cold start on the first request
+    atexit.register(drain_resources)  # Runs on a normal exit, including daphne's SIGINT/SIGTERM shutdown
+
+
+def drain_resources():
+    """Writes every queued report and telemetry row, then stops the worker processes; safe to call more than once."""
+    report_writer.stop()
+    ux_log.stop()  # Also closes the current log file
+    offloader.stop()
+
+
+async def startup():
+    """Opens process-wide resources before the server starts accepting traffic."""
+    get_http_client()
+    get_exporter().start()
+    await sync_to_async(start_resources, thread_sensitive=False)()
+
+
+async def shutdown():
+    """Releases process-wide resources once the server stops accepting traffic."""
+    await close_http_client()
+    await sync_to_async(drain_resources, thread_sensitive=False)()
+    await get_exporter().aclose()
+
+
+async def lifespan_app(scope, receive, send):
+    """ASGI application handling the `lifespan` protocol for the aeye app."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await startup()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
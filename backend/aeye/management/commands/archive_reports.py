@@ -0,0 +1,35 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from aeye.archive import report_archive
+from aeye.config import ARCHIVE_AFTER_DAYS, ARCHIVE_CHUNK_SIZE, ARCHIVE_PACK_MAX_BYTES
+
+
+class Command(BaseCommand):
+    help = "Moves old diagnosis reports and their images from the database and upload tree into archive packfiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive reports older than this many days.")
+        parser.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE, help="Rows fetched and deleted at a time.")
+        parser.add_argument("--pack-max-bytes", type=int, default=ARCHIVE_PACK_MAX_BYTES, help="Image bytes per packfile.")
+        parser.add_argument("--vacuum", action="store_true", help="Run VACUUM afterwards to return freed pages to the filesystem.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options["days"])
+        reports = 0
+        try:
+            for pack in report_archive.archive(cutoff, options["chunk_size"], options["pack_max_bytes"]):
+                reports += pack["reports"]
+                self.stdout.write(
+                    f"pack-{pack['pack']:06d}: {pack['reports']} reports, {pack['bytes']} image bytes, "
+                    f"{pack['images_deleted']} images deleted"
+                )
+        except BlockingIOError:
+            raise CommandError("Another archive job is running")
+
+        if options["vacuum"] and reports:
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+        self.stdout.write(self.style.SUCCESS(f"Archived {reports} reports created before {cutoff.isoformat()}"))
@@ -0,0 +1,19 @@
+import datetime, json
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from aeye.uxlog import pa, query_log
+
+
+class Command(BaseCommand):
+    help = "Summarizes the UX telemetry log: outcomes, retakes per camera and time spent per step."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, help="Only include requests received within this many days.")
+        parser.add_argument("--camera-type", help="Only include requests from this camera type.")
+
+    def handle(self, *args, **options):
+        if pa is None:
+            raise CommandError("The UX telemetry log needs pyarrow")
+        since = (timezone.now() - datetime.timedelta(days=options["days"])).timestamp() if options["days"] is not None else None
+        self.stdout.write(json.dumps(query_log(since=since, camera_type=options["camera_type"]), indent=2))
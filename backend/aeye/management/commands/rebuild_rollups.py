@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from aeye.persistence import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the per-camera daily report counts from the hot reports and the archive."
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} camera/day rollups"))
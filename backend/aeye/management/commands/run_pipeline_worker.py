@@ -0,0 +1,36 @@
+import asyncio
+from django.core.management.base import BaseCommand, CommandError
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+
+from aeye.config import PIPELINE_JOB_CHANNEL, PIPELINE_WORKER_CONCURRENCY
+from aeye.consumers import run_pipeline_job
+from aeye.jobs import PipelineWorker
+from aeye.lifespan import shutdown, startup
+from aeye.telemetry import register_stats
+
+
+class Command(BaseCommand):
+    help = "Runs diagnosis pipeline jobs queued by the WebSocket consumers (with AEYE_PIPELINE_EXECUTION=worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=PIPELINE_WORKER_CONCURRENCY, help="Jobs run at a time.")
+
+    def handle(self, *args, **options):
+        channel_layer = get_channel_layer()
+        if channel_layer is None or isinstance(channel_layer, InMemoryChannelLayer):
+            raise CommandError("Separate pipeline workers need a channel layer shared between processes (set AEYE_REDIS_URL)")
+
+        worker = PipelineWorker(run_pipeline_job, PIPELINE_JOB_CHANNEL, options["concurrency"], channel_layer)
+        register_stats("pipeline_worker", worker.stats, worker="process")
+        self.stdout.write(f"Serving {PIPELINE_JOB_CHANNEL} with {options['concurrency']} slots")
+        try:
+            asyncio.run(self.serve(worker))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, worker: PipelineWorker):
+        await startup()  # The same process-wide resources as a server process: HTTP client, offload pool, models
+        try:
+            await worker.run()
+        finally:
+            await shutdown()
@@ -0,0 +1,270 @@
+import asyncio, threading, httpx
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .config import (
+    GRAFANA_INFLUX_URL,
+    METRICS_BATCH_SIZE,
+    METRICS_FILE_PATH,
+    METRICS_FLUSH_INTERVAL,
+    METRICS_OVERFLOW_POLICY,
+    METRICS_QUEUE_SIZE,
+    METRICS_SINK,
+    METRICS_SINK_URL,
+)
+from .telemetry import register_stats
+
+
+class MetricSink:
+    """Destination for batches of InfluxDB line-protocol points."""
+
+    async def write(self, lines: List[str]) -> bool:
+        """Writes a batch of points; returns True if the sink accepted them."""
+        raise NotImplementedError
+
+    async def close(self):
+        """Releases any resources held by the sink."""
+
+
+class HttpSink(MetricSink):
+    """Posts batches to an InfluxDB-compatible HTTP write endpoint (e.g. a local stand-in)."""
+
+    def __init__(self, url: str, auth: Optional[tuple] = None, timeout: float = 10.0):
+        self.url = url
+        self.auth = auth
+        self.client = httpx.AsyncClient(timeout=timeout)
+
+    async def write(self, lines: List[str]) -> bool:
+        response = await self.client.post(
+            self.url,
+            headers={"Content-Type": "text/plain"},
+            content="\n".join(lines).encode("utf-8"),
+            auth=self.auth,
+        )
+        return response.status_code < 300
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class GrafanaSink(HttpSink):
+    """Posts batches to Grafana's InfluxDB endpoint using the credentials in credentials.json."""
+
+    def __init__(self, url: str = GRAFANA_INFLUX_URL):
+        from .utils import read_credentials  # Credentials are only needed when Grafana is the sink
+
+        user_id, api_key = read_credentials()
+        super().__init__(url, auth=(str(user_id), api_key))
+
+
+class FileSink(MetricSink):
+    """Appends batches to a local file, one point per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def write(self, lines: List[str]) -> bool:
+        await asyncio.to_thread(self._append, lines)
+        return True
+
+    def _append(self, lines: List[str]):
+        with open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class NullSink(MetricSink):
+    """Discards every batch; useful when metrics are disabled."""
+
+    async def write(self, lines: List[str]) -> bool:
+        return True
+
+
+class MetricExporter:
+    """
+    Buffers metric points in a bounded in-memory queue and flushes them to a sink in batches.
+
+    Recording a point never blocks: once the queue is full, points are either summed into
+    per-series aggregates ("aggregate" policy) or discarded ("drop" policy). A background task
+    flushes a batch whenever `batch_size` points are waiting or `flush_interval` seconds have passed.
+    """
+
+    def __init__(
+        self,
+        sink: MetricSink,
+        max_queue: int = METRICS_QUEUE_SIZE,
+        batch_size: int = METRICS_BATCH_SIZE,
+        flush_interval: float = METRICS_FLUSH_INTERVAL,
+        overflow_policy: str = METRICS_OVERFLOW_POLICY,
+    ):
+        if overflow_policy not in ("aggregate", "drop"):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+
+        self._queue: Deque[str] = deque()
+        self._overflow: Dict[str, float] = {}  # Series key -> summed value, used under backpressure
+        self._lock = threading.Lock()  # Points may be recorded from worker threads as well as the event loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.counters = {"queued": 0, "aggregated": 0, "sent": 0, "dropped": 0, "failed_batches": 0}
+
+    def record(self, series: str, value, fields: Optional[Dict[str, float]] = None) -> bool:
+        """
+        Enqueues one point without blocking; returns False if the point was dropped.
+
+        Extra `fields` are written alongside `value`; points aggregated under backpressure keep only the summed `value`.
+        """
+        with self._lock:
+            if len(self._queue) < self.max_queue:
+                extra = "".join(f",{key}={field_value}" for key, field_value in fields.items()) if fields else ""
+                self._queue.append(f"{series} value={value}{extra}")
+                self.counters["queued"] += 1
+                pending = len(self._queue)
+            elif self.overflow_policy == "aggregate" and (series in self._overflow or len(self._overflow) < self.max_queue):
+                self._overflow[series] = self._overflow.get(series, 0) + value
+                self.counters["aggregated"] += 1
+                pending = self.batch_size  # Backpressure: ask for a flush right away
+            else:
+                self.counters["dropped"] += 1
+                return False
+
+        self._ensure_started()
+        if pending >= self.batch_size:
+            self._request_flush()
+        return True
+
+    def start(self):
+        """Starts the background flusher on the running event loop."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = self._loop.create_task(self._run())
+
+    async def aclose(self):
+        """Stops the background flusher, flushes everything still queued and closes the sink."""
+        if self._task is not None and not self._task.done() and self._loop is asyncio.get_running_loop():
+            # Let the flusher finish the batch it may be writing, so that batch is counted as sent or dropped
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+        self._task = None
+        while await self.flush():
+            pass
+        await self.sink.close()
+
+    async def flush(self) -> int:
+        """Sends at most one batch to the sink; returns the number of points taken from the queue."""
+        with self._lock:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            room = self.batch_size - len(batch)
+            while room > 0 and self._overflow:
+                series = next(iter(self._overflow))
+                batch.append(f"{series} value={self._overflow.pop(series)}")
+                room -= 1
+
+        if not batch:
+            return 0
+
+        try:
+            accepted = await self.sink.write(batch)
+        except Exception as e:
+            print(f"Failed to export metrics: {e}")
+            accepted = False
+
+        if accepted:
+            self.counters["sent"] += len(batch)
+        else:
+            self.counters["failed_batches"] += 1
+            self.counters["dropped"] += len(batch)
+        return len(batch)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the exporter counters together with the current queue depth."""
+        with self._lock:
+            return {**self.counters, "pending": len(self._queue) + len(self._overflow)}
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done() or self._loop.is_closed():
+            try:
+                self.start()
+            except RuntimeError:
+                pass  # No running event loop; points are flushed once the exporter is started on one
+
+    def _request_flush(self):
+        if self._loop is None or self._wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass  # The flusher's loop has closed; the points stay queued until the exporter is started again
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while await self.flush() >= self.batch_size:
+                pass  # Keep draining while full batches are waiting
+
+
+def format_series(metric_name: str, labels: Dict) -> str:
+    """Builds the measurement and tag set of an InfluxDB line-protocol point."""
+    return (
+        f"{metric_name},"
+        + ",".join([f"{key.replace(' ', '_')}={str(value).replace(' ', '_')}" for key, value in labels.items()])
+        + ",source=ToySysServer"
+    )
+
+
+def create_sink(kind: str = METRICS_SINK) -> MetricSink:
+    """Creates the sink selected in the configuration."""
+    if kind == "grafana":
+        return GrafanaSink()
+    if kind == "http":
+        return HttpSink(METRICS_SINK_URL)
+    if kind == "file":
+        return FileSink(METRICS_FILE_PATH)
+    if kind == "null":
+        return NullSink()
+    raise ValueError(f"Unknown metrics sink: {kind}")
+
+
+_exporter: Optional[MetricExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> MetricExporter:
+    """Returns the process-wide metric exporter, creating it on first use."""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = MetricExporter(create_sink())
+    return _exporter
+
+
+def set_exporter(exporter: Optional[MetricExporter]):
+    """Replaces the process-wide exporter, e.g. to point metrics at a file or local sink in tests."""
+    global _exporter
+    with _exporter_lock:
+        _exporter = exporter
+
+
+register_stats("metrics_exporter", lambda: get_exporter().stats())
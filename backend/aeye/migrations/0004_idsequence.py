@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aeye", "0003_rename_diagnose_id_diagnosereport_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdSequence",
+            fields=[
+                ("name", models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ("next_value", models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:27
+
+import aeye.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aeye", "0004_idsequence"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="diagnosereport",
+            name="fundus_image",
+            field=models.ImageField(storage=aeye.storage.get_fundus_storage, upload_to="uploads/"),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:37
+
+import datetime, os
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def backfill_created_at(apps, schema_editor):
+    """
+    Dates reports that predate `created_at` by the modification time of their stored image, which is
+    written once when the report is saved. Reports without a readable image get the Unix epoch, so they
+    sort as the oldest, count under 1970-01-01 in the rollups and are archived by the next archive run.
+    """
+    DiagnoseReport = apps.get_model("aeye", "DiagnoseReport")
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    reports = []
+    for report in DiagnoseReport.objects.filter(created_at__isnull=True).only("id", "fundus_image").iterator():
+        try:
+            modified = os.path.getmtime(report.fundus_image.path)
+            report.created_at = datetime.datetime.fromtimestamp(modified, tz=datetime.timezone.utc)
+        except (OSError, ValueError):  # No image, or the file is gone
+            report.created_at = epoch
+        reports.append(report)
+    DiagnoseReport.objects.bulk_update(reports, ["created_at"], batch_size=500)
+
+
+def backfill_rollups(apps, schema_editor):
+    DiagnoseReport = apps.get_model("aeye", "DiagnoseReport")
+    CameraDailyRollup = apps.get_model("aeye", "CameraDailyRollup")
+    groups = (
+        DiagnoseReport.objects.annotate(day=TruncDate("created_at"))
+        .values("camera_type", "day")
+        .annotate(total=Count("id"), positive=Count("id", filter=Q(diagnose_result=True)))
+    )
+    CameraDailyRollup.objects.bulk_create([CameraDailyRollup(**group) for group in groups])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aeye", "0005_fundus_image_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CameraDailyRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("camera_type", models.CharField(max_length=100)),
+                ("day", models.DateField()),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("positive", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="diagnosereport",
+            name="created_at",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="diagnosereport",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="diagnosereport",
+            index=models.Index(fields=["created_at", "id"], name="report_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="diagnosereport",
+            index=models.Index(fields=["camera_type", "created_at", "id"], name="report_camera_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="diagnosereport",
+            index=models.Index(fields=["diagnose_result", "created_at", "id"], name="report_result_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="cameradailyrollup",
+            constraint=models.UniqueConstraint(fields=("camera_type", "day"), name="rollup_camera_day_unique"),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,42 @@
-from django.db import models
+import contextlib, contextvars
+from django.db import models, transaction
+from django.utils import timezone
+
+from .storage import get_fundus_storage
+
+
+def allocate_report_id() -> int:
+    """Takes the next report id from the blocks reserved in `IdSequence`."""
+    from .persistence import report_ids  # persistence imports this module
+
+    return report_ids.allocate()
+
+
+# True while reports are deleted without leaving the rollups, i.e. when the archive job moves them to cold storage
+_keep_rollups = contextvars.ContextVar("keep_rollups", default=False)
+
+
+@contextlib.contextmanager
+def rollups_kept():
+    """Deletes reports within the block without removing them from the rollups."""
+    token = _keep_rollups.set(True)
+    try:
+        yield
+    finally:
+        _keep_rollups.reset(token)
+
+
+def rollups_are_kept() -> bool:
+    return _keep_rollups.get()
+
+
+class DiagnoseReportManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            if obj.id is None:
+                obj.id = allocate_report_id()
+        return super().bulk_create(objs, *args, **kwargs)
 
 
 # Create your models here.
@@ -20,9 +58,51 @@ class DiagnoseReport(models.Model):
     age = models.IntegerField()
     gender = models.CharField(max_length=10, choices=GenderChoices.choices)
     diabetes_history = models.CharField(max_length=10, choices=OptionalBoolean.choices)
-    family_diabetes_history = models.CharField(
-        max_length=10, choices=OptionalBoolean.choices
-    )
+    family_diabetes_history = models.CharField(max_length=10, choices=OptionalBoolean.choices)
     weight = models.FloatField()
     height = models.FloatField()
-    fundus_image = models.ImageField(upload_to="uploads/")
+    fundus_image = models.ImageField(upload_to="uploads/", storage=get_fundus_storage)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = DiagnoseReportManager()
+
+    class Meta:
+        # Report listings are sorted newest first with `id` as tie-breaker and paginated by seeking on (created_at, id)
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="report_created_idx"),
+            models.Index(fields=["camera_type", "created_at", "id"], name="report_camera_created_idx"),
+            models.Index(fields=["diagnose_result", "created_at", "id"], name="report_result_created_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Ids always come from the reserved blocks (here and in `bulk_create`), so a report created outside the
+        # pipeline, e.g. with `objects.create`, cannot take an id that a process has reserved but not used yet
+        if self.id is None:
+            self.id = allocate_report_id()
+        with transaction.atomic():  # The rollup update sent by the save signals commits with the row
+            super().save(*args, **kwargs)
+
+
+class IdSequence(models.Model):
+    """Next unreserved value of a named id sequence; processes reserve ids from it in blocks."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField()
+
+
+class CameraDailyRollup(models.Model):
+    """
+    Report counts per camera type and day, updated in the same transaction as the reports they count.
+
+    `insert_reports` counts bulk inserts, and the signals in `signals.py` follow `save()`, `delete()`
+    and queryset deletes, including the admin's. `QuerySet.update()`, raw SQL and `loaddata` bypass
+    them; run `manage.py rebuild_rollups` afterwards. Archived reports stay counted.
+    """
+
+    camera_type = models.CharField(max_length=100)
+    day = models.DateField()
+    total = models.PositiveIntegerField(default=0)
+    positive = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["camera_type", "day"], name="rollup_camera_day_unique")]
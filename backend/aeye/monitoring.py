@@ -0,0 +1,226 @@
+import asyncio, json, time, uuid
+import numpy as np
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (
+    MONITOR_ALERT_LOW_QUALITY_RATE,
+    MONITOR_ALERT_MIN_SAMPLES,
+    MONITOR_BUCKET_SECONDS,
+    MONITOR_COUNTS_GROUP,
+    MONITOR_GROUP,
+    MONITOR_PEER_TIMEOUT_SECONDS,
+    MONITOR_TICK_SECONDS,
+    MONITOR_WINDOW_SECONDS,
+)
+from .telemetry import camera_label
+
+QUALITY_PASSED, QUALITY_FAILED, DIAGNOSED_POSITIVE, DIAGNOSED_NEGATIVE = range(4)
+
+
+class SlidingWindowStats:
+    """
+    Per-camera event counts over the last `window_seconds`, kept in a ring of fixed-size time buckets.
+
+    Each camera type owns an array of `window_seconds / bucket_seconds` buckets; an event increments a
+    counter in the bucket of the current time, and a bucket is zeroed when the ring wraps around to it.
+    Recording is O(1) and memory grows with the number of camera types only, so callers must keep that
+    set bounded. Counts are per process.
+    """
+
+    def __init__(self, window_seconds: float, bucket_seconds: float):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(1, int(round(window_seconds / bucket_seconds)))
+        self.window_seconds = self.num_buckets * bucket_seconds
+        self._counts: Dict[str, np.ndarray] = {}  # camera type -> (buckets, 4) event counts
+        self._epochs: Dict[str, np.ndarray] = {}  # camera type -> time slot each bucket currently holds
+
+    def record(self, camera_type: str, event: int, now: Optional[float] = None):
+        epoch = int((time.time() if now is None else now) // self.bucket_seconds)
+        counts = self._counts.get(camera_type)
+        if counts is None:
+            counts = self._counts[camera_type] = np.zeros((self.num_buckets, 4), dtype=np.int64)
+            self._epochs[camera_type] = np.full(self.num_buckets, -1, dtype=np.int64)
+
+        index = epoch % self.num_buckets
+        epochs = self._epochs[camera_type]
+        if epochs[index] != epoch:
+            counts[index] = 0  # The bucket still holds a slot that has left the window
+            epochs[index] = epoch
+        counts[index, event] += 1
+
+    def total(self, camera_type: str, now: Optional[float] = None) -> np.ndarray:
+        """Returns the event counts of one camera type within the window."""
+        epoch = int((time.time() if now is None else now) // self.bucket_seconds)
+        return self._counts[camera_type][self._epochs[camera_type] > epoch - self.num_buckets].sum(axis=0)
+
+    def totals(self, now: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Returns the event counts within the window per camera type."""
+        return {camera_type: self.total(camera_type, now) for camera_type in self._counts}
+
+
+class QualityMonitor:
+    """
+    Sliding-window image quality and diagnosis statistics with locally evaluated alerts.
+
+    Camera types are mapped onto a bounded set of keys by `camera_label`. The window counts of other
+    processes, published through the channel layer, are added to this process's own counts, so alerts
+    and snapshots cover every process sharing the layer. An alert fires for a camera type when its
+    low-quality image rate within the window exceeds `alert_rate` over at least `min_samples` checked
+    images, and resolves when it drops back. Alerts are evaluated on every quality result and every
+    snapshot, whether or not anyone is subscribed.
+    """
+
+    def __init__(self, window_seconds: float, bucket_seconds: float, alert_rate: float, min_samples: int, peer_timeout: float):
+        self.stats = SlidingWindowStats(window_seconds, bucket_seconds)
+        self.alert_rate = alert_rate
+        self.min_samples = min_samples
+        self.peer_timeout = peer_timeout
+        self.alerts: Dict[str, float] = {}  # camera type -> time the alert started firing
+        self.peers: Dict[str, Tuple[float, Dict[str, List[int]]]] = {}  # process id -> (time received, window counts)
+
+    def record_quality(self, camera_type: Any, passed: bool):
+        now, camera_type = time.time(), camera_label(camera_type)
+        self.stats.record(camera_type, QUALITY_PASSED if passed else QUALITY_FAILED, now)
+        passed_count, failed_count = self._totals(now, camera_type)[camera_type][[QUALITY_PASSED, QUALITY_FAILED]]
+        checked = int(passed_count + failed_count)
+        self._evaluate_alert(camera_type, checked, float(failed_count) / checked, now)
+
+    def record_diagnosis(self, camera_type: Any, positive: bool):
+        self.stats.record(camera_label(camera_type), DIAGNOSED_POSITIVE if positive else DIAGNOSED_NEGATIVE)
+
+    def counts(self, now: Optional[float] = None) -> Dict[str, List[int]]:
+        """Returns this process's event counts within the window per camera type, for other processes to merge."""
+        return {camera_type: total.tolist() for camera_type, total in self.stats.totals(now).items()}
+
+    def merge_peer(self, process: str, counts: Dict[str, List[int]], now: Optional[float] = None):
+        """Stores the latest window counts published by another process."""
+        self.peers[process] = (time.time() if now is None else now, counts)
+
+    def _totals(self, now: float, camera_type: Optional[str] = None) -> Dict[str, np.ndarray]:
+        local = self.stats.totals(now) if camera_type is None else {camera_type: self.stats.total(camera_type, now)}
+        totals = {name: total.copy() for name, total in local.items()}
+        for process, (received_at, counts) in list(self.peers.items()):
+            if now - received_at > self.peer_timeout:
+                del self.peers[process]  # The process stopped or lost its connection to the layer
+                continue
+            for name, total in counts.items():
+                if camera_type is None or name == camera_type:
+                    totals.setdefault(name, np.zeros(4, dtype=np.int64))
+                    totals[name] += np.asarray(total, dtype=np.int64)
+        return totals
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summarizes the window per camera type across processes and updates the alert states."""
+        now = time.time()
+        cameras = {}
+        for camera_type, (passed, failed, positive, negative) in self._totals(now).items():
+            checked, diagnosed = int(passed + failed), int(positive + negative)
+            low_quality_rate = float(failed) / checked if checked else None
+            cameras[camera_type] = {
+                "quality_passed": int(passed),
+                "quality_failed": int(failed),
+                "low_quality_rate": round(low_quality_rate, 4) if low_quality_rate is not None else None,
+                "diagnosed": diagnosed,
+                "positive_rate": round(float(positive) / diagnosed, 4) if diagnosed else None,
+            }
+            self._evaluate_alert(camera_type, checked, low_quality_rate, now)
+
+        alerts = [
+            {"camera_type": camera_type, "low_quality_rate": cameras.get(camera_type, {}).get("low_quality_rate"), "since": since}
+            for camera_type, since in self.alerts.items()
+        ]
+        return {
+            "timestamp": now,
+            "window_seconds": self.stats.window_seconds,
+            "processes": 1 + len(self.peers),
+            "cameras": cameras,
+            "alerts": alerts,
+        }
+
+    def _evaluate_alert(self, camera_type: str, checked: int, low_quality_rate: Optional[float], now: float):
+        firing = checked >= self.min_samples and low_quality_rate is not None and low_quality_rate > self.alert_rate
+        if firing and camera_type not in self.alerts:
+            self.alerts[camera_type] = now
+            print(f"ALERT: low-quality image rate for {camera_type} is {low_quality_rate:.1%} over {checked} images")
+        elif not firing and camera_type in self.alerts:
+            del self.alerts[camera_type]
+            print(f"RESOLVED: low-quality image rate for {camera_type} is back to normal")
+
+
+quality_monitor = QualityMonitor(
+    MONITOR_WINDOW_SECONDS, MONITOR_BUCKET_SECONDS, MONITOR_ALERT_LOW_QUALITY_RATE, MONITOR_ALERT_MIN_SAMPLES, MONITOR_PEER_TIMEOUT_SECONDS
+)
+
+
+class SnapshotBroadcaster:
+    """
+    Publishes a monitor snapshot to this process's subscribers every tick while any are subscribed.
+
+    One task per process serializes the snapshot once per tick and sends it to the process's own group,
+    so the cost per subscriber is a single send of a prepared string rather than a thread or a timer per
+    client. With a layer shared by several processes, each process also publishes its window counts to
+    `counts_group` every tick and merges those of the others into `quality_monitor`, so every process
+    sends the same totals and no subscriber receives another process's partial snapshot.
+    """
+
+    def __init__(self, group: str, counts_group: str, tick_seconds: float):
+        self.process = uuid.uuid4().hex
+        self.group = f"{group}.{self.process}"  # Subscribers of this process only
+        self.counts_group = counts_group
+        self.tick_seconds = tick_seconds
+        self.subscribers = 0
+        self._task: Optional[asyncio.Task] = None
+        self._exchange_task: Optional[asyncio.Task] = None
+
+    def subscribe(self):
+        self.subscribers += 1
+        self.start_exchange()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+        if self.subscribers <= 0 and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def start_exchange(self):
+        """Starts exchanging window counts with other processes on the running loop, if the layer is shared and not started yet."""
+        if (self._exchange_task is not None and not self._exchange_task.done()) or isinstance(get_channel_layer(), InMemoryChannelLayer):
+            return
+        self._exchange_task = asyncio.ensure_future(self._exchange())
+
+    async def _run(self):
+        channel_layer = get_channel_layer()
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                payload = json.dumps(quality_monitor.snapshot())
+                await channel_layer.group_send(self.group, {"type": "monitor.snapshot", "payload": payload})
+            except Exception as e:
+                print(f"Failed to broadcast monitor snapshot: {e}")  # Keep ticking; the next snapshot supersedes this one
+
+    async def _exchange(self):
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await channel_layer.group_add(self.counts_group, channel)  # Again every tick, so the membership never expires
+                counts = {"type": "monitor.counts", "process": self.process, "counts": quality_monitor.counts()}
+                await channel_layer.group_send(self.counts_group, counts)
+                next_tick = loop.time() + self.tick_seconds
+                while (remaining := next_tick - loop.time()) > 0:
+                    try:
+                        message = await asyncio.wait_for(channel_layer.receive(channel), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if message.get("type") == "monitor.counts" and message.get("process") != self.process:
+                        quality_monitor.merge_peer(message["process"], message["counts"])
+            except Exception as e:
+                print(f"Failed to exchange monitor counts: {e}")  # Peers drop these counts after MONITOR_PEER_TIMEOUT_SECONDS
+                await asyncio.sleep(self.tick_seconds)
+
+
+snapshot_broadcaster = SnapshotBroadcaster(MONITOR_GROUP, MONITOR_COUNTS_GROUP, MONITOR_TICK_SECONDS)
@@ -0,0 +1,196 @@
+import asyncio, binascii, io, multiprocessing, os, threading
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .config import OFFLOAD_ENABLED, OFFLOAD_MIN_BYTES, OFFLOAD_MIN_PIXELS, OFFLOAD_START_METHOD, OFFLOAD_WORKERS
+from .quality import assess_images, image_pixels
+from .telemetry import register_stats
+
+
+def _warm_up():
+    """Worker initializer: exercises the JPEG decoder and NumPy once, so the first real request does not pay for it."""
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((64, 64), 128, dtype=np.uint8)).save(buffer, format="JPEG")
+    assess_images([buffer.getvalue()])
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _call_with_shared(fn: Callable, name: str, sizes: Sequence[int], output_size: int, *args: Any) -> Any:
+    """
+    Runs in a worker: attaches to the shared segment and calls `fn` with read-only views of the inputs.
+
+    With `output_size`, `fn` also receives a writable view of the output area behind the inputs and
+    returns the lengths of the consecutive chunks it wrote there, plus any (small) extra result.
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    views: List[memoryview] = []
+    try:
+        offset = 0
+        for size in sizes:
+            views.append(segment.buf[offset : offset + size].toreadonly())
+            offset += size
+        if output_size:
+            views.append(segment.buf[offset : offset + output_size])
+            return fn(views[:-1], views[-1], *args)
+        return fn(views, *args)
+    finally:
+        for view in views:
+            view.release()
+        segment.close()
+
+
+def _decode_base64(inputs: List[memoryview], output: memoryview) -> Tuple[List[int], None]:
+    decoded = binascii.a2b_base64(inputs[0])
+    output[: len(decoded)] = decoded
+    return [len(decoded)], None
+
+
+def _assess_images(inputs: List[memoryview]) -> List[Dict[str, Any]]:
+    return assess_images(inputs)
+
+
+class ProcessOffloader:
+    """
+    Pre-warmed process pool for CPU-bound work on image buffers.
+
+    Inputs are copied once into a `multiprocessing.shared_memory` segment and the workers read them in
+    place, so no image is pickled through the pool's pipes; only the segment name, sizes and the
+    (small) result travel through them. Work whose input is too small to be worth the IPC round trip
+    runs inline: base64 text below `min_bytes`, and encoded images below `min_pixels` in total, as
+    decoding costs in proportion to pixels rather than compressed bytes. By default the pool has one
+    worker per core, minus the core the event loop runs on.
+    """
+
+    def __init__(self, workers: int, start_method: str, min_bytes: int, min_pixels: int, enabled: bool = True):
+        self.workers = workers or max(1, (os.cpu_count() or 1) - 1)
+        self.start_method = start_method
+        self.min_bytes = min_bytes
+        self.min_pixels = min_pixels
+        self.enabled = enabled
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        self.counters = {"offloaded": 0, "inline": 0, "bytes_shared": 0}
+
+    def start(self):
+        """Creates the pool and waits until every worker has started and warmed up."""
+        with self._lock:
+            if self._pool is not None or not self.enabled:
+                return
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method), initializer=_warm_up
+            )
+            # Workers are spawned on demand, so keep all of them busy at once to start the whole pool now
+            for future in [self._pool.submit(_ping) for _ in range(self.workers)]:
+                future.result()
+
+    def stop(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def should_offload(self, buffers: Sequence[Any]) -> bool:
+        """Tells whether work on these buffers goes to the pool; counts the decision."""
+        offload = self.enabled and sum(len(buffer) for buffer in buffers) >= self.min_bytes
+        self.counters["offloaded" if offload else "inline"] += 1
+        return offload
+
+    def should_offload_images(self, images_data: Sequence[bytes], min_pixels: Optional[int] = None) -> bool:
+        """Tells whether work on these encoded images goes to the pool, by their pixel count; counts the decision."""
+        offload = self.enabled and image_pixels(images_data) >= (self.min_pixels if min_pixels is None else min_pixels)
+        self.counters["offloaded" if offload else "inline"] += 1
+        return offload
+
+    def submit(self, fn: Callable, buffers: Sequence[bytes], *args: Any, output_size: int = 0) -> Future:
+        """
+        Runs `fn` on the buffers in a worker (see `_call_with_shared`).
+
+        With `output_size` the result is the list of chunks the worker wrote to the output area and its
+        extra result. The segment is unlinked once the worker is done, even if the caller stopped waiting.
+        """
+        self.start()
+        sizes = [len(buffer) for buffer in buffers]
+        total = sum(sizes)
+        segment = shared_memory.SharedMemory(create=True, size=max(total + output_size, 1))
+        try:
+            offset = 0
+            for buffer, size in zip(buffers, sizes):
+                segment.buf[offset : offset + size] = buffer
+                offset += size
+            self.counters["bytes_shared"] += total
+            task = self._pool.submit(_call_with_shared, fn, segment.name, sizes, output_size, *args)
+        except BaseException:
+            # No worker will ever own the segment (e.g. the pool is broken or shut down); don't leak it in /dev/shm
+            segment.close()
+            segment.unlink()
+            raise
+
+        result: Future = Future()
+
+        def done(future: Future):
+            try:
+                value = future.result()
+                if output_size:
+                    lengths, extra = value
+                    chunks, offset = [], total
+                    for length in lengths:
+                        chunks.append(bytes(segment.buf[offset : offset + length]))
+                        offset += length
+                    value = (chunks, extra)
+                result.set_result(value)
+            except InvalidStateError:
+                pass  # The caller cancelled
+            except BaseException as e:
+                try:
+                    result.set_exception(e)
+                except InvalidStateError:
+                    pass
+            finally:
+                segment.close()
+                segment.unlink()
+
+        task.add_done_callback(done)
+        return result
+
+    def decode_base64(self, encoded: Union[str, bytes]) -> bytes:
+        """Decodes base64 text (non-alphabet characters are ignored, as in `base64.b64decode`)."""
+        data = encoded.encode("ascii") if isinstance(encoded, str) else encoded
+        if not self.should_offload([data]):
+            return binascii.a2b_base64(data)
+        (decoded,), _ = self.submit(_decode_base64, [data], output_size=len(data) * 3 // 4 + 3).result()
+        return decoded
+
+    async def decode_base64_async(self, encoded: Union[str, bytes]) -> bytes:
+        """Like `decode_base64`, without blocking the event loop while a worker decodes."""
+        data = encoded.encode("ascii") if isinstance(encoded, str) else encoded
+        if not self.should_offload([data]):
+            return binascii.a2b_base64(data)
+        (decoded,), _ = await asyncio.wrap_future(self.submit(_decode_base64, [data], output_size=len(data) * 3 // 4 + 3))
+        return decoded
+
+    def assess_images(self, images_data: List[bytes]) -> List[Dict[str, Any]]:
+        """Runs `quality.assess_images`, in a worker for large images."""
+        if not self.should_offload_images(images_data):
+            return assess_images(images_data)
+        return self.submit(_assess_images, images_data).result()
+
+    async def assess_images_async(self, images_data: List[bytes]) -> List[Dict[str, Any]]:
+        """Like `assess_images`, without blocking the event loop while a worker scores large images."""
+        if not self.should_offload_images(images_data):
+            return assess_images(images_data)
+        return await asyncio.wrap_future(self.submit(_assess_images, images_data))
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "workers": self.workers if self._pool is not None else 0}
+
+
+offloader = ProcessOffloader(OFFLOAD_WORKERS, OFFLOAD_START_METHOD, OFFLOAD_MIN_BYTES, OFFLOAD_MIN_PIXELS, enabled=OFFLOAD_ENABLED)
+register_stats("offload", offloader.stats)
@@ -0,0 +1,299 @@
+import datetime, os, queue, threading, time
+from asgiref.sync import sync_to_async
+from django.core import serializers
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (
+    REPORT_DEAD_LETTER_PREFIX,
+    REPORT_ID_BLOCK_SIZE,
+    REPORT_WRITE_BATCH_SIZE,
+    REPORT_WRITE_BEHIND,
+    REPORT_WRITE_MAX_DELAY,
+    REPORT_WRITE_QUEUE_SIZE,
+)
+from .archive import EPOCH, report_archive
+from .models import CameraDailyRollup, DiagnoseReport, IdSequence
+from .storage import fundus_storage
+from .telemetry import register_stats
+
+
+class IdAllocator:
+    """
+    Hands out report ids from blocks reserved in the `IdSequence` table.
+
+    Reserving a block is a single UPDATE inside a transaction, so several processes can allocate
+    concurrently without handing out the same id. Ids are unique but not gap-free across processes.
+    """
+
+    def __init__(self, sequence: str, block_size: int):
+        self.sequence = sequence
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0  # Exclusive end of the current block
+        self._lock = threading.Lock()
+
+    def try_allocate(self) -> Optional[int]:
+        """Returns the next id from the current block, or None if a new block must be reserved first."""
+        with self._lock:
+            if self._next >= self._end:
+                return None
+            self._next += 1
+            return self._next - 1
+
+    def allocate(self) -> int:
+        """Returns the next id, reserving a new block from the database when needed."""
+        while True:
+            allocated = self.try_allocate()
+            if allocated is not None:
+                return allocated
+            self._reserve_block()
+
+    async def allocate_async(self) -> int:
+        """Like `allocate`, but only leaves the event loop when a new block has to be reserved."""
+        allocated = self.try_allocate()
+        return allocated if allocated is not None else await sync_to_async(self.allocate)()
+
+    def _reserve_block(self):
+        with transaction.atomic():
+            updated = IdSequence.objects.filter(name=self.sequence).update(next_value=F("next_value") + self.block_size)
+            if not updated:
+                # First use: start after the highest id already in the table
+                start = (DiagnoseReport.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+                IdSequence.objects.create(name=self.sequence, next_value=start + self.block_size)
+            end = IdSequence.objects.get(name=self.sequence).next_value
+
+        with self._lock:
+            self._next, self._end = end - self.block_size, end
+
+
+report_ids = IdAllocator("diagnose_report", REPORT_ID_BLOCK_SIZE)
+
+
+def build_report(
+    report_id: int, form_data: Dict[str, Any], diagnose_result: bool, confidence: float, image_name: str = ""
+) -> DiagnoseReport:
+    """Builds an unsaved report with its id fixed up front."""
+    return DiagnoseReport(
+        id=report_id,
+        diagnose_result=diagnose_result,
+        confidence=confidence,
+        camera_type=(form_data["customCameraType"] if form_data["cameraType"] == "Other" else form_data["cameraType"]),
+        age=int(form_data["age"]),
+        gender=form_data["gender"],
+        diabetes_history=form_data["diabetesHistory"],
+        family_diabetes_history=form_data["familyDiabetesHistory"],
+        weight=float(form_data["weight"]),
+        height=float(form_data["height"]),
+        fundus_image=image_name,
+    )
+
+
+def add_to_rollups(reports: List[DiagnoseReport], sign: int = 1):
+    """
+    Adds reports to the per-camera daily counts, with one UPDATE (or INSERT) per camera type and day.
+    With `sign=-1` removes them instead, never below zero, and deletes the rows left empty.
+    """
+    counts: Dict[Tuple[str, Any], List[int]] = {}
+    for report in reports:
+        group = counts.setdefault((report.camera_type, timezone.localdate(report.created_at)), [0, 0])
+        group[0] += 1
+        group[1] += int(report.diagnose_result)
+
+    for (camera_type, day), (total, positive) in counts.items():
+        rollup = CameraDailyRollup.objects.filter(camera_type=camera_type, day=day)
+        if sign < 0:
+            rollup.update(total=Greatest(F("total") - total, 0), positive=Greatest(F("positive") - positive, 0))
+            rollup.filter(total=0).delete()
+            continue
+        if rollup.update(total=F("total") + total, positive=F("positive") + positive):
+            continue
+        try:
+            with transaction.atomic():
+                CameraDailyRollup.objects.create(camera_type=camera_type, day=day, total=total, positive=positive)
+        except IntegrityError:
+            # Another writer created the row first
+            rollup.update(total=F("total") + total, positive=F("positive") + positive)
+
+
+def rebuild_rollups() -> int:
+    """Recomputes the rollups from the hot reports and the archive; returns the number of rollup rows."""
+    counts: Dict[Tuple[str, Any], List[int]] = {}
+    with transaction.atomic():
+        days = DiagnoseReport.objects.annotate(day=TruncDate("created_at")).values("camera_type", "day")
+        for group in days.annotate(total=Count("id"), positive=Count("id", filter=Q(diagnose_result=True))).order_by():
+            counts[group["camera_type"], group["day"]] = [group["total"], group["positive"]]
+
+        for pack in report_archive.scan("id", "camera_type", "created_at", "diagnose_result"):
+            hot = set(DiagnoseReport.objects.filter(id__in=pack["id"].tolist()).values_list("id", flat=True))  # Not deleted yet
+            columns = (pack["id"].tolist(), pack["camera_type"].tolist(), pack["created_at"].tolist(), pack["diagnose_result"].tolist())
+            for report_id, camera_type, created_at, diagnose_result in zip(*columns):
+                if report_id not in hot:
+                    day = timezone.localdate(EPOCH + datetime.timedelta(microseconds=created_at))
+                    group = counts.setdefault((camera_type, day), [0, 0])
+                    group[0] += 1
+                    group[1] += int(diagnose_result)
+
+        CameraDailyRollup.objects.all().delete()
+        CameraDailyRollup.objects.bulk_create(
+            CameraDailyRollup(camera_type=camera_type, day=day, total=total, positive=positive)
+            for (camera_type, day), (total, positive) in counts.items()
+        )
+    return len(counts)
+
+
+def insert_reports(reports: List[DiagnoseReport]):
+    """Inserts reports (ids already set) and counts them in the rollups, in a single transaction."""
+    with transaction.atomic():
+        DiagnoseReport.objects.bulk_create(reports)
+        add_to_rollups(reports)
+
+
+class ReportWriter:
+    """
+    Write-behind queue that persists reports on a dedicated thread.
+
+    The writer takes up to `batch_size` queued reports (waiting at most `max_delay` seconds to fill a
+    batch), writes their images to the content-addressed store, and inserts all rows with one
+    `bulk_create` in a single transaction, together with the rollup updates.
+    Callers already know the report id, so they never wait for the database.
+
+    If a batch fails, its reports are retried one by one, so one bad row does not take the others down.
+    Reports that still fail are appended to `reports.jsonl` in the dead-letter directory (images that
+    were not stored are written next to it), from where `manage.py loaddata` can restore them.
+    """
+
+    def __init__(self, batch_size: int, max_delay: float, max_queue: int, dead_letter_prefix: str = REPORT_DEAD_LETTER_PREFIX):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.dead_letter_prefix = dead_letter_prefix
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.counters = {"queued": 0, "written": 0, "failed": 0, "batches": 0, "retried_batches": 0}
+
+    def submit(self, report: DiagnoseReport, image_data: bytes, image_extension: str = ".jpg", block: bool = True) -> bool:
+        """Queues a report (with its id already set); returns False if `block` is False and the queue is full."""
+        self._ensure_started()
+        try:
+            self._queue.put((report, image_data, image_extension), block=block)
+        except queue.Full:
+            return False
+        self.counters["queued"] += 1
+        return True
+
+    def stop(self):
+        """Writes every queued report, then stops the writer thread."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "pending": self._queue.qsize()}
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+                    self._thread.start()
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)  # Handle the stop request after this batch
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                self._write(self._collect(first))
+        finally:
+            connection.close()  # The writer thread owns its own database connection
+
+    def _write(self, batch: List[tuple]):
+        try:
+            for report, image_data, image_extension in batch:
+                report.fundus_image.name = fundus_storage.save_bytes(image_data, image_extension)
+            insert_reports([report for report, _, _ in batch])
+        except Exception as e:
+            print(f"Failed to write {len(batch)} reports, retrying them one by one: {e}")
+            self.counters["retried_batches"] += 1
+            for entry in batch:
+                self._write_one(*entry)
+            return
+        self.counters["written"] += len(batch)
+        self.counters["batches"] += 1
+
+    def _write_one(self, report: DiagnoseReport, image_data: bytes, image_extension: str):
+        try:
+            if not report.fundus_image.name:
+                report.fundus_image.name = fundus_storage.save_bytes(image_data, image_extension)
+            insert_reports([report])
+        except Exception as e:
+            print(f"Failed to write report {report.id}: {e}")
+            self.counters["failed"] += 1
+            self._dead_letter(report, image_data, image_extension)
+            return
+        self.counters["written"] += 1
+
+    def _dead_letter(self, report: DiagnoseReport, image_data: bytes, image_extension: str):
+        try:
+            directory = default_storage.path(self.dead_letter_prefix)
+            os.makedirs(directory, exist_ok=True)
+            if not report.fundus_image.name:
+                # The image never reached the store: keep it here, under a name the stored row can point to
+                report.fundus_image.name = f"{self.dead_letter_prefix}/{report.id}{image_extension}"
+                with open(os.path.join(directory, f"{report.id}{image_extension}"), "wb") as f:
+                    f.write(image_data)
+            with open(os.path.join(directory, "reports.jsonl"), "a") as f:
+                f.write(serializers.serialize("jsonl", [report]))
+        except Exception as e:
+            print(f"Failed to dead-letter report {report.id}, it is lost: {e}")
+
+
+report_writer = ReportWriter(REPORT_WRITE_BATCH_SIZE, REPORT_WRITE_MAX_DELAY, REPORT_WRITE_QUEUE_SIZE)
+register_stats("report_writer", report_writer.stats)
+
+
+async def persist_report(
+    form_data: Dict[str, Any], image_data: bytes, diagnose_result: bool, confidence: float, image_extension: str = ".jpg"
+) -> DiagnoseReport:
+    """
+    Persists a diagnosis report and returns it with its final id.
+
+    With REPORT_WRITE_BEHIND the report is handed to the writer thread and returned immediately;
+    otherwise the image is written on the image I/O pool and the row with a single INSERT (plus the
+    rollup update) in one transaction.
+    """
+    report_id = await report_ids.allocate_async()
+    if REPORT_WRITE_BEHIND:
+        report = build_report(report_id, form_data, diagnose_result, confidence)
+        if not report_writer.submit(report, image_data, image_extension, block=False):
+            # Backpressure when the queue is full
+            await sync_to_async(report_writer.submit, thread_sensitive=False)(report, image_data, image_extension)
+        return report
+
+    image_name = await fundus_storage.save_bytes_async(image_data, image_extension)
+    report = build_report(report_id, form_data, diagnose_result, confidence, image_name)
+    await sync_to_async(insert_reports)([report])
+    return report
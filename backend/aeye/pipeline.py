@@ -0,0 +1,86 @@
+import asyncio, contextvars, time
+from typing import Any, Awaitable, Callable, Coroutine, List, Optional, Tuple
+
+# Messages sent while a stage runs concurrently are held here until the stage is finished in pipeline order
+_stage_buffer: contextvars.ContextVar[Optional[List[Tuple[str, Any]]]] = contextvars.ContextVar("stage_buffer", default=None)
+
+
+def current_stage_buffer() -> Optional[List[Tuple[str, Any]]]:
+    """Returns the message buffer of the stage running in the current task, if any."""
+    return _stage_buffer.get()
+
+
+class Stage:
+    """A pipeline stage running as its own task, with the progress messages it has produced so far."""
+
+    def __init__(self, runner: "StageRunner", coro: Coroutine):
+        self.messages: List[Tuple[str, Any]] = []
+        self.finished_at: Optional[float] = None  # `time.perf_counter()` when the task completed, before `finish` released it
+        self.task = asyncio.ensure_future(self._run(coro))
+        self.task.add_done_callback(runner._on_stage_done)
+        self.abort_when: Optional[Callable[[Any], bool]] = None
+
+    async def _run(self, coro: Coroutine):
+        _stage_buffer.set(self.messages)  # Tasks run in a copy of the context, so this only affects this stage
+        try:
+            return await coro
+        finally:
+            self.finished_at = time.perf_counter()
+
+
+class StageRunner:
+    """
+    Runs independent pipeline stages concurrently while keeping their output deterministic.
+
+    Stages are started in pipeline order. Messages sent from inside a stage are buffered and only
+    released by `finish`, which the caller invokes in that same order. When a stage raises or completes
+    with a result its `abort_when` predicate rejects, every later stage is cancelled immediately, without
+    waiting for the caller to reach it, and no further stages are started. Earlier stages keep running
+    so their outcome is still reported first.
+    """
+
+    def __init__(self, send: Callable[[str, Any], Awaitable[None]]):
+        self.send = send
+        self.stages: List[Stage] = []
+        self.aborted = False
+
+    def start(self, coro: Coroutine, abort_when: Optional[Callable[[Any], bool]] = None) -> Optional[Stage]:
+        """Starts a stage; returns None (and discards the coroutine) if the pipeline was already aborted."""
+        if self.aborted:
+            coro.close()
+            return None
+        stage = Stage(self, coro)
+        stage.abort_when = abort_when
+        self.stages.append(stage)
+        return stage
+
+    async def wait(self, stage: Stage) -> Any:
+        """Waits for a stage without releasing its messages; returns None if the stage was cancelled."""
+        try:
+            return await asyncio.shield(stage.task)
+        except asyncio.CancelledError:
+            if stage.task.cancelled():
+                return None
+            raise  # The caller itself was cancelled
+
+    async def finish(self, stage: Stage) -> Any:
+        """Waits for a stage, then sends its buffered messages and returns its result."""
+        result = await stage.task
+        for message, data in stage.messages:
+            await self.send(message, data)
+        return result
+
+    def abort(self, after: Optional[Stage] = None):
+        """Cancels every unfinished stage started after `after` (or every unfinished stage if not given)."""
+        self.aborted = True
+        start = self.stages.index(after) + 1 if after is not None else 0
+        for stage in self.stages[start:]:
+            if not stage.task.done():
+                stage.task.cancel()
+
+    def _on_stage_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        stage = next(s for s in self.stages if s.task is task)
+        if task.exception() is not None or (stage.abort_when is not None and stage.abort_when(task.result())):
+            self.abort(after=stage)
@@ -0,0 +1,108 @@
+import asyncio, io
+from PIL import Image, ImageOps
+from typing import List, Tuple
+
+from .config import (
+    ARCHIVE_IMAGE_FORMAT,
+    ARCHIVE_IMAGE_QUALITY,
+    ARCHIVE_IMAGE_SIZE,
+    INFERENCE_IMAGE_QUALITY,
+    INFERENCE_IMAGE_SIZE,
+    PREPROCESS_ENABLED,
+    PREPROCESS_OFFLOAD_MIN_PIXELS,
+)
+from .offload import offloader
+from .quality import open_image
+from .telemetry import register_stats
+
+EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "PNG": ".png"}
+
+
+class PreparedImage:
+    """The two copies of a captured photo: one sized for the inference APIs and one for storage."""
+
+    def __init__(self, inference: bytes, archive: bytes, archive_extension: str, original_size: int):
+        self.inference = inference
+        self.archive = archive
+        self.archive_extension = archive_extension
+        self.original_size = original_size
+
+
+def _encode(image: Image.Image, max_size: int, image_format: str, quality: int) -> bytes:
+    if max(image.size) > max_size:
+        image = image.copy()
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality, **({"method": 4} if image_format == "WEBP" else {"optimize": True}))
+    return buffer.getvalue()
+
+
+def prepare(image_data: bytes) -> Tuple[List[bytes], str]:
+    """
+    Decodes an image once and encodes the inference copy (JPEG, at most INFERENCE_IMAGE_SIZE on its
+    longest side) and the archival copy (ARCHIVE_IMAGE_FORMAT, at most ARCHIVE_IMAGE_SIZE).
+
+    A copy that would not be smaller than the original comes back empty, meaning "use the original".
+    Returns the two copies and the file extension of the archival copy; raises if the image cannot be decoded
+    or has more than IMAGE_MAX_PIXELS.
+    """
+    image = open_image(image_data)
+    original_format = image.format
+    image.draft("RGB", (ARCHIVE_IMAGE_SIZE, ARCHIVE_IMAGE_SIZE))  # JPEGs are decoded at a reduced scale right away
+    image = ImageOps.exif_transpose(image).convert("RGB")  # Bake in the orientation, as the copies carry no EXIF
+
+    archive = _encode(image, ARCHIVE_IMAGE_SIZE, ARCHIVE_IMAGE_FORMAT, ARCHIVE_IMAGE_QUALITY)
+    if len(archive) >= len(image_data):
+        archive, archive_extension = b"", EXTENSIONS.get(original_format, ".jpg")
+    else:
+        archive_extension = EXTENSIONS[ARCHIVE_IMAGE_FORMAT]
+
+    inference = _encode(image, INFERENCE_IMAGE_SIZE, "JPEG", INFERENCE_IMAGE_QUALITY)
+    return [inference if len(inference) < len(image_data) else b"", archive], archive_extension
+
+
+def _prepare_shared(inputs: List[memoryview], output: memoryview) -> Tuple[List[int], str]:
+    """Worker side of `prepare_image`: writes both copies to the output area."""
+    copies, archive_extension = prepare(inputs[0])
+    offset = 0
+    for copy in copies:
+        output[offset : offset + len(copy)] = copy
+        offset += len(copy)
+    return [len(copy) for copy in copies], archive_extension
+
+
+counters = {"images": 0, "failed": 0, "original_bytes": 0, "inference_bytes": 0, "archive_bytes": 0}
+register_stats(
+    "preprocess",
+    lambda: {**counters, "bytes_saved": 2 * counters["original_bytes"] - counters["inference_bytes"] - counters["archive_bytes"]},
+)
+
+
+async def prepare_image(image_data: bytes) -> PreparedImage:
+    """
+    Produces the inference and archival copies of an image, in a worker process unless it is tiny.
+
+    Images that cannot be decoded (or preprocessing disabled) yield the original bytes for both copies,
+    so the quality check still gets to reject them.
+    """
+    if not PREPROCESS_ENABLED:
+        return PreparedImage(image_data, image_data, ".jpg", len(image_data))
+
+    try:
+        if offloader.should_offload_images([image_data], PREPROCESS_OFFLOAD_MIN_PIXELS):
+            # Neither copy is larger than the original, so twice its size always fits both
+            copies, archive_extension = await asyncio.wrap_future(
+                offloader.submit(_prepare_shared, [image_data], output_size=2 * len(image_data))
+            )
+        else:
+            copies, archive_extension = prepare(image_data)
+    except Exception:
+        counters["failed"] += 1
+        return PreparedImage(image_data, image_data, ".jpg", len(image_data))
+
+    inference, archive = (copy or image_data for copy in copies)
+    counters["images"] += 1
+    counters["original_bytes"] += len(image_data)
+    counters["inference_bytes"] += len(inference)
+    counters["archive_bytes"] += len(archive)
+    return PreparedImage(inference, archive, archive_extension, len(image_data))
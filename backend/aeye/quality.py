@@ -0,0 +1,107 @@
+import io
+import numpy as np
+from PIL import Image
+from typing import Any, Dict, List, Optional, Sequence
+
+from .config import (
+    IMAGE_MAX_PIXELS,
+    QUALITY_ANALYSIS_SIZE,
+    QUALITY_FOV_THRESHOLD,
+    QUALITY_MAX_EXPOSURE,
+    QUALITY_MIN_CONTRAST,
+    QUALITY_MIN_EXPOSURE,
+    QUALITY_MIN_FOV_COVERAGE,
+    QUALITY_MIN_SHARPNESS,
+)
+
+
+def open_image(image_data: bytes) -> Image.Image:
+    """Opens an image without decoding its pixels; raises ValueError if it has more than IMAGE_MAX_PIXELS."""
+    image = Image.open(io.BytesIO(image_data))
+    width, height = image.size
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ValueError(f"Image of {width}x{height} pixels exceeds the limit of {IMAGE_MAX_PIXELS}")
+    return image
+
+
+def image_pixels(images_data: Sequence[bytes]) -> int:
+    """Total pixel count of encoded images, from their headers; images that will be rejected undecoded count as 0."""
+    total = 0
+    for image_data in images_data:
+        try:
+            width, height = open_image(image_data).size
+            total += width * height
+        except Exception:
+            pass
+    return total
+
+
+def load_downscaled(image_data: bytes, size: int = QUALITY_ANALYSIS_SIZE) -> Optional[np.ndarray]:
+    """Decodes an image straight into a `size` x `size` grayscale float array in [0, 1]; returns None if undecodable."""
+    try:
+        image = open_image(image_data)
+        image.draft("L", (size, size))  # Lets the JPEG decoder skip most of the work for large photos
+        image = image.convert("L").resize((size, size), Image.BILINEAR)
+    except Exception:
+        return None
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def score_batch(images: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Computes quality metrics for a stack of grayscale images of shape (N, H, W).
+
+    - sharpness: variance of the Laplacian inside the field of view
+    - exposure: mean brightness inside the field of view
+    - contrast: standard deviation of brightness inside the field of view
+    - fov_coverage: fraction of the frame covered by the (non-black) fundus field of view
+    """
+    fov = images > QUALITY_FOV_THRESHOLD
+    fov_pixels = fov.sum(axis=(1, 2))
+    safe_pixels = np.maximum(fov_pixels, 1)
+
+    exposure = (images * fov).sum(axis=(1, 2)) / safe_pixels
+    contrast = np.sqrt((((images - exposure[:, None, None]) ** 2) * fov).sum(axis=(1, 2)) / safe_pixels)
+
+    # 4-neighbour Laplacian, restricted to pixels whose whole neighbourhood lies inside the field of view
+    center = images[:, 1:-1, 1:-1]
+    laplacian = images[:, :-2, 1:-1] + images[:, 2:, 1:-1] + images[:, 1:-1, :-2] + images[:, 1:-1, 2:] - 4 * center
+    inner = fov[:, 1:-1, 1:-1] & fov[:, :-2, 1:-1] & fov[:, 2:, 1:-1] & fov[:, 1:-1, :-2] & fov[:, 1:-1, 2:]
+    inner_pixels = np.maximum(inner.sum(axis=(1, 2)), 1)
+    laplacian_mean = (laplacian * inner).sum(axis=(1, 2)) / inner_pixels
+    sharpness = (((laplacian - laplacian_mean[:, None, None]) ** 2) * inner).sum(axis=(1, 2)) / inner_pixels
+
+    return {
+        "sharpness": sharpness,
+        "exposure": exposure,
+        "contrast": contrast,
+        "fov_coverage": fov_pixels / (images.shape[1] * images.shape[2]),
+    }
+
+
+def passes(scores: Dict[str, float]) -> bool:
+    """Applies the configured thresholds to one image's scores."""
+    return (
+        scores["sharpness"] >= QUALITY_MIN_SHARPNESS
+        and QUALITY_MIN_EXPOSURE <= scores["exposure"] <= QUALITY_MAX_EXPOSURE
+        and scores["contrast"] >= QUALITY_MIN_CONTRAST
+        and scores["fov_coverage"] >= QUALITY_MIN_FOV_COVERAGE
+    )
+
+
+def assess_images(images_data: List[bytes]) -> List[Dict[str, Any]]:
+    """Scores a batch of encoded images and returns the pass/fail decision and scores for each."""
+    decoded = [load_downscaled(image_data) for image_data in images_data]
+    valid = [index for index, image in enumerate(decoded) if image is not None]
+
+    results: List[Dict[str, Any]] = [
+        {"image_quality_passed": False, "scores": None, "error": "Image could not be decoded or is too large"} for _ in images_data
+    ]
+    if not valid:
+        return results
+
+    batch_scores = score_batch(np.stack([decoded[index] for index in valid]))
+    for position, index in enumerate(valid):
+        scores = {name: round(float(values[position]), 6) for name, values in batch_scores.items()}
+        results[index] = {"image_quality_passed": passes(scores), "scores": scores}
+    return results
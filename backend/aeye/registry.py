@@ -0,0 +1,117 @@
+import importlib, threading, time
+from typing import Any, Callable, Dict, Optional, Union
+
+from .telemetry import register_stats
+
+
+class LoadedModel:
+    """A model instance together with the version it was loaded from and how long loading took."""
+
+    def __init__(self, model: Any, version: str, load_seconds: float, warmup_seconds: float):
+        self.model = model
+        self.version = version
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        self.loaded_at = time.time()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 6),
+            "warmup_seconds": round(self.warmup_seconds, 6),
+        }
+
+
+def _import_loader(path: str) -> Callable[[str], Any]:
+    """Resolves a loader given as "package.module:callable"."""
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class ModelRegistry:
+    """
+    Loads each registered model once per process and serves the current version.
+
+    `get` loads a model lazily on first use; `load_all` loads and warms up every model up front (when the
+    server starts). `load` builds and warms up a new version next to the one being served and then
+    swaps it in with a single reference assignment, so requests already holding the old `LoadedModel`
+    finish on it while new requests see the new version, without a gap in between.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Union[str, Callable[[str], Any]]] = {}
+        self._warmups: Dict[str, Callable[[Any], None]] = {}
+        self._versions: Dict[str, str] = {}
+        self._models: Dict[str, LoadedModel] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.swaps: Dict[str, int] = {}
+
+    def register(self, name: str, loader: Union[str, Callable[[str], Any]], version: str, warmup: Optional[Callable[[Any], None]] = None):
+        """
+        Registers how to load a model and how to warm it up (`warmup(model)`).
+
+        `loader(version)` returns the model; it may be given as a "package.module:callable" path, which
+        is only imported when the model is loaded.
+        """
+        self._loaders[name] = loader
+        self._warmups[name] = warmup or (lambda model: None)
+        self._versions[name] = version
+        self._load_locks[name] = threading.Lock()
+        self.swaps[name] = 0
+        register_stats("model", lambda: self._numeric_info(name), model=name)
+
+    def get(self, name: str) -> LoadedModel:
+        """Returns the model currently being served, loading it first if needed."""
+        loaded = self._models.get(name)
+        if loaded is None:
+            with self._load_locks[name]:
+                loaded = self._models.get(name)
+                if loaded is None:
+                    loaded = self._models[name] = self._build(name, self._versions[name])
+        return loaded
+
+    def load(self, name: str, version: Optional[str] = None) -> LoadedModel:
+        """Loads and warms up `version` (default: the configured one), then atomically swaps it in."""
+        with self._load_locks[name]:
+            loaded = self._build(name, version or self._versions[name])
+            if name in self._models:
+                self.swaps[name] += 1
+            self._models[name] = loaded
+            self._versions[name] = loaded.version
+        return loaded
+
+    def load_all(self):
+        """Loads and warms up every registered model that is not loaded yet."""
+        for name in self._loaders:
+            self.get(name)
+
+    def info(self) -> Dict[str, Any]:
+        """Describes the served version of every model, or None for models that are not loaded yet."""
+        return {
+            name: {**(self._models[name].info() if name in self._models else {"version": None}), "swaps": self.swaps[name]}
+            for name in self._loaders
+        }
+
+    def _build(self, name: str, version: str) -> LoadedModel:
+        start = time.perf_counter()
+        loader = self._loaders[name]
+        model = (_import_loader(loader) if isinstance(loader, str) else loader)(version)
+        loaded_in = time.perf_counter()
+        self._warmups[name](model)  # Pay for lazy initialization (allocations, caches, JIT) before serving traffic
+        return LoadedModel(model, version, loaded_in - start, time.perf_counter() - loaded_in)
+
+    def _numeric_info(self, name: str) -> Dict[str, float]:
+        loaded = self._models.get(name)
+        if loaded is None:
+            return {"loaded": 0, "swaps": self.swaps[name]}
+        return {
+            "loaded": 1,
+            "swaps": self.swaps[name],
+            "loaded_at": loaded.loaded_at,
+            "load_seconds": loaded.load_seconds,
+            "warmup_seconds": loaded.warmup_seconds,
+        }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,116 @@
+import base64, datetime, json
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .archive import report_archive
+from .models import CameraDailyRollup, DiagnoseReport
+
+REPORT_FIELDS = (
+    "id",
+    "created_at",
+    "camera_type",
+    "diagnose_result",
+    "confidence",
+    "age",
+    "gender",
+    "diabetes_history",
+    "family_diabetes_history",
+    "weight",
+    "height",
+)
+
+
+def encode_cursor(created_at: datetime.datetime, report_id: int) -> str:
+    """Builds the opaque cursor pointing just past the given report."""
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), report_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    try:
+        created_at, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), int(report_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def parse_timestamp(value: str, end_of_day: bool = False) -> datetime.datetime:
+    """Parses an ISO datetime, or an ISO date meaning the start (or, with `end_of_day`, the end) of that day."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.datetime.combine(day + datetime.timedelta(days=1) if end_of_day else day, datetime.time())
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def parse_bool(value: str) -> bool:
+    if value.lower() in ("true", "1", "yes"):
+        return True
+    if value.lower() in ("false", "0", "no"):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+
+def list_reports(filters: Dict[str, str], limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns one page of reports, newest first, and the cursor of the next page (None on the last page).
+
+    Pages are fetched by seeking past the (created_at, id) of the previous page's last report, which the
+    composite indexes serve directly, so deep pages cost the same as the first one. Supported filters:
+    camera_type, diagnose_result, created_after, created_before, min_confidence, max_confidence.
+    """
+    reports = DiagnoseReport.objects.all()
+    if "camera_type" in filters:
+        reports = reports.filter(camera_type=filters["camera_type"])
+    if "diagnose_result" in filters:
+        reports = reports.filter(diagnose_result=parse_bool(filters["diagnose_result"]))
+    if "created_after" in filters:
+        reports = reports.filter(created_at__gte=parse_timestamp(filters["created_after"]))
+    if "created_before" in filters:
+        reports = reports.filter(created_at__lt=parse_timestamp(filters["created_before"], end_of_day=True))
+    if "min_confidence" in filters:
+        reports = reports.filter(confidence__gte=float(filters["min_confidence"]))
+    if "max_confidence" in filters:
+        reports = reports.filter(confidence__lte=float(filters["max_confidence"]))
+    if cursor:
+        created_at, report_id = decode_cursor(cursor)
+        reports = reports.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=report_id))
+
+    # One extra row tells whether another page follows
+    page: List[Dict[str, Any]] = list(reports.order_by("-created_at", "-id").values(*REPORT_FIELDS)[: limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]["created_at"], page[limit - 1]["id"]) if len(page) > limit else None
+    return {"results": page[:limit], "next_cursor": next_cursor}
+
+
+def get_report(report_id: int) -> Optional[Dict[str, Any]]:
+    """Returns one report from the database or, failing that, from cold storage; None if it does not exist."""
+    report = DiagnoseReport.objects.filter(id=report_id).values(*REPORT_FIELDS).first()
+    if report is not None:
+        return {**report, "archived": False}
+    archived = report_archive.get(report_id)
+    if archived is None:
+        return None
+    return {**{field: archived[0][field] for field in REPORT_FIELDS}, "archived": True}
+
+
+def camera_summary(since: Optional[datetime.date] = None, until: Optional[datetime.date] = None) -> List[Dict[str, Any]]:
+    """Report count and positive rate per camera type, summed from the daily rollups (both bounds inclusive)."""
+    rollups = CameraDailyRollup.objects.all()
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+    if until is not None:
+        rollups = rollups.filter(day__lte=until)
+
+    groups = rollups.values("camera_type").annotate(count=Sum("total"), positive=Sum("positive")).order_by("camera_type")
+    return [
+        {
+            "camera_type": group["camera_type"],
+            "count": group["count"],
+            "positive": group["positive"],
+            "positive_rate": round(group["positive"] / group["count"], 4) if group["count"] else None,
+        }
+        for group in groups
+    ]
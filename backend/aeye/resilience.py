@@ -0,0 +1,242 @@
+import asyncio, contextlib, contextvars, time
+import numpy as np
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from .telemetry import register_stats
+
+# Monotonic time by which the current request must be answered; set once per request and inherited by its stage tasks
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the latency budget of the current request is used up."""
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit of {name} is open; retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+@contextlib.contextmanager
+def deadline(budget: float) -> Iterator[None]:
+    """Gives the code within (and every task it starts) `budget` seconds; an enclosing, earlier deadline still applies."""
+    enclosing = _deadline.get()
+    expires = time.monotonic() + budget
+    token = _deadline.set(expires if enclosing is None else min(enclosing, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def without_deadline() -> Iterator[None]:
+    """Lifts the current deadline within, for work shared by several requests with budgets of their own."""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left before the current deadline, or None if there is none."""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def bounded_timeout(timeout: float) -> float:
+    """Caps a timeout at the remaining budget; raises DeadlineExceeded if nothing is left."""
+    remaining = remaining_budget()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded("Latency budget exhausted")
+    return min(timeout, remaining)
+
+
+class LatencyTracker:
+    """Keeps the latest `size` latencies of an endpoint in a ring buffer and answers percentile queries over them."""
+
+    def __init__(self, size: int):
+        self._samples = np.zeros(size)
+        self._count = 0
+
+    def record(self, latency: float):
+        self._samples[self._count % len(self._samples)] = latency
+        self._count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if self._count == 0:
+            return None
+        return float(np.percentile(self._samples[: min(self._count, len(self._samples))], q))
+
+    def __len__(self) -> int:
+        return min(self._count, len(self._samples))
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while an endpoint is unhealthy.
+
+    The breaker opens after `failure_threshold` consecutive failures. While open, calls raise `CircuitOpen`
+    right away. After `reset_timeout` seconds it lets `half_open_calls` trial calls through: a success
+    closes it again, a failure reopens it for another `reset_timeout`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trials = 0
+        self.counters = {"opened": 0, "rejected": 0}
+
+    def before_call(self):
+        """Raises CircuitOpen unless a call may go through now."""
+        if self.state == self.OPEN:
+            retry_after = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_after > 0:
+                self.counters["rejected"] += 1
+                raise CircuitOpen(self.name, retry_after)
+            self.state, self.trials = self.HALF_OPEN, 0
+        if self.state == self.HALF_OPEN:
+            if self.trials >= self.half_open_calls:
+                self.counters["rejected"] += 1
+                raise CircuitOpen(self.name, self.reset_timeout)
+            self.trials += 1
+
+    def record_success(self):
+        self.state, self.failures = self.CLOSED, 0
+
+    def record_abandoned(self):
+        """Frees the trial slot of a call that was cancelled before it had an outcome."""
+        if self.state == self.HALF_OPEN and self.trials > 0:
+            self.trials -= 1
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.counters["opened"] += 1
+            self.state, self.opened_at = self.OPEN, time.monotonic()
+
+    def stats(self) -> Dict[str, float]:
+        return {**self.counters, "open": int(self.state != self.CLOSED), "consecutive_failures": self.failures}
+
+
+class HedgedEndpoint:
+    """
+    Calls a downstream endpoint with hedging and a circuit breaker, within the current request's budget.
+
+    If the first attempt has not answered after the `hedge_percentile` latency of recent calls (or
+    `default_hedge_delay` until `min_samples` calls were seen), a second, identical attempt is sent and
+    the first successful answer wins; the other attempt is cancelled. A hedge is only sent if the
+    budget outlasts the delay. `fn` must be idempotent. Every attempt, the hedge included, has to pass
+    the breaker, so a half-open circuit only lets its trial calls through. Attempts that fail with an
+    error `is_failure` accepts count against the breaker; cancelled losers do not.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        breaker: CircuitBreaker,
+        hedge_percentile: float,
+        default_hedge_delay: float,
+        min_samples: int,
+        window: int,
+        hedging: bool = True,
+        is_failure: Callable[[BaseException], bool] = lambda e: True,
+    ):
+        self.name = name
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.hedging = hedging
+        self.is_failure = is_failure
+        self.latencies = LatencyTracker(window)
+        self.counters = {"calls": 0, "hedged": 0, "hedge_won": 0, "failed": 0, "deadline_exceeded": 0}
+        register_stats("endpoint", self.stats, endpoint=name)
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return self.latencies.percentile(self.hedge_percentile)
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        self.counters["calls"] += 1
+        budget = remaining_budget()
+        if budget is not None and budget <= 0:
+            self.counters["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"No budget left to call {self.name}")
+
+        attempts = [self._start_attempt(fn, *args)]
+        try:
+            delay = self.hedge_delay()
+            first_wait = budget if not self.hedging else delay if budget is None else min(delay, budget)
+            done, _ = await asyncio.wait(attempts, timeout=first_wait)
+            if not done and self.hedging and (budget is None or budget > delay):
+                try:
+                    attempts.append(self._start_attempt(fn, *args))
+                    self.counters["hedged"] += 1
+                except CircuitOpen:
+                    pass  # A half-open circuit has no trial left for the hedge; keep waiting for the first attempt
+
+            pending, error = set(attempts), None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=remaining_budget(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.counters["deadline_exceeded"] += 1
+                    raise DeadlineExceeded(f"{self.name} did not answer within the latency budget")
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is not attempts[0]:
+                            self.counters["hedge_won"] += 1
+                        return attempt.result()
+                    error = attempt.exception()
+            self.counters["failed"] += 1
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def _start_attempt(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> asyncio.Future:
+        """Starts one attempt if the breaker lets it through (raises CircuitOpen otherwise)."""
+        self.breaker.before_call()
+        attempt = asyncio.ensure_future(self._attempt(fn, *args))
+        # A loser may still fail (e.g. time out) while being cancelled; nobody awaits it, so retrieve the error here
+        attempt.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return attempt
+
+    async def _attempt(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await fn(*args)
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned()
+            raise
+        except BaseException as e:
+            if self.is_failure(e):
+                self.breaker.record_failure()
+            raise
+        self.latencies.record(time.perf_counter() - start)
+        self.breaker.record_success()
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.counters,
+            **self.breaker.stats(),
+            "hedge_delay_seconds": self.hedge_delay(),
+            "latency_samples": len(self.latencies),
+        }
@@ -1,6 +1,7 @@
 from django.urls import path
-from aeye.consumers import ProcessConsumer
+from aeye.consumers import MonitorConsumer, ProcessConsumer
 
 websocket_urlpatterns = [
     path("ws/process/", ProcessConsumer.as_asgi()),
+    path("ws/monitor/", MonitorConsumer.as_asgi()),
 ]
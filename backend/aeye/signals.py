@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import DiagnoseReport, rollups_are_kept
+from .persistence import add_to_rollups
+
+ROLLUP_FIELDS = ("camera_type", "created_at", "diagnose_result")
+
+
+@receiver(pre_save, sender=DiagnoseReport)
+def remember_rollup_fields(sender, instance: DiagnoseReport, raw: bool, **kwargs):
+    """Reads the counted fields of a report about to be updated, so its old rollup group can be decremented."""
+    if not raw and not instance._state.adding:
+        instance._rollup_previous = sender.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=DiagnoseReport)
+def count_saved_report(sender, instance: DiagnoseReport, created: bool, raw: bool, **kwargs):
+    if raw:
+        return  # Fixtures may carry their own rollups; `manage.py rebuild_rollups` recounts
+    previous = instance.__dict__.pop("_rollup_previous", None)
+    if created:
+        add_to_rollups([instance])
+    elif previous is not None and any(previous[field] != getattr(instance, field) for field in ROLLUP_FIELDS):
+        add_to_rollups([DiagnoseReport(**previous)], sign=-1)
+        add_to_rollups([instance])
+
+
+@receiver(post_delete, sender=DiagnoseReport)
+def uncount_deleted_report(sender, instance: DiagnoseReport, **kwargs):
+    if not rollups_are_kept():
+        add_to_rollups([instance], sign=-1)
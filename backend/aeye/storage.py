@@ -0,0 +1,94 @@
+import asyncio, hashlib, os, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.storage import FileSystemStorage
+from typing import Iterable, Optional
+
+from .config import (
+    FUNDUS_STORAGE_BUFFER_SIZE,
+    FUNDUS_STORAGE_FSYNC,
+    FUNDUS_STORAGE_IO_THREADS,
+    FUNDUS_STORAGE_PREFIX,
+    FUNDUS_STORAGE_SHARD_DEPTH,
+)
+from .telemetry import register_stats
+
+# File writes and reads of fundus images run here, away from both the event loop and Django's database thread
+image_io_pool = ThreadPoolExecutor(max_workers=FUNDUS_STORAGE_IO_THREADS, thread_name_prefix="image-io")
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Filesystem storage that names every file after the SHA-256 of its content.
+
+    Files land in sharded directories (e.g. `uploads/3f/a2/3fa2...e1.jpg`), so no directory grows
+    without bound, and saving content that is already stored returns the existing name instead of
+    writing a second copy. Each file is streamed into a temporary file next to its final location and
+    renamed into place, so readers never observe a partially written image. The name passed to `save`
+    only contributes its extension.
+    """
+
+    def __init__(self, prefix: str = FUNDUS_STORAGE_PREFIX, shard_depth: int = FUNDUS_STORAGE_SHARD_DEPTH, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self.shard_depth = shard_depth
+        self.counters = {"written": 0, "deduplicated": 0}
+
+    def sharded_name(self, digest: str, extension: str) -> str:
+        """Builds the storage name of a file from its content hash."""
+        shards = [digest[2 * level : 2 * level + 2] for level in range(self.shard_depth)]
+        return "/".join([self.prefix, *shards, digest + extension])
+
+    def get_available_name(self, name: str, max_length: Optional[int] = None) -> str:
+        return name  # Names are derived from content in _save, so an existing name means identical content
+
+    def _save(self, name: str, content) -> str:
+        return self._write_atomic(content.chunks(FUNDUS_STORAGE_BUFFER_SIZE), os.path.splitext(name)[1])
+
+    def save_bytes(self, data: bytes, extension: str = ".jpg") -> str:
+        """Stores an in-memory buffer without copying it into chunks; returns the storage name."""
+        return self._write_atomic((data,), extension)
+
+    async def save_bytes_async(self, data: bytes, extension: str = ".jpg") -> str:
+        """Stores an in-memory buffer on the image I/O thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(image_io_pool, self.save_bytes, data, extension)
+
+    def _write_atomic(self, chunks: Iterable[bytes], extension: str) -> str:
+        staging_dir = self.path(self.prefix)
+        os.makedirs(staging_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=staging_dir, prefix=".incoming-")
+
+        try:
+            hasher = hashlib.sha256()
+            with os.fdopen(fd, "wb", buffering=FUNDUS_STORAGE_BUFFER_SIZE) as f:
+                for chunk in chunks:
+                    hasher.update(chunk)  # Hash while writing, so the content is only traversed once
+                    f.write(chunk)
+                if FUNDUS_STORAGE_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            name = self.sharded_name(hasher.hexdigest(), extension)
+            final_path = self.path(name)
+            if os.path.exists(final_path):
+                os.unlink(temp_path)
+                self.counters["deduplicated"] += 1
+                return name
+
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, final_path)  # Atomic on POSIX: readers see the old state or the complete file
+            self.counters["written"] += 1
+            return name
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+
+fundus_storage = ContentAddressedStorage()
+register_stats("fundus_storage", lambda: fundus_storage.counters)
+
+
+def get_fundus_storage() -> ContentAddressedStorage:
+    """Storage of `DiagnoseReport.fundus_image` (a callable, so migrations do not serialize the instance)."""
+    return fundus_storage
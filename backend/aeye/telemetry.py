@@ -0,0 +1,140 @@
+import asyncio, bisect, contextvars, functools, time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .config import KNOWN_CAMERA_TYPES, STAGE_LATENCY_BUCKETS
+
+# Labels of the request being processed; set once per request and inherited by the tasks it spawns
+request_labels: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("request_labels", default={})
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def camera_label(camera_type: Any) -> str:
+    """Maps a client-supplied camera type onto a bounded set of label values."""
+    if not camera_type:
+        return "unknown"
+    return camera_type if camera_type in KNOWN_CAMERA_TYPES else "other"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram keyed by a tuple of label values.
+
+    Observations only bump plain integers and floats under the GIL, without locks, so recording from
+    the event loop costs a bisect and three additions. Observations from several threads at once may
+    lose an occasional increment, which is acceptable for latency telemetry.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, label_values: Tuple[str, ...]):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, label_values, le)} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+stage_latency = Histogram(
+    "aeye_stage_duration_seconds",
+    "Duration of ProcessConsumer pipeline stages.",
+    ("stage", "camera_type", "outcome"),
+    STAGE_LATENCY_BUCKETS,
+)
+
+# name -> (label names, label values, function returning a dict of numeric stats)
+_stats_sources: Dict[str, List[Tuple[Tuple[str, ...], Tuple[str, ...], Callable[[], Dict[str, float]]]]] = {}
+
+
+def register_stats(name: str, stats: Callable[[], Dict[str, float]], **labels: str):
+    """Exposes every numeric entry of `stats()` as a gauge `aeye_<name>{key="..."}` on /metrics."""
+    _stats_sources.setdefault(name, []).append((tuple(labels), tuple(labels.values()), stats))
+
+
+def render_metrics() -> str:
+    """Renders all histograms and registered stats in the Prometheus text exposition format."""
+    lines = stage_latency.render()
+    for name, sources in sorted(_stats_sources.items()):
+        metric = f"aeye_{name}"
+        lines += [f"# HELP {metric} Internal {name.replace('_', ' ')} statistics.", f"# TYPE {metric} gauge"]
+        for label_names, label_values, stats in sources:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"{metric}{_format_labels(label_names + ('key',), label_values + (key,))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class stage_span:
+    """
+    Records the duration of a pipeline stage in `stage_latency`, for stages that do not map onto one coroutine.
+
+    The span starts at `start` (default: entering the block) and ends at `end` if the block sets it
+    (default: leaving the block). The block sets `outcome` ("ok" unless changed); an exception records
+    "error", a cancellation "cancelled". The camera type comes from `request_labels`.
+    """
+
+    def __init__(self, stage: str, start: Optional[float] = None):
+        self.stage = stage
+        self.start = start
+        self.end: Optional[float] = None
+        self.outcome = "ok"
+
+    def __enter__(self) -> "stage_span":
+        if self.start is None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.outcome = "cancelled" if issubclass(exc_type, asyncio.CancelledError) else "error"
+        camera_type = request_labels.get().get("camera_type", "unknown")
+        stage_latency.observe((self.end or time.perf_counter()) - self.start, (self.stage, camera_type, self.outcome))
+
+
+def timed_stage(stage: str, rejected: Optional[Callable[[Any], bool]] = None):
+    """
+    Records the duration of an async pipeline stage in `stage_latency`.
+
+    The outcome label is "ok", "rejected" (when `rejected(result)` is true), "error" or "cancelled";
+    the camera type comes from `request_labels`.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with stage_span(stage) as span:
+                result = await fn(*args, **kwargs)
+                if rejected is not None and rejected(result):
+                    span.outcome = "rejected"
+                return result
+
+        return wrapper
+
+    return decorator
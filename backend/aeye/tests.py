@@ -0,0 +1,731 @@
+import asyncio, base64, datetime, httpx, io, json, os, tempfile, threading, time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from unittest import skipIf
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from PIL import Image
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from . import clients, uxlog
+from .admission import ConcurrencyLimiter, Overloaded
+from .archive import report_archive
+from .batching import MicroBatcher
+from .cache import ResultCache
+from .config import IMAGE_MAX_PIXELS, IMAGE_QUALITY_MAX_BATCH, MAX_IMAGE_BYTES
+from .consumers import ProcessConsumer, run_pipeline_job
+from .jobs import PipelineWorker
+from .metrics import MetricExporter, NullSink
+from .models import CameraDailyRollup, DiagnoseReport
+from .monitoring import QualityMonitor
+from .offload import ProcessOffloader, offloader
+from .persistence import ReportWriter, build_report, rebuild_rollups, report_ids
+from .pipeline import StageRunner, current_stage_buffer
+from .preprocess import prepare
+from .quality import assess_images
+from .reports import get_report
+from .resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, HedgedEndpoint, deadline, remaining_budget
+from .storage import fundus_storage
+from .telemetry import camera_label
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_cancelled_waiters_do_not_stop_the_batcher(self):
+        running, release = threading.Event(), threading.Event()
+
+        def double(items):
+            running.set()
+            release.wait(5)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait=0.0, name="test-batcher")
+        self.addCleanup(batcher.stop)
+
+        async def scenario():
+            in_batch = asyncio.ensure_future(batcher.submit_async(1))
+            await asyncio.to_thread(running.wait, 5)  # The first batch is now running with only this item
+            queued = asyncio.ensure_future(batcher.submit_async(2))
+            survivor = asyncio.ensure_future(batcher.submit_async(3))
+            await asyncio.sleep(0.01)
+            in_batch.cancel()  # Cancelled mid-batch
+            queued.cancel()  # Cancelled before its batch started
+            await asyncio.sleep(0.01)
+            release.set()
+
+            self.assertEqual(await asyncio.wait_for(survivor, 5), 6)
+            self.assertEqual(await asyncio.wait_for(batcher.submit_async(4), 5), 8)
+
+        asyncio.run(scenario())
+
+
+class ReportPermissionTests(TestCase):
+    URLS = ("/aeye/reports/", "/aeye/reports/summary/", "/aeye/reports/1/", "/aeye/reports/1/image/")
+
+    def test_reports_require_a_staff_account(self):
+        for url in self.URLS:
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+
+        self.client.force_login(User.objects.create_user("viewer", password="viewer"))
+        for url in self.URLS:
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+
+        self.client.force_login(User.objects.create_user("staff", password="staff", is_staff=True))
+        self.assertEqual(self.client.get("/aeye/reports/").status_code, 200)
+        self.assertEqual(self.client.get("/aeye/reports/summary/").status_code, 200)
+        self.assertEqual(self.client.get("/aeye/reports/1/").status_code, 404)
+        self.assertEqual(self.client.get("/aeye/reports/1/image/").status_code, 404)
+
+
+class ReportWriterTests(TestCase):
+    FORM_DATA = {
+        "cameraType": "Canon CX-1",
+        "age": 60,
+        "gender": "Female",
+        "diabetesHistory": "No",
+        "familyDiabetesHistory": "Unknown",
+        "weight": 70.0,
+        "height": 170.0,
+    }
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def test_failed_batch_is_retried_per_report_and_dead_lettered(self):
+        good = [build_report(report_ids.allocate(), self.FORM_DATA, False, 0.1) for _ in range(3)]
+        bad = build_report(report_ids.allocate(), self.FORM_DATA, True, 0.9)
+        bad.gender = None  # Violates NOT NULL, so the whole batch fails
+        writer = ReportWriter(batch_size=8, max_delay=0.0, max_queue=8)
+
+        writer._write([(report, b"image %d" % report.id, ".jpg") for report in [good[0], bad, *good[1:]]])
+
+        self.assertEqual(set(DiagnoseReport.objects.values_list("id", flat=True)), {report.id for report in good})
+        self.assertEqual(CameraDailyRollup.objects.get().total, 3)
+        self.assertEqual((writer.counters["written"], writer.counters["failed"]), (3, 1))
+        with open(os.path.join(settings.MEDIA_ROOT, "dead_letters", "reports.jsonl")) as f:
+            self.assertEqual([json.loads(line)["pk"] for line in f], [bad.id])
+
+    def test_reports_created_outside_the_pipeline_take_reserved_ids(self):
+        reserved = report_ids.allocate()
+        fields = {"diagnose_result": False, "confidence": 0.1, "camera_type": "Canon CX-1", "age": 60, "gender": "Female"}
+        report = DiagnoseReport.objects.create(**fields, diabetes_history="No", family_diabetes_history="No", weight=70.0, height=170.0)
+        self.assertEqual(report.id, reserved + 1)
+        self.assertEqual(report_ids.allocate(), reserved + 2)
+
+
+class RollupTests(TestCase):
+    FIELDS = {
+        "confidence": 0.5,
+        "age": 60,
+        "gender": "Female",
+        "diabetes_history": "No",
+        "family_diabetes_history": "No",
+        "weight": 70.0,
+        "height": 170.0,
+    }
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def counts(self):
+        return {rollup.camera_type: (rollup.total, rollup.positive) for rollup in CameraDailyRollup.objects.all()}
+
+    def test_rollups_follow_saves_and_deletes(self):
+        first, *_ = [DiagnoseReport.objects.create(camera_type="Canon CX-1", diagnose_result=bool(i % 2), **self.FIELDS) for i in range(3)]
+        self.assertEqual(self.counts(), {"Canon CX-1": (3, 1)})
+
+        first.camera_type = "Topcon NW400"
+        first.save()
+        first.confidence = 0.9
+        first.save(update_fields=["confidence"])
+        self.assertEqual(self.counts(), {"Canon CX-1": (2, 1), "Topcon NW400": (1, 0)})
+
+        DiagnoseReport.objects.filter(camera_type="Topcon NW400").delete()
+        DiagnoseReport.objects.filter(diagnose_result=True).get().delete()
+        self.assertEqual(self.counts(), {"Canon CX-1": (1, 0)})
+
+    def test_rebuild_counts_hot_and_archived_reports(self):
+        for i in range(4):
+            DiagnoseReport.objects.create(camera_type="Canon CX-1", diagnose_result=False, **self.FIELDS)
+        DiagnoseReport.objects.filter(id__in=list(DiagnoseReport.objects.values_list("id", flat=True)[:2])).update(diagnose_result=True)
+        self.assertEqual(self.counts(), {"Canon CX-1": (4, 0)})  # QuerySet.update() bypasses the signals
+
+        list(report_archive.archive(timezone.now(), chunk_size=3))  # Moves all reports to the archive
+        self.assertEqual((DiagnoseReport.objects.count(), self.counts()), (0, {"Canon CX-1": (4, 0)}))
+
+        self.assertEqual(rebuild_rollups(), 1)
+        self.assertEqual(self.counts(), {"Canon CX-1": (4, 2)})
+
+
+class ReportArchiveTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        # Packs and the index are cached per archive directory, which changes with every test
+        report_archive._pack.cache_clear()
+        report_archive._index = None
+
+    def create(self, image: str, days_old: int) -> DiagnoseReport:
+        return DiagnoseReport.objects.create(
+            fundus_image=image,
+            created_at=timezone.now() - datetime.timedelta(days=days_old),
+            **RollupTests.FIELDS,
+            camera_type="Canon CX-1",
+            diagnose_result=True,
+        )
+
+    def test_archived_reports_and_images_are_served_from_packs(self):
+        old_image, shared_image = fundus_storage.save_bytes(b"old image"), fundus_storage.save_bytes(b"shared image")
+        old, duplicate = self.create(old_image, 10), self.create(old_image, 9)
+        shared, hot = self.create(shared_image, 8), self.create(shared_image, 0)
+
+        summaries = list(report_archive.archive(timezone.now() - datetime.timedelta(days=1)))
+
+        self.assertEqual([(s["reports"], s["images_deleted"]) for s in summaries], [(3, 1)])
+        self.assertEqual(list(DiagnoseReport.objects.values_list("id", flat=True)), [hot.id])
+        self.assertFalse(fundus_storage.exists(old_image))
+        self.assertTrue(fundus_storage.exists(shared_image))  # Still referenced by a hot report
+
+        report = get_report(duplicate.id)
+        self.assertEqual((report["archived"], report["created_at"], report["confidence"]), (True, duplicate.created_at, 0.5))
+        self.assertEqual(get_report(hot.id)["archived"], False)
+        self.assertIsNone(get_report(hot.id + 1))
+
+        self.client.force_login(User.objects.create_user("staff", password="staff", is_staff=True))
+        for report, image in ((old, b"old image"), (duplicate, b"old image"), (shared, b"shared image"), (hot, b"shared image")):
+            response = self.client.get(f"/aeye/reports/{report.id}/image/")
+            self.assertEqual((response.status_code, b"".join(response)), (200, image), report.id)
+
+    def test_image_deduplicated_against_while_deleting_is_revived(self):
+        image = fundus_storage.save_bytes(b"old image")
+        self.create(image, 10)
+        delete = fundus_storage.delete
+
+        def delete_during_a_duplicate_save(name):
+            duplicate = fundus_storage.save_bytes(b"old image")  # Finds the stored copy, so writes nothing
+            delete(name)
+            self.create(duplicate, 0)  # The row lands after the archive checked for references
+
+        fundus_storage.delete = delete_during_a_duplicate_save
+        self.addCleanup(vars(fundus_storage).pop, "delete")
+        summaries = list(report_archive.archive(timezone.now() - datetime.timedelta(days=1)))
+
+        self.assertEqual(summaries[0]["images_deleted"], 0)
+        with fundus_storage.open(image, "rb") as f:
+            self.assertEqual(f.read(), b"old image")
+
+
+class EndpointBreakerTests(SimpleTestCase):
+    def test_hedge_is_not_sent_past_a_half_open_breaker(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+        breaker.record_failure()
+        endpoint = HedgedEndpoint("test", breaker, 95, default_hedge_delay=0.01, min_samples=20, window=10)
+        calls = []
+
+        async def slow():
+            calls.append(None)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        self.assertEqual(asyncio.run(endpoint.call(slow)), "ok")
+        self.assertEqual((len(calls), endpoint.counters["hedged"], breaker.state), (1, 0, breaker.CLOSED))
+
+    def test_timeouts_cut_short_by_the_budget_are_not_endpoint_failures(self):
+        def time_out(request):
+            raise httpx.ReadTimeout("timed out", request=request)
+
+        async def post_with_budget(budget):
+            clients._client = httpx.AsyncClient(base_url="http://test", transport=httpx.MockTransport(time_out))
+            try:
+                if budget is None:
+                    return await clients.post_image("/aeye/diagnose/", b"image", {})
+                with deadline(budget):
+                    return await clients.post_image("/aeye/diagnose/", b"image", {})
+            finally:
+                await clients.close_http_client()
+
+        with self.assertRaises(DeadlineExceeded) as clipped:
+            asyncio.run(post_with_budget(1.0))
+        self.assertFalse(clients.is_endpoint_failure(clipped.exception))
+        with self.assertRaises(httpx.ReadTimeout) as full:
+            asyncio.run(post_with_budget(None))
+        self.assertTrue(clients.is_endpoint_failure(full.exception))
+
+
+def encode_image(width: int, height: int, mode: str = "L", image_format: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class ImageSizeTests(SimpleTestCase):
+    def test_images_over_the_pixel_limit_are_rejected_before_decoding(self):
+        side = int(IMAGE_MAX_PIXELS**0.5) + 1
+        oversized = encode_image(side, side, mode="1")  # A few KB compressed, over the limit once decoded
+        self.assertEqual(assess_images([oversized])[0]["error"], "Image could not be decoded or is too large")
+        with self.assertRaises(ValueError):
+            prepare(oversized)
+
+    def test_oversized_batches_are_rejected_before_decoding(self):
+        too_many = ["not base64!"] * (IMAGE_QUALITY_MAX_BATCH + 1)  # Decoding any of these would fail with another error
+        response = self.client.post("/aeye/image-quality/batch/", {"imageData": too_many}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f"at most {IMAGE_QUALITY_MAX_BATCH} images", response.json()["error"])
+
+        files = [io.BytesIO(b"x") for _ in range(IMAGE_QUALITY_MAX_BATCH + 1)]
+        response = self.client.post("/aeye/image-quality/batch/", {"imageData": files})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f"at most {IMAGE_QUALITY_MAX_BATCH} images", response.json()["error"])
+
+    def test_offload_is_decided_by_pixel_count(self):
+        offloader = ProcessOffloader(workers=1, start_method="spawn", min_bytes=64 * 1024, min_pixels=512 * 512)
+        small_but_heavy, large_but_cheap = encode_image(256, 256, "RGB", "BMP"), encode_image(1024, 1024)
+        self.assertGreater(len(small_but_heavy), len(large_but_cheap))
+        self.assertFalse(offloader.should_offload_images([small_but_heavy]))
+        self.assertTrue(offloader.should_offload_images([large_but_cheap]))
+        self.assertFalse(offloader.should_offload_images([b"not an image"]))
+
+
+class ProcessOffloaderTests(SimpleTestCase):
+    def test_segment_is_unlinked_when_the_pool_rejects_the_work(self):
+        offloader = ProcessOffloader(workers=1, start_method="spawn", min_bytes=0, min_pixels=0)
+        offloader._pool = ProcessPoolExecutor(max_workers=1)
+        offloader._pool.shutdown()  # Rejects new work without ever starting a worker
+        segments = set(os.listdir("/dev/shm"))
+        with self.assertRaises(RuntimeError):
+            offloader.submit(len, [b"image bytes"])
+        self.assertEqual(set(os.listdir("/dev/shm")), segments)
+
+
+class MetricExporterTests(SimpleTestCase):
+    def test_recording_after_the_flusher_loop_closed_does_not_raise(self):
+        exporter = MetricExporter(NullSink(), batch_size=1, flush_interval=0.01)
+
+        async def record_one():
+            exporter.record("series", 1)
+
+        asyncio.run(record_one())
+        self.assertTrue(exporter.record("series", 2))
+        self.assertTrue(exporter.record("series", 3))
+        asyncio.run(record_one())  # A new loop restarts the flusher
+        asyncio.run(exporter.aclose())
+        self.assertEqual((exporter.counters["sent"], exporter.stats()["pending"]), (4, 0))
+
+    def test_close_waits_for_the_batch_being_written(self):
+        class SlowSink(NullSink):
+            async def write(self, lines):
+                await asyncio.sleep(0.05)
+                return True
+
+        exporter = MetricExporter(SlowSink(), batch_size=2, flush_interval=10.0)
+
+        async def scenario():
+            for value in range(5):
+                exporter.record("series", value)
+            await asyncio.sleep(0.01)  # The flusher is now inside SlowSink.write
+            await exporter.aclose()
+
+        asyncio.run(scenario())
+        self.assertEqual((exporter.counters["sent"], exporter.counters["dropped"]), (5, 0))
+
+
+class CameraLabelTests(SimpleTestCase):
+    def test_unknown_camera_types_share_one_label(self):
+        self.assertEqual(camera_label("Topcon NW400"), "Topcon NW400")
+        self.assertEqual(camera_label("my home-made camera #1234"), "other")
+        self.assertEqual(camera_label({"not": "a string"}), "other")
+        self.assertEqual(camera_label(None), "unknown")
+
+
+class QualityMonitorTests(SimpleTestCase):
+    def test_free_text_camera_types_share_one_key(self):
+        monitor = QualityMonitor(60, 10, alert_rate=0.5, min_samples=100, peer_timeout=5.0)
+        for index in range(50):
+            monitor.record_quality(f"camera {index}", True)
+        monitor.record_diagnosis(None, False)
+        self.assertEqual(sorted(monitor.snapshot()["cameras"]), ["other", "unknown"])
+        self.assertEqual(monitor.snapshot()["cameras"]["other"]["quality_passed"], 50)
+
+    def test_counts_of_other_processes_are_merged_until_they_go_stale(self):
+        monitor = QualityMonitor(60, 10, alert_rate=0.5, min_samples=4, peer_timeout=5.0)
+        monitor.merge_peer("worker", {"Canon CX-1": [1, 2, 0, 0]})
+        monitor.merge_peer("gone", {"Canon CX-1": [100, 0, 0, 0]}, now=time.time() - 10)
+        monitor.record_quality("Canon CX-1", False)
+        self.assertIn("Canon CX-1", monitor.alerts)  # 3 of 4 images failed across both processes
+
+        snapshot = monitor.snapshot()
+        self.assertEqual(snapshot["processes"], 2)
+        self.assertEqual((snapshot["cameras"]["Canon CX-1"]["quality_passed"], snapshot["cameras"]["Canon CX-1"]["quality_failed"]), (1, 3))
+        self.assertEqual(monitor.counts(), {"Canon CX-1": [0, 1, 0, 0]})
+
+
+class ConcurrencyLimiterTests(SimpleTestCase):
+    def limiter(self, **kwargs):
+        return ConcurrencyLimiter("test", 4, min_limit=1, max_limit=8, adaptive=True, backoff_ratio=0.5, **kwargs)
+
+    def test_limit_grows_while_in_use_and_shrinks_on_congestion(self):
+        limiter = self.limiter()
+
+        async def fast():
+            await asyncio.sleep(0)
+
+        async def saturate():
+            for _ in range(10):
+                await asyncio.gather(*(limiter.run(fast) for _ in range(int(limiter.limit))))
+
+        asyncio.run(saturate())
+        self.assertGreater(limiter.limit, 4)
+
+        grown = limiter.limit
+
+        async def timed_out():
+            raise clients.DownstreamError("diagnose: ReadTimeout") from httpx.ReadTimeout("timed out")
+
+        with self.assertRaises(clients.DownstreamError):
+            asyncio.run(limiter.run(timed_out))
+        self.assertEqual((limiter.limit, limiter.counters["decreases"]), (grown * 0.5, 1))
+
+    def test_fast_failures_leave_the_limit_alone(self):
+        limiter = self.limiter()
+        failures = [
+            CircuitOpen("diagnose", 1.0),
+            DeadlineExceeded("budget spent"),
+            clients.DownstreamError("Diagnose API returned 400", 400),
+            ValueError("bad image"),
+        ]
+        for failure in failures:
+
+            async def fail():
+                raise failure
+
+            with self.assertRaises(type(failure)):
+                asyncio.run(limiter.run(fail))
+        self.assertEqual((limiter.limit, limiter.counters["decreases"], limiter.in_flight), (4, 0, 0))
+
+    def test_waiters_time_out_and_a_full_queue_rejects(self):
+        limiter = ConcurrencyLimiter("test", 1, max_queue=1, queue_timeout=0.02)
+
+        async def scenario():
+            release = asyncio.Event()
+            holder = asyncio.ensure_future(limiter.run(release.wait))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            with self.assertRaises(Overloaded):
+                await limiter.acquire()  # The one queue slot is taken
+            with self.assertRaises(Overloaded):
+                await waiter
+            release.set()
+            await holder
+
+        asyncio.run(scenario())
+        self.assertEqual((limiter.counters["rejected"], limiter.counters["timeouts"], limiter.in_flight), (1, 1, 0))
+
+
+class PipelineJobTests(SimpleTestCase):
+    def test_cancel_message_stops_the_running_job(self):
+        layer = InMemoryChannelLayer()
+        started = []
+
+        async def handle_job(job, worker):
+            started.append(job["job_id"])
+            await asyncio.Event().wait()
+
+        worker = PipelineWorker(handle_job, "jobs", concurrency=2, channel_layer=layer)
+
+        async def scenario():
+            serving = asyncio.ensure_future(worker.run())
+            await layer.send("jobs", {"type": "diagnosis.job", "job_id": "a"})
+            await layer.send("jobs", {"type": "diagnosis.job", "job_id": "b"})
+            while len(started) < 2:
+                await asyncio.sleep(0.001)
+            await layer.send(worker.control_channel, {"type": "job.cancel", "job_id": "a"})
+            while worker.counters["cancelled"] < 1:
+                await asyncio.sleep(0.001)
+            self.assertEqual((list(worker.running), worker.counters["started"]), (["b"], 2))
+            serving.cancel()
+
+        asyncio.run(scenario())
+
+    def test_job_expired_in_the_queue_is_reported_done(self):
+        layer = InMemoryChannelLayer()
+        worker = PipelineWorker(None, "jobs", concurrency=1, channel_layer=layer)
+
+        async def scenario():
+            reply_channel = await layer.new_channel()
+            job = {"job_id": "a", "reply_channel": reply_channel, "deadline": time.time() - 1, "request": {}, "captured_photo": ""}
+            await run_pipeline_job(job, worker)
+            return await layer.receive(reply_channel)
+
+        done = asyncio.run(scenario())
+        self.assertEqual((done["type"], done["job_id"], done["expired"]), ("job.done", "a", True))
+        self.assertIn("DeadlineExceeded", done["error"])
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_entries_expire_and_the_byte_cap_evicts_the_least_recently_used(self):
+        cache = ResultCache(max_entries=10, max_bytes=60, ttl=0.05)
+
+        async def lookups():
+            for key in ("a", "b", "a", "c"):
+                await cache.get_or_compute(key, lambda: asyncio.sleep(0, result="x" * 10))  # ~13 bytes per entry
+            await cache.get_or_compute("big", lambda: asyncio.sleep(0, result="x" * 100))  # Larger than the cap: not stored
+            await asyncio.sleep(0.06)
+            await cache.get_or_compute("a", lambda: asyncio.sleep(0, result="y"))
+
+        asyncio.run(lookups())
+        self.assertEqual((cache.counters["hits"], cache.counters["misses"], cache.counters["expirations"]), (1, 5, 1))
+        self.assertEqual(cache.stats()["entries"], 3)
+
+        small = ResultCache(max_entries=10, max_bytes=30, ttl=60)
+        for key in ("a", "b", "c"):
+            asyncio.run(small.get_or_compute(key, lambda: asyncio.sleep(0, result="x" * 10)))
+        self.assertEqual((list(small._entries), small.counters["evictions"]), (["b", "c"], 1))
+
+    def test_concurrent_lookups_share_one_computation_without_the_first_callers_deadline(self):
+        cache = ResultCache(max_entries=10, max_bytes=1000, ttl=60)
+        budgets = []
+
+        async def compute():
+            budgets.append(remaining_budget())
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def hurried():
+            with deadline(0.01):
+                return await cache.get_or_compute("key", compute)
+
+        async def scenario():
+            return await asyncio.gather(hurried(), cache.get_or_compute("key", compute), return_exceptions=True)
+
+        first, second = asyncio.run(scenario())
+        self.assertIsInstance(first, DeadlineExceeded)
+        self.assertEqual((second, budgets, cache.counters["coalesced"]), ("result", [None], 1))
+
+    def test_a_cancelled_computation_is_not_joined(self):
+        cache = ResultCache(max_entries=10, max_bytes=1000, ttl=60)
+        calls = []
+
+        async def compute():
+            calls.append(None)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def scenario():
+            abandoned = asyncio.ensure_future(cache.get_or_compute("key", compute))
+            await asyncio.sleep(0)
+            abandoned.cancel()  # Its only caller leaves, which cancels the computation
+            await asyncio.sleep(0)
+            return await cache.get_or_compute("key", compute)
+
+        self.assertEqual(asyncio.run(scenario()), 2)
+
+
+def fundus_image(size: int = 256) -> bytes:
+    """A synthetic fundus photo (bright disc on a black surround) that passes the quality check."""
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size - 0.5
+    radius = np.sqrt(x**2 + y**2)
+    vessels = 0.25 * (np.sin(40 * (x + 0.3 * np.sin(6 * y))) > 0.92)
+    brightness = np.clip(0.55 - 0.6 * radius**2 - vessels + np.random.default_rng(0).normal(0, 0.03, (size, size)), 0, 1)
+    brightness[radius > 0.45] = 0
+    buffer = io.BytesIO()
+    Image.fromarray((np.stack([brightness, brightness * 0.55, brightness * 0.25], axis=-1) * 255).astype(np.uint8)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class ProcessConsumerTests(TransactionTestCase):
+    FORM_DATA = {
+        "cameraType": "Canon CX-1",
+        "age": 60,
+        "gender": "Female",
+        "diabetesHistory": "No",
+        "familyDiabetesHistory": "No",
+        "weight": 70.0,
+        "height": 170.0,
+    }
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.addCleanup(offloader.stop)  # Started by the first upload
+
+    def converse(self, frames, responses, subprotocols=None):
+        """Sends the frames on a new connection and returns the negotiated subprotocol and the next `responses` messages."""
+
+        async def run():
+            communicator = WebsocketCommunicator(ProcessConsumer.as_asgi(), "/ws/process/", subprotocols=subprotocols)
+            connected, subprotocol = await communicator.connect()
+            self.assertTrue(connected)
+            for frame in frames:
+                await communicator.send_to(**({"bytes_data": frame} if isinstance(frame, bytes) else {"text_data": json.dumps(frame)}))
+            messages, self.frames = [], []
+            while len(messages) < responses + 1:  # Plus the greeting
+                output = await communicator.receive_output(timeout=10)
+                self.frames.append(output.get("text") or output.get("bytes"))
+                messages += decode_frame(self.frames[-1])
+            await communicator.disconnect()
+            return subprotocol, messages[1:]
+
+        return asyncio.run(run())
+
+    def test_binary_upload_is_reassembled_from_several_frames(self):
+        image = fundus_image()
+        chunks = [image[offset : offset + 1000] for offset in range(0, len(image), 1000)]
+        _, messages = self.converse([{"formData": self.FORM_DATA, "imageSize": len(image)}, *chunks], 4)
+        self.assertEqual(
+            [message["message"] for message in messages],
+            ["Basic information verified", "Image data verified", "Diagnosis complete", "Report generated"],
+        )
+        self.assertEqual(DiagnoseReport.objects.get().id, messages[-1]["data"]["id"])
+
+    def test_binary_upload_size_limits(self):
+        _, messages = self.converse([{"formData": self.FORM_DATA, "imageSize": MAX_IMAGE_BYTES + 1}, b"x"], 2)
+        self.assertEqual(messages[0]["data"], f"Image exceeds the maximum size of {MAX_IMAGE_BYTES} bytes")
+        self.assertEqual(messages[1]["data"], "Received image bytes without a preceding metadata frame")
+
+        _, messages = self.converse(
+            [{"formData": self.FORM_DATA, "imageSize": 4}, b"abc", b"de", {"formData": self.FORM_DATA, "imageSize": 0}], 2
+        )
+        self.assertEqual(messages[0]["data"], "Image exceeds the announced size of 4 bytes")
+        self.assertEqual(messages[1]["data"], "imageSize must be a positive integer")
+        self.assertFalse(DiagnoseReport.objects.exists())
+
+    def test_tagged_requests_are_demultiplexed_by_request_id(self):
+        photo = "data:image/jpeg;base64," + base64.b64encode(fundus_image()).decode()
+        frames = [
+            {"formData": self.FORM_DATA, "capturedPhoto": photo, "requestId": "a"},
+            {"formData": self.FORM_DATA, "capturedPhoto": photo, "requestId": "a"},
+            {"formData": self.FORM_DATA, "capturedPhoto": photo, "requestId": 7},
+            {"formData": self.FORM_DATA, "capturedPhoto": photo, "requestId": True},
+        ]
+        _, messages = self.converse(frames, 10)
+        by_request = {}
+        for message in messages:
+            by_request.setdefault(message.get("requestId"), []).append(message["message"])
+
+        pipeline = ["Basic information verified", "Image data verified", "Diagnosis complete", "Report generated"]
+        self.assertEqual(sorted(by_request["a"]), sorted(["Invalid request", *pipeline]))  # The duplicate id is turned away
+        self.assertEqual([message for message in by_request["a"] if message != "Invalid request"], pipeline)
+        self.assertEqual(by_request[7], pipeline)
+        self.assertEqual(by_request[True], ["Invalid request"])
+        self.assertEqual(DiagnoseReport.objects.count(), 2)
+
+    @skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_is_negotiated_and_json_is_the_fallback(self):
+        request = {"formData": {}, "capturedPhoto": ""}
+        subprotocol, messages = self.converse([request], 1, subprotocols=["unknown", "aeye.msgpack", "aeye.json"])
+        self.assertEqual((subprotocol, messages[0]["message"]), ("aeye.msgpack", "Invalid basic information"))
+        self.assertTrue(all(isinstance(frame, bytes) for frame in self.frames))
+
+        for subprotocols in (["unknown"], None):
+            subprotocol, messages = self.converse([request], 1, subprotocols=subprotocols)
+            self.assertEqual((subprotocol, messages[0]["message"]), (None, "Invalid basic information"))
+            self.assertTrue(all(isinstance(frame, str) for frame in self.frames))
+
+
+def decode_frame(frame):
+    """Returns the messages of a server frame; a MessagePack frame may carry several."""
+    if isinstance(frame, str):
+        return [json.loads(frame)]
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(frame)
+    return list(unpacker)
+
+
+class StageRunnerTests(SimpleTestCase):
+    async def stage(self, name, delay, result=True):
+        await asyncio.sleep(delay)
+        current_stage_buffer().append((name, None))  # What send_message does inside a stage
+        return result
+
+    def test_messages_are_released_in_pipeline_order(self):
+        sent = []
+
+        async def send(message, data):
+            sent.append(message)
+
+        async def scenario():
+            runner = StageRunner(send)
+            slow, fast = runner.start(self.stage("slow", 0.02)), runner.start(self.stage("fast", 0.0))
+            await runner.wait(fast)
+            self.assertEqual(sent, [])  # Held back until the earlier stage is finished
+            await runner.finish(slow)
+            await runner.finish(fast)
+
+        asyncio.run(scenario())
+        self.assertEqual(sent, ["slow", "fast"])
+
+    def test_a_rejecting_stage_cancels_the_later_ones(self):
+        async def scenario():
+            runner = StageRunner(None)
+            earlier = runner.start(self.stage("earlier", 0.05))
+            rejecting = runner.start(self.stage("rejecting", 0.0, result=False), abort_when=lambda passed: not passed)
+            later = runner.start(self.stage("later", 1.0))
+            await runner.wait(rejecting)
+            await asyncio.sleep(0)
+            self.assertIsNone(runner.start(self.stage("never", 0.0)))
+            self.assertIsNone(await runner.wait(later))
+            return await runner.wait(earlier), later.task.cancelled()
+
+        self.assertEqual(asyncio.run(scenario()), (True, True))
+
+
+@skipIf(uxlog.pa is None, "pyarrow is not installed")
+class UxTelemetryLogTests(SimpleTestCase):
+    STEPS = [{"step": 1, "duration": 2.0}, {"step": 2, "duration": 4.0}]
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def log(self, **options) -> uxlog.UxTelemetryLog:
+        options = {
+            "batch_size": 2,
+            "flush_interval": 0.01,
+            "max_queue": 16,
+            "file_max_bytes": 1 << 20,
+            "file_max_seconds": 3600.0,
+            **options,
+        }
+        log = uxlog.UxTelemetryLog("uxlog", **options)
+        self.addCleanup(log.stop)
+        return log
+
+    def test_files_rotate_and_a_truncated_tail_is_skipped(self):
+        log = self.log(file_max_bytes=1)  # Every batch goes to a new file
+        for i in range(5):
+            log.record(1000.0 + i, "Canon CX-1", "Diagnosis complete", 1.5, i, self.STEPS)
+        log.stop()
+
+        paths = uxlog.log_files(log.directory)
+        self.assertEqual((log.counters["written"], log.counters["files"]), (5, log.counters["batches"]))
+        self.assertGreaterEqual(len(paths), 3)
+        self.assertEqual(len(paths), log.counters["files"])
+        self.assertEqual(uxlog.read_log(paths, ["retake_count"])["retake_count"].to_pylist(), [0, 1, 2, 3, 4])
+
+        with open(paths[-1], "r+b") as f:
+            f.truncate(os.path.getsize(paths[-1]) - 16)  # Cuts into the last batch, as a crash mid-write would
+        self.assertLess(uxlog.read_log(paths).num_rows, 5)
+
+    def test_query_filters_rows_and_drops_malformed_steps(self):
+        log = self.log()
+        log.record(1000.0, "Canon CX-1", "Diagnosis complete", 1.0, 0, self.STEPS)
+        log.record(1001.0, "Canon CX-1", "Image rejected", 1.0, 2, [{"step": 1, "duration": float("nan")}, "step", {"step": True}])
+        log.record(1002.0, None, "Cancelled", 1.0, float("inf"), None)
+        log.record(2000.0, "Topcon NW400", "Diagnosis complete", 1.0, 1, [{"step": 3, "duration": 1.0}])
+        log.stop()
+        paths = uxlog.log_files(log.directory)
+
+        summary = uxlog.query_log(paths=paths)
+        self.assertEqual(summary["requests"], 4)
+        self.assertEqual(summary["outcomes"], {"Diagnosis complete": 2, "Image rejected": 1, "Cancelled": 1})
+        self.assertEqual(summary["cameras"]["unknown"], {"requests": 1, "mean_retakes": 0.0, "retake_rate": 0.0})
+        self.assertEqual(summary["steps"][1], {"visits": 1, "mean_duration": 2.0, "p50_duration": 2.0, "p90_duration": 2.0})
+
+        summary = uxlog.query_log(since=1000.5, until=2000.0, camera_type="Canon CX-1", paths=paths)
+        self.assertEqual((summary["requests"], summary["outcomes"], summary["steps"]), (1, {"Image rejected": 1}, {}))
+        self.assertEqual(summary["cameras"], {"Canon CX-1": {"requests": 1, "mean_retakes": 2.0, "retake_rate": 1.0}})
@@ -1,7 +1,23 @@
 from django.urls import path
-from .views import DiagnoseAPIView, ImageQualityAPIView
+from .views import (
+    DiagnoseAPIView,
+    FundusImageAPIView,
+    ImageQualityAPIView,
+    ImageQualityBatchAPIView,
+    ModelRegistryAPIView,
+    ReportDetailAPIView,
+    ReportListAPIView,
+    ReportSummaryAPIView,
+)
 
 urlpatterns = [
     path("diagnose/", DiagnoseAPIView.as_view(), name="diagnose"),
     path("image-quality/", ImageQualityAPIView.as_view(), name="image_quality"),
+    path("image-quality/batch/", ImageQualityBatchAPIView.as_view(), name="image_quality_batch"),
+    path("reports/", ReportListAPIView.as_view(), name="reports"),
+    path("reports/summary/", ReportSummaryAPIView.as_view(), name="report_summary"),
+    path("reports/<int:report_id>/", ReportDetailAPIView.as_view(), name="report"),
+    path("reports/<int:report_id>/image/", FundusImageAPIView.as_view(), name="fundus_image"),
+    path("models/", ModelRegistryAPIView.as_view(), name="models"),
+    path("models/<str:name>/", ModelRegistryAPIView.as_view(), name="model"),
 ]
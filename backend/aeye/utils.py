@@ -1,5 +1,7 @@
-import json, requests
-from typing import Dict
+import json
+from typing import Dict, Optional
+
+from .metrics import format_series, get_exporter
 
 
 def read_credentials():
@@ -9,51 +11,23 @@ def read_credentials():
     return int(data["USER_ID"]), data["API_KEY"]
 
 
-# Load user credentials from the file
-USER_ID, API_KEY = read_credentials()
-
-
-def send_metric_to_grafana(metric_name: str, metric_value, labels: Dict):
+def send_metric_to_grafana(metric_name: str, metric_value, labels: Dict, fields: Optional[Dict] = None):
     """
-    Formats and sends a metric to Grafana's InfluxDB endpoint.
+    Formats a metric and queues it for export to Grafana's InfluxDB endpoint.
+
+    The point is handed to the process-wide `MetricExporter`, which batches it with other points
+    and posts them from a background task, so this call never blocks the event loop.
 
     Args:
         metric_name (str): Name of the metric to send.
         metric_value (any): Value of the metric.
         labels (Dict): A dictionary of labels to associate with the metric.
+        fields (Dict, optional): Additional numeric fields to record with the value (e.g. quality scores).
 
     Returns:
-        int: HTTP status code of the request.
+        bool: True if the point was queued (or aggregated), False if it was dropped under backpressure.
     """
-    # Construct the body of the metric in InfluxDB line protocol format
-    body = (
-        f"{metric_name},"
-        + ",".join([f"{key.replace(' ', '_')}={value.replace(' ', '_')}" for key, value in labels.items()])
-        + ",source=ToySysServer "
-        + f"value={metric_value}"
-    )
-
-    # Send the metric and get the response status code
-    status_code = post_metric(body)
-
-    # Print the response status code
-    print(f"Posted metric with status code: {status_code}")
-
-    return status_code
-
-
-def post_metric(body):
-    """Sends a POST request to Grafana's InfluxDB endpoint with the given metric data."""
-    response = requests.post(
-        "https://influx-prod-13-prod-us-east-0.grafana.net/api/v1/push/influx/write",
-        headers={
-            "Content-Type": "text/plain",
-        },
-        data=str(body),
-        auth=(USER_ID, API_KEY),
-    )
-
-    # Get the response status code
-    status_code = response.status_code
-
-    return status_code
+    # Construct the measurement and tags of the metric in InfluxDB line protocol format
+    series = format_series(metric_name, labels)
+
+    return get_exporter().record(series, metric_value, fields)
@@ -0,0 +1,324 @@
+import functools, glob, math, os, queue, threading, time
+import numpy as np
+from django.core.files.storage import default_storage
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # The log is disabled without pyarrow
+    pa = pc = None
+
+from .config import (
+    UX_LOG_BATCH_SIZE,
+    UX_LOG_COMPRESSION,
+    UX_LOG_ENABLED,
+    UX_LOG_FILE_MAX_BYTES,
+    UX_LOG_FILE_MAX_SECONDS,
+    UX_LOG_FLUSH_INTERVAL,
+    UX_LOG_MAX_STEPS,
+    UX_LOG_PREFIX,
+    UX_LOG_QUEUE_SIZE,
+)
+from .telemetry import register_stats
+
+# One row per diagnosis request; `steps` is the client's stepHistory
+SCHEMA = (
+    pa.schema(
+        [
+            ("received_at", pa.timestamp("us", tz="UTC")),
+            ("camera_type", pa.string()),
+            ("outcome", pa.string()),  # Last progress message sent for the request, or "Cancelled"
+            ("duration", pa.float32()),  # Seconds from receiving the request to its last message
+            ("retake_count", pa.int16()),
+            ("steps", pa.list_(pa.struct([("step", pa.int16()), ("duration", pa.float32())]))),
+        ]
+    )
+    if pa is not None
+    else None
+)
+
+
+def _number(value: Any, kind: type) -> Optional[Any]:
+    """Returns a client-supplied number as `kind`, or None if it is not a finite one (json.loads accepts Infinity and NaN)."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return kind(value)
+
+
+def build_batch(rows: List[tuple]) -> "pa.RecordBatch":
+    """Turns queued rows into a record batch, dropping malformed step entries."""
+    received_at, camera_types, outcomes, durations, retake_counts, offsets, steps, step_durations = [], [], [], [], [], [0], [], []
+    for timestamp, camera_type, outcome, duration, retake_count, step_history in rows:
+        received_at.append(int(timestamp * 1_000_000))
+        camera_types.append(camera_type if isinstance(camera_type, str) else None)
+        outcomes.append(outcome)
+        durations.append(duration)
+        retake_count = _number(retake_count, int)
+        retake_counts.append(retake_count if retake_count is not None and 0 <= retake_count < 2**15 else None)
+        for entry in step_history if isinstance(step_history, list) else ():
+            step, step_duration = (
+                (_number(entry.get("step"), int), _number(entry.get("duration"), float)) if isinstance(entry, dict) else (None, None)
+            )
+            if step is not None and step_duration is not None and -(2**15) <= step < 2**15:
+                steps.append(step)
+                step_durations.append(step_duration)
+        offsets.append(len(steps))
+
+    step_values = pa.StructArray.from_arrays(
+        [pa.array(steps, pa.int16()), pa.array(step_durations, pa.float32())], fields=list(SCHEMA.field("steps").type.value_type)
+    )
+    columns = [
+        pa.array(received_at, SCHEMA.field("received_at").type),
+        pa.array(camera_types, pa.string()),
+        pa.array(outcomes, pa.string()),
+        pa.array(durations, pa.float32()),
+        pa.array(retake_counts, pa.int16()),
+        pa.ListArray.from_arrays(pa.array(offsets, pa.int32()), step_values),
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=SCHEMA)
+
+
+class UxTelemetryLog:
+    """
+    Append-only columnar log of the client's UX telemetry (stepHistory, retakeCount) per diagnosis request.
+
+    `record` only appends to a bounded queue and drops rows once it is full, so the request path never
+    waits. A writer thread turns up to `batch_size` rows (or whatever arrived within `flush_interval`)
+    into one Arrow record batch and appends it to the current Arrow IPC stream file. A file is closed
+    and a new one started once it reaches `file_max_bytes` or is `file_max_seconds` old. Every process
+    writes its own files; a file cut short by a crash stays readable up to its last complete batch.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        batch_size: int,
+        flush_interval: float,
+        max_queue: int,
+        file_max_bytes: int,
+        file_max_seconds: float,
+        compression: Optional[str] = None,
+        enabled: bool = True,
+    ):
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.file_max_bytes = file_max_bytes
+        self.file_max_seconds = file_max_seconds
+        self.compression = compression
+        self.enabled = enabled and pa is not None
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._sink = self._writer = None
+        self._opened_at = 0.0
+        self._files = 0
+
+        self.counters = {"queued": 0, "dropped": 0, "written": 0, "failed": 0, "batches": 0, "files": 0}
+        if enabled and pa is None:
+            print("UX telemetry log disabled: pyarrow is not installed")
+
+    @property
+    def directory(self) -> str:
+        return default_storage.path(self.prefix)
+
+    def record(
+        self, received_at: float, camera_type: Any, outcome: Optional[str], duration: float, retake_count: Any, step_history: Any
+    ) -> bool:
+        """Queues one request's telemetry without blocking; returns False if it was dropped (or the log is disabled)."""
+        if not self.enabled:
+            return False
+        if isinstance(step_history, list) and len(step_history) > UX_LOG_MAX_STEPS:
+            step_history = step_history[:UX_LOG_MAX_STEPS]  # Don't hold on to an oversized history while it is queued
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((received_at, camera_type, outcome, duration, retake_count, step_history))
+        except queue.Full:
+            self.counters["dropped"] += 1
+            return False
+        self.counters["queued"] += 1
+        return True
+
+    def stop(self):
+        """Writes every queued row, closes the current file and stops the writer thread."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, "pending": self._queue.qsize()}
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="ux-log-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    self._rotate_if_due()  # Close an idle file once it is old enough
+                    continue
+                if first is None:
+                    return
+                batch, stop = self._collect(first)
+                self._write(batch)
+                if stop:
+                    return
+        finally:
+            self._close_file()
+
+    def _collect(self, first: tuple) -> Tuple[List[tuple], bool]:
+        """Gathers up to `batch_size` rows, waiting at most `flush_interval` after the first; tells whether to stop afterwards."""
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                row = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is None:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    def _write(self, rows: List[tuple]):
+        try:
+            record_batch = build_batch(rows)
+            self._rotate_if_due()
+            if self._writer is None:
+                self._open_file()
+            self._writer.write_batch(record_batch)
+        except Exception as e:
+            print(f"Failed to write {len(rows)} UX telemetry rows: {e}")
+            self.counters["failed"] += len(rows)
+            return
+        self.counters["written"] += len(rows)
+        self.counters["batches"] += 1
+
+    def _open_file(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._files += 1
+        name = f"ux-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{os.getpid()}-{self._files:04d}.arrows"
+        self._sink = pa.OSFile(os.path.join(self.directory, name), "wb")
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        self._writer = pa.ipc.new_stream(self._sink, SCHEMA, options=options)
+        self._opened_at = time.monotonic()
+        self.counters["files"] += 1
+
+    def _rotate_if_due(self):
+        if self._writer is None:
+            return
+        if self._sink.tell() >= self.file_max_bytes or time.monotonic() - self._opened_at >= self.file_max_seconds:
+            self._close_file()
+
+    def _close_file(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()  # Writes the end-of-stream marker
+            finally:
+                self._sink.close()
+                self._writer = self._sink = None
+
+
+def log_files(directory: Optional[str] = None) -> List[str]:
+    """Returns the log files in the order they were started (per process)."""
+    return sorted(glob.glob(os.path.join(directory or ux_log.directory, "ux-*.arrows")))
+
+
+def read_log(paths: Optional[Sequence[str]] = None, columns: Optional[Sequence[str]] = None) -> "pa.Table":
+    """Reads log files into one table, skipping an incomplete batch at the end of a file still being written."""
+    batches = []
+    for path in log_files() if paths is None else paths:
+        with pa.memory_map(path) as source:
+            try:
+                reader = pa.ipc.open_stream(source)
+                while True:
+                    batch = reader.read_next_batch()
+                    batches.append(batch.select(columns) if columns else batch)
+            except StopIteration:
+                pass
+            except (pa.ArrowInvalid, OSError):
+                pass  # Truncated tail: the writer is mid-batch or the process died
+    if not batches:
+        return SCHEMA.empty_table().select(columns) if columns else SCHEMA.empty_table()
+    return pa.Table.from_batches(batches)
+
+
+def query_log(
+    since: Optional[float] = None, until: Optional[float] = None, camera_type: Optional[str] = None, paths: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """
+    Summarizes the log, optionally restricted to requests received within [since, until) (epoch seconds) from one camera.
+
+    Returns request counts by outcome, retake count statistics per camera, and per-step visit counts
+    and duration percentiles, all computed with vectorized Arrow and NumPy operations.
+    """
+    table = read_log(paths)
+    timestamp, conditions = SCHEMA.field("received_at").type, []
+    if since is not None:
+        conditions.append(pc.greater_equal(table["received_at"], pa.scalar(int(since * 1_000_000), timestamp)))
+    if until is not None:
+        conditions.append(pc.less(table["received_at"], pa.scalar(int(until * 1_000_000), timestamp)))
+    if camera_type is not None:
+        conditions.append(pc.equal(table["camera_type"], camera_type))
+    if conditions:
+        table = table.filter(functools.reduce(pc.and_, conditions))
+
+    outcomes = table["outcome"].value_counts()
+    by_camera = {}
+    if table.num_rows:
+        cameras = pc.fill_null(table["camera_type"], "unknown").to_numpy(zero_copy_only=False)
+        retakes = pc.fill_null(table["retake_count"], 0).to_numpy()
+        names, camera_index = np.unique(cameras, return_inverse=True)
+        requests = np.bincount(camera_index)
+        retake_sums = np.bincount(camera_index, weights=retakes)
+        retaken = np.bincount(camera_index, weights=retakes > 0)
+        by_camera = {
+            str(name): {"requests": int(count), "mean_retakes": float(total / count), "retake_rate": float(share / count)}
+            for name, count, total, share in zip(names, requests, retake_sums, retaken)
+        }
+
+    steps = pc.list_flatten(table["steps"]).combine_chunks() if table.num_rows else None
+    by_step = {}
+    if steps is not None and len(steps):
+        step_numbers = steps.field("step").to_numpy(zero_copy_only=False)
+        step_durations = steps.field("duration").to_numpy(zero_copy_only=False)
+        order = np.argsort(step_numbers, kind="stable")
+        numbers, starts = np.unique(step_numbers[order], return_index=True)
+        for number, durations in zip(numbers, np.split(step_durations[order], starts[1:])):
+            p50, p90 = np.percentile(durations, [50, 90])
+            by_step[int(number)] = {
+                "visits": len(durations),
+                "mean_duration": float(durations.mean()),
+                "p50_duration": float(p50),
+                "p90_duration": float(p90),
+            }
+
+    return {
+        "requests": table.num_rows,
+        "outcomes": {str(entry["values"]): entry["counts"] for entry in outcomes.to_pylist()},
+        "cameras": by_camera,
+        "steps": by_step,
+    }
+
+
+ux_log = UxTelemetryLog(
+    UX_LOG_PREFIX,
+    UX_LOG_BATCH_SIZE,
+    UX_LOG_FLUSH_INTERVAL,
+    UX_LOG_QUEUE_SIZE,
+    UX_LOG_FILE_MAX_BYTES,
+    UX_LOG_FILE_MAX_SECONDS,
+    UX_LOG_COMPRESSION,
+    UX_LOG_ENABLED,
+)
+register_stats("ux_log", ux_log.stats)
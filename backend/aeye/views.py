@@ -1,35 +1,193 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework import status
-import random
-from .config import PROBABILITY_DIABETES
+from rest_framework.permissions import AllowAny, IsAdminUser
+from django.http import FileResponse, Http404, HttpResponse
+import datetime, json, mimetypes
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import IMAGE_QUALITY_MAX_BATCH, REPORT_PAGE_MAX_SIZE, REPORT_PAGE_SIZE
+from .inference import check_image_quality, check_image_quality_batch, diagnose, model_registry
+from .archive import report_archive
+from .models import DiagnoseReport
+from .offload import offloader
+from .parsers import OctetStreamParser
+from .reports import camera_summary, get_report, list_reports
+from .telemetry import render_metrics
+
+FORM_DATA_HEADER = "X-Form-Data"  # Carries the JSON form data when the body is the raw image
+
+
+def read_image_request(request) -> Tuple[Optional[Dict[str, Any]], Optional[bytes]]:
+    """
+    Extracts the form data and image bytes from a request in any of the accepted encodings:
+
+    - `application/octet-stream`: the body is the raw image, the form data is JSON in the `X-Form-Data` header.
+    - `multipart/form-data`: the image is the `imageData` file part, the form data is a JSON `formData` field.
+    - JSON or URL-encoded form (legacy): `imageData` is a base64 string, `formData` an object.
+    """
+    if isinstance(request.data, bytes):
+        form_data = request.headers.get(FORM_DATA_HEADER)
+        return (json.loads(form_data) if form_data else None), request.data
+
+    form_data = request.data.get("formData")
+    if isinstance(form_data, str):
+        form_data = json.loads(form_data)
+
+    image_file = request.FILES.get("imageData")
+    if image_file is not None:
+        return form_data, image_file.read()
+
+    image_data = request.data.get("imageData")  # Legacy base64 image
+    return form_data, (offloader.decode_base64(image_data) if image_data else None)
+
+
+def read_image_batch_request(request, max_images: int) -> List[bytes]:
+    """
+    Extracts a list of image bytes from a batch request:
+
+    - `multipart/form-data`: every `imageData` file part is one image.
+    - JSON: `imageData` is a list of base64 strings.
+
+    The number of images is checked against `max_images` before any of them is read or decoded.
+    """
+    image_files = request.FILES.getlist("imageData")
+    images_data = image_files or request.data.get("imageData", [])
+    if not isinstance(images_data, list):
+        raise TypeError("imageData must be a list")
+    if len(images_data) > max_images:
+        raise ValueError(f"at most {max_images} images per batch")
+    if image_files:
+        return [image_file.read() for image_file in image_files]
+    return [offloader.decode_base64(image_data) for image_data in images_data]
 
 
 class DiagnoseAPIView(APIView):
+    parser_classes = [OctetStreamParser, MultiPartParser, JSONParser, FormParser]
+
     def post(self, request, *args, **kwargs):
-        form_data = request.data.get('formData')
-        image_data = request.data.get('imageData')  # Expect base64 image
+        try:
+            form_data, image_data = read_image_request(request)
+        except ValueError as e:
+            return Response({"error": f"Malformed request: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
         # (Optional) Additional validation can be performed here
 
-        # Simulate AI diagnostic process
-        diagnose_result = random.random() < PROBABILITY_DIABETES
-        confidence = round(random.uniform(0.5, 1.0), 2)
+        return Response(diagnose(form_data, image_data), status=status.HTTP_200_OK)
 
-        return Response({
-            "diagnose_result": diagnose_result,
-            "confidence": confidence
-        }, status=status.HTTP_200_OK)
 
 class ImageQualityAPIView(APIView):
+    parser_classes = [OctetStreamParser, MultiPartParser, JSONParser, FormParser]
+
     def post(self, request, *args, **kwargs):
-        image_data = request.data.get('imageData')  # Expect base64 image
+        try:
+            _, image_data = read_image_request(request)
+        except ValueError as e:
+            return Response({"error": f"Malformed request: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
         # (Optional) Additional validation can be performed here
 
-        # Simulate image quality check
-        image_quality_passed = random.random() > 0.1
+        return Response(check_image_quality(image_data), status=status.HTTP_200_OK)
+
+
+class ImageQualityBatchAPIView(APIView):
+    parser_classes = [MultiPartParser, JSONParser]
+
+    def post(self, request, *args, **kwargs):
+        try:
+            images_data = read_image_batch_request(request, IMAGE_QUALITY_MAX_BATCH)
+        except (ValueError, TypeError) as e:
+            return Response({"error": f"Malformed request: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"results": check_image_quality_batch(images_data)}, status=status.HTTP_200_OK)
+
+
+class ReportListAPIView(APIView):
+    permission_classes = [IsAdminUser]  # Reports hold patient data: staff accounts only
+    FILTERS = ("camera_type", "diagnose_result", "created_after", "created_before", "min_confidence", "max_confidence")
+
+    def get(self, request, *args, **kwargs):
+        filters = {name: request.query_params[name] for name in self.FILTERS if name in request.query_params}
+        try:
+            limit = int(request.query_params.get("limit", REPORT_PAGE_SIZE))
+            if not 1 <= limit <= REPORT_PAGE_MAX_SIZE:
+                raise ValueError(f"limit must be between 1 and {REPORT_PAGE_MAX_SIZE}")
+            page = list_reports(filters, limit, request.query_params.get("cursor"))
+        except ValueError as e:
+            return Response({"error": f"Malformed request: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(page, status=status.HTTP_200_OK)
+
+
+class ReportDetailAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, report_id: int, *args, **kwargs):
+        report = get_report(report_id)
+        if report is None:
+            raise Http404("Report not found")
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ReportSummaryAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since, until = (request.query_params.get(name) for name in ("since", "until"))
+            since = datetime.date.fromisoformat(since) if since else None
+            until = datetime.date.fromisoformat(until) if until else None
+        except ValueError as e:
+            return Response({"error": f"Malformed request: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"cameras": camera_summary(since, until)}, status=status.HTTP_200_OK)
+
+
+class FundusImageAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, report_id: int, *args, **kwargs):
+        report = DiagnoseReport.objects.filter(id=report_id).only("fundus_image").first()
+        if report is None:
+            # Archived reports are served from their packfile
+            archived = report_archive.get(report_id)
+            if archived is None or not archived[1]:
+                raise Http404("Report not found")
+            content_type = mimetypes.guess_type(archived[0]["fundus_image"])[0] or "application/octet-stream"
+            return HttpResponse(archived[1], content_type=content_type)
+        if not report.fundus_image:
+            raise Http404("Report not found")
+
+        try:
+            image_file = report.fundus_image.storage.open(report.fundus_image.name, "rb")
+        except FileNotFoundError:
+            raise Http404("Image not found")
+        content_type = mimetypes.guess_type(report.fundus_image.name)[0] or "application/octet-stream"
+        return FileResponse(image_file, content_type=content_type)
+
+
+class ModelRegistryAPIView(APIView):
+    def get_permissions(self):
+        # Anyone may read which versions are served; swapping a model requires a staff account
+        return [AllowAny()] if self.request.method == "GET" else [IsAdminUser()]
+
+    def get(self, request, *args, **kwargs):
+        return Response(model_registry.info(), status=status.HTTP_200_OK)
+
+    def post(self, request, name: str, *args, **kwargs):
+        if name not in model_registry.info():
+            raise Http404("Unknown model")
+
+        # The new version is loaded and warmed up while the current one keeps serving, then swapped in
+        try:
+            loaded = model_registry.load(name, request.data.get("version"))
+        except Exception as e:
+            return Response({"error": f"Failed to load model: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({name: loaded.info()}, status=status.HTTP_200_OK)
+
 
-        return Response({
-            "image_quality_passed": image_quality_passed
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+class MetricsAPIView(APIView):
+    def get(self, request, *args, **kwargs):
+        # Prometheus text exposition format, scraped from the process that serves the requests
+        return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
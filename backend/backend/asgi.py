@@ -10,13 +10,20 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
+
+# Set up Django before importing the consumers, which use the ORM
+django_asgi_app = get_asgi_application()
+
+import aeye.lifespan
 import aeye.routing
 
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),
-        "websocket": AuthMiddlewareStack(
-            URLRouter(aeye.routing.websocket_urlpatterns)
-        ),
+        "http": django_asgi_app,
+        "websocket": AuthMiddlewareStack(URLRouter(aeye.routing.websocket_urlpatterns)),
+        "lifespan": aeye.lifespan.lifespan_app,
     }
 )
+
+# Daphne sends no lifespan events: warm up now and drain the write-behind queues at exit
+aeye.lifespan.start_resources()
@@ -1,21 +1,26 @@
+import asyncio
 import json
 import random
-from time import sleep
 
-from channels.generic.websocket import WebsocketConsumer
+from channels.generic.websocket import AsyncWebsocketConsumer
 
 
-class NumberGenerator(WebsocketConsumer):
+class NumberGenerator(AsyncWebsocketConsumer):
 
-    def connect(self):
-        self.accept()
+    async def connect(self):
+        await self.accept()
+        # Generate numbers on the event loop instead of blocking a worker thread for the lifetime of the socket
+        self.generator = asyncio.ensure_future(self.generate_numbers())
 
+    async def generate_numbers(self):
         while True:
             data = {"number": random.randint(1, 1000)}
 
-            self.send(json.dumps(data))
+            await self.send(json.dumps(data))
 
-            sleep(1)
+            await asyncio.sleep(1)
 
-    def disconnect(self, code):
+    async def disconnect(self, code):
+        if hasattr(self, "generator"):
+            self.generator.cancel()
         print("Socket disconnected with code", code)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -73,6 +74,19 @@ TEMPLATES = [
 WSGI_APPLICATION = "backend.wsgi.application"
 ASGI_APPLICATION = "backend.asgi.application"
 
+# The in-memory layer is per process, like the monitor statistics it fans out
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    },
+}
+if os.environ.get("AEYE_REDIS_URL"):
+    # A layer shared by all server and pipeline worker processes (requires channels_redis), e.g. redis://localhost:6379/0
+    CHANNEL_LAYERS["default"] = {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {"hosts": [os.environ["AEYE_REDIS_URL"]], "capacity": 1000, "expiry": 60},
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -80,7 +94,13 @@ ASGI_APPLICATION = "backend.asgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.environ.get("AEYE_DB_PATH", BASE_DIR / "db.sqlite3"),
+        "OPTIONS": {
+            # WAL lets readers run alongside the report writer; NORMAL sync is safe in WAL mode
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA busy_timeout=5000",
+            # Take the write lock when a transaction starts instead of failing on lock upgrade
+            "transaction_mode": "IMMEDIATE",
+        },
     }
 }
 
@@ -121,6 +141,9 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Fundus images, archive packs and UX logs are stored below this directory (the working directory by default)
+MEDIA_ROOT = os.environ.get("AEYE_MEDIA_ROOT", "")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
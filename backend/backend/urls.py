@@ -18,7 +18,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from aeye.views import MetricsAPIView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path('aeye/', include('aeye.urls')),  # Add this line to include app's URLs
+    path("aeye/", include("aeye.urls")),  # Add this line to include app's URLs
+    path("metrics", MetricsAPIView.as_view()),  # Stage latency histograms and internal counters for Prometheus
 ]
@@ -0,0 +1,85 @@
+"""
+Measures throughput against tail latency of the diagnose micro-batcher.
+
+A closed-loop set of client threads calls `MicroBatcher.submit` on `diagnose_batch`, wrapped in a
+simulated model cost of `--fixed-ms` per batch plus `--per-item-ms` per image, which is how a real
+vectorized model behaves. Every combination of `--batch-sizes` and `--waits-ms` is measured and the
+results are printed as JSON.
+
+Usage (from the repository root):
+    python benchmarks/bench_batching.py --clients 64 --batch-sizes 1 8 32 --waits-ms 0 2 5
+"""
+
+import argparse, json, os, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django
+
+django.setup()
+
+import numpy as np
+
+from aeye.batching import MicroBatcher
+from aeye.inference import diagnose_batch
+
+FORM_DATA = {"cameraType": "Canon CX-1", "age": 61, "gender": "Male", "diabetesHistory": "Yes", "weight": 82.0, "height": 178.0}
+
+
+def run(clients: int, duration: float, batch_size: int, wait: float, fixed: float, per_item: float):
+    def model(requests):
+        time.sleep(fixed + per_item * len(requests))  # Simulated cost of a vectorized forward pass
+        return diagnose_batch(requests)
+
+    batcher = MicroBatcher(model, batch_size, wait)
+    image_data = os.urandom(1024)
+    latencies = [[] for _ in range(clients)]
+    stop_at = time.perf_counter() + duration
+
+    def client(index: int):
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            batcher.submit((FORM_DATA, image_data))
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    batcher.stop()
+
+    samples = np.array([latency for per_client in latencies for latency in per_client]) * 1000
+    return {
+        "max_batch_size": batch_size,
+        "max_wait_ms": wait * 1000,
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "mean_batch_size": round(batcher.stats()["mean_batch_size"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent closed-loop clients")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds measured per configuration")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--waits-ms", type=float, nargs="+", default=[0, 2, 5])
+    parser.add_argument("--fixed-ms", type=float, default=5.0, help="Simulated model cost per batch")
+    parser.add_argument("--per-item-ms", type=float, default=0.2, help="Simulated model cost per image")
+    args = parser.parse_args()
+
+    results = [
+        run(args.clients, args.duration, batch_size, wait_ms / 1000, args.fixed_ms / 1000, args.per_item_ms / 1000)
+        for batch_size in args.batch_sizes
+        for wait_ms in args.waits_ms
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compares how the consumer forwards an image to the inference endpoints.
+
+- before: the image is re-encoded to base64 for /aeye/image-quality/ (URL-encoded form) and again for
+  /aeye/diagnose/ (JSON), as the consumer did previously.
+- after: the decoded bytes are sent once per endpoint as `application/octet-stream`.
+
+Both modes drive the real Django views in-process through httpx's ASGI transport and report the
+time and peak traced memory per request.
+
+Usage (from the repository root):
+    python benchmarks/bench_image_payload.py --size-kb 1024 --requests 20
+"""
+
+import argparse, asyncio, base64, json, os, statistics, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django
+
+django.setup()
+
+import httpx
+from django.core.asgi import get_asgi_application
+
+from aeye.views import FORM_DATA_HEADER
+
+FORM_DATA = {
+    "cameraType": "Topcon NW400",
+    "age": 54,
+    "gender": "Female",
+    "diabetesHistory": "No",
+    "familyDiabetesHistory": "Yes",
+    "weight": 68.5,
+    "height": 165.0,
+}
+
+
+async def forward_before(client: httpx.AsyncClient, captured_photo: str):
+    image_data = base64.b64decode(captured_photo.split("base64,")[-1])
+    await client.post("/aeye/image-quality/", data={"imageData": base64.b64encode(image_data).decode("utf-8")})
+    await client.post("/aeye/diagnose/", json={"formData": FORM_DATA, "imageData": base64.b64encode(image_data).decode("utf-8")})
+
+
+async def forward_after(client: httpx.AsyncClient, captured_photo: str):
+    image_data = base64.b64decode(captured_photo.split("base64,")[-1])
+    await client.post("/aeye/image-quality/", content=image_data, headers={"Content-Type": "application/octet-stream"})
+    await client.post(
+        "/aeye/diagnose/",
+        content=image_data,
+        headers={"Content-Type": "application/octet-stream", FORM_DATA_HEADER: json.dumps(FORM_DATA)},
+    )
+
+
+async def measure(forward, captured_photo: str, requests: int):
+    transport = httpx.ASGITransport(app=get_asgi_application())
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+        await forward(client, captured_photo)  # Warm-up
+
+        times, peaks = [], []
+        for _ in range(requests):
+            tracemalloc.start()
+            start = time.perf_counter()
+            await forward(client, captured_photo)
+            times.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    return {
+        "mean_ms": round(statistics.mean(times) * 1000, 3),
+        "p50_ms": round(statistics.median(times) * 1000, 3),
+        "peak_memory_mb": round(max(peaks) / 2**20, 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--size-kb",
+        type=int,
+        default=1024,
+        help="Size of the random image payload in KiB (the legacy form body must stay under DATA_UPLOAD_MAX_MEMORY_SIZE)",
+    )
+    parser.add_argument("--requests", type=int, default=20, help="Requests measured per mode")
+    args = parser.parse_args()
+
+    captured_photo = "data:image/jpeg;base64," + base64.b64encode(os.urandom(args.size_kb * 1024)).decode("utf-8")
+    results = {
+        "image_kb": args.size_kb,
+        "before": await measure(forward_before, captured_photo, args.requests),
+        "after": await measure(forward_after, captured_photo, args.requests),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+"""
+Compares the transports the consumer can use to reach the inference logic.
+
+Starts the backend under daphne, listening on a TCP port and on a Unix-domain socket, then runs
+`post_image_quality` and `post_diagnose` (what the consumer calls) in a fresh process per transport:
+
+- direct: in-process calls, no server involved
+- http: HTTP/1.1 keep-alive to the TCP port (the previous loopback default)
+- uds: the same HTTP requests over the Unix-domain socket
+
+Each transport gets a sequential run (per-call overhead) and a `--concurrency` run (throughput), with
+hedging off so every call is a single attempt. Reports p50/p99 latency and calls per second.
+
+Usage (from the repository root):
+    python benchmarks/bench_inference_transport.py --requests 400 --concurrency 16
+"""
+
+import argparse, asyncio, json, os, socket, subprocess, sys, tempfile, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PORT = int(os.environ.get("BENCH_PORT", "9918"))
+TRANSPORTS = ("direct", "http", "uds")
+
+
+def start_server(uds_path: str) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "daphne", "-p", str(PORT), "-u", uds_path, "backend.asgi:application"],
+        cwd=os.path.join(ROOT, "backend"),
+        env={**os.environ, "DJANGO_SETTINGS_MODULE": "backend.settings"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=0.2).close()
+            if os.path.exists(uds_path):
+                return server
+        except OSError:
+            pass
+        time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Server did not start")
+
+
+def run_transport(transport: str, uds_path: str, args: argparse.Namespace) -> dict:
+    env = {
+        **os.environ,
+        "AEYE_INFERENCE_TRANSPORT": transport,
+        "AEYE_INFERENCE_UDS_PATH": uds_path,
+        "AEYE_DOWNSTREAM_BASE_URL": f"http://127.0.0.1:{PORT}",
+        "AEYE_METRICS_SINK": "null",
+    }
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        "--requests",
+        str(args.requests),
+        "--concurrency",
+        str(args.concurrency),
+    ]
+    return json.loads(subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout)
+
+
+async def measure(args: argparse.Namespace) -> dict:
+    """Runs in the child process, with the transport chosen through the environment."""
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+
+    django.setup()
+
+    import numpy as np
+    from PIL import Image
+    import io
+
+    from aeye.clients import close_http_client, diagnose_endpoint, image_quality_endpoint, post_diagnose, post_image_quality
+
+    for endpoint in (image_quality_endpoint, diagnose_endpoint):
+        endpoint.hedging = False
+    buffer = io.BytesIO()
+    Image.fromarray(np.random.default_rng(0).integers(0, 255, (512, 512, 3), dtype=np.uint8)).save(buffer, "JPEG", quality=85)
+    image = buffer.getvalue()
+    form_data = {"age": 60, "gender": "M"}
+
+    async def call_pair():
+        await post_image_quality(image)
+        await post_diagnose(form_data, image)
+
+    async def run(concurrency: int) -> dict:
+        latencies, remaining = [], iter(range(args.requests))
+
+        async def client():
+            for _ in remaining:
+                start = time.perf_counter()
+                await call_pair()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        samples = np.array(latencies) * 1000
+        return {
+            "p50_ms": round(float(np.percentile(samples, 50)), 2),
+            "p99_ms": round(float(np.percentile(samples, 99)), 2),
+            "calls_per_second": round(2 * len(latencies) / elapsed, 1),
+        }
+
+    try:
+        for _ in range(20):
+            await call_pair()  # Warm up connections, caches and the batcher
+        return {"sequential": await run(1), "concurrent": await run(args.concurrency)}
+    finally:
+        await close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="Quality check + diagnose pairs per run")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args))))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        uds_path = os.path.join(directory, "inference.sock")
+        server = start_server(uds_path)
+        try:
+            results = {transport: run_transport(transport, uds_path, args) for transport in TRANSPORTS}
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Measures hedging, deadlines and circuit breaking of the downstream client against the stand-in server.
+
+Starts benchmarks/standin.py as a subprocess, points the backend client at it and runs three scenarios
+through `post_image_quality`, which is what the consumer calls:
+
+- tail: `--requests` closed-loop calls from `--concurrency` clients while `--slow-rate` of the stand-in's
+  answers take `--slow-ms`, once without and once with hedging; reports p50/p99/max and hedges sent.
+- deadline: the same slow replica with a `--budget-ms` request budget; reports how long failing calls took.
+- outage: every answer is a 503; reports how many calls reached the stand-in before the breaker opened
+  and how fast the remaining calls failed.
+
+Usage (from the repository root):
+    python benchmarks/bench_resilience.py --requests 400 --slow-rate 0.05 --slow-ms 1000
+"""
+
+import argparse, asyncio, json, os, socket, subprocess, sys, time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+PORT = int(os.environ.get("STANDIN_PORT", "9917"))
+os.environ["AEYE_DOWNSTREAM_BASE_URL"] = f"http://127.0.0.1:{PORT}"
+os.environ["AEYE_INFERENCE_TRANSPORT"] = "http"  # The default "direct" transport would never reach the stand-in
+
+import django
+
+django.setup()
+
+import httpx
+import numpy as np
+
+from aeye.clients import DownstreamError, close_http_client, image_quality_endpoint, post_image_quality
+from aeye.resilience import CircuitBreaker, deadline
+
+IMAGE = os.urandom(32 * 1024)
+
+
+def start_standin(args) -> subprocess.Popen:
+    standin = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "standin.py"), "--port", str(PORT), "--delay-ms", str(args.delay_ms)],
+        stdout=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", PORT), timeout=0.2).close()
+            return standin
+        except OSError:
+            time.sleep(0.1)
+    standin.terminate()
+    raise RuntimeError("Stand-in did not start")
+
+
+async def configure(**settings):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"http://127.0.0.1:{PORT}/standin/config", json=settings)
+        return response.json()["counts"]
+
+
+def reset_endpoint(hedging: bool):
+    endpoint = image_quality_endpoint
+    endpoint.hedging = hedging
+    endpoint.latencies._count = 0
+    endpoint.breaker = CircuitBreaker(endpoint.name, endpoint.breaker.failure_threshold, endpoint.breaker.reset_timeout)
+    endpoint.counters = {name: 0 for name in endpoint.counters}
+
+
+async def run_calls(requests: int, concurrency: int, budget: float = None):
+    latencies, failures = [], []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                if budget is None:
+                    await post_image_quality(IMAGE)
+                else:
+                    with deadline(budget):
+                        await post_image_quality(IMAGE)
+                latencies.append(time.perf_counter() - start)
+            except DownstreamError:
+                failures.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, failures
+
+
+def summarize(samples):
+    if not samples:
+        return None
+    samples = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(samples, 50)), 1),
+        "p99_ms": round(float(np.percentile(samples, 99)), 1),
+        "max_ms": round(float(samples.max()), 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--delay-ms", type=float, default=10.0, help="Base latency of the stand-in")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Fraction of slow stand-in answers")
+    parser.add_argument("--slow-ms", type=float, default=1000.0)
+    parser.add_argument("--budget-ms", type=float, default=200.0, help="Request budget in the deadline scenario")
+    args = parser.parse_args()
+
+    standin = start_standin(args)
+    results = {}
+    try:
+        for hedging in (False, True):
+            reset_endpoint(hedging)
+            await configure(slow_rate=args.slow_rate, slow_ms=args.slow_ms, error_rate=0.0)
+            latencies, failures = await run_calls(args.requests, args.concurrency)
+            results["tail_hedged" if hedging else "tail_unhedged"] = {
+                "ok": summarize(latencies),
+                "failed": len(failures),
+                **{name: image_quality_endpoint.counters[name] for name in ("hedged", "hedge_won")},
+            }
+
+        reset_endpoint(False)
+        await configure(slow_rate=args.slow_rate, slow_ms=args.slow_ms, error_rate=0.0)
+        latencies, failures = await run_calls(args.requests, args.concurrency, budget=args.budget_ms / 1000)
+        results["deadline"] = {"ok": summarize(latencies), "failed": summarize(failures)}
+
+        reset_endpoint(True)
+        before = await configure(slow_rate=0.0, error_rate=1.0)
+        latencies, failures = await run_calls(args.requests, args.concurrency)
+        after = await configure(error_rate=0.0)
+        results["outage"] = {
+            "failed": summarize(failures),
+            "reached_standin": after["requests"] - before["requests"],
+            "breaker": image_quality_endpoint.breaker.stats(),
+        }
+    finally:
+        await close_http_client()
+        standin.terminate()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,229 @@
+"""
+Load generator and benchmark for the /ws/process/ diagnosis pipeline, built on fake.py.
+
+Modes:
+- closed: `--concurrency` clients each send a new request as soon as the previous one finishes.
+- open: requests start at a fixed `--rate` (requests per second) regardless of how many are still
+  running, and latency is measured from the scheduled start, so queueing delay is not hidden.
+
+For every request the time between consecutive server progress messages is attributed to a stage
+("Basic information verified", "Image data verified", ...). The summary with p50/p95/p99 per stage and
+end to end, plus throughput, is printed (or written with `--output`) as JSON.
+
+With `--multiplex N` each closed-loop client sends N tagged requests at a time over a single
+connection instead of opening one connection per request.
+
+Every request carries a unique image (the generated payloads differ per request by a JPEG comment),
+so the server's result caches never answer from a previous request.
+
+Everything runs offline: with `--start-server` the tool launches the Django server itself with
+metrics sent to the null sink, on a fresh database and media directory that are removed afterwards,
+so no Grafana credentials, network access or existing data are needed or touched.
+
+Usage (from the repository root):
+    python benchmarks/loadgen.py --start-server --mode closed --concurrency 8 --requests 200
+    python benchmarks/loadgen.py --mode open --rate 20 --duration 30 --image-size 1024 --protocol binary
+"""
+
+import argparse, asyncio, base64, json, os, socket, struct, subprocess, sys, tempfile, time
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from fake import call_api, call_api_session, generate_fake_data
+
+# Server messages that close a stage, in pipeline order, with the name the stage is reported under
+STAGES = {
+    "WebSocket connection established": "connect",
+    "Basic information verified": "verify_form_data",
+    "Image data verified": "verify_and_decode_image",
+    "Diagnosis complete": "call_diagnose_api",
+    "Report generated": "generate_and_save_report",
+}
+
+
+def unique_payload(payload: Dict[str, Any], serial: int) -> Dict[str, Any]:
+    """Returns a copy of the payload whose JPEG carries `serial` in a comment segment, so its image hash is unique."""
+    header, encoded = payload["capturedPhoto"].split(",", 1)
+    image, comment = base64.b64decode(encoded), f"loadgen {serial}".encode()
+    image = image[:2] + b"\xff\xfe" + struct.pack(">H", len(comment) + 2) + comment + image[2:]  # COM segment after SOI
+    return {**payload, "capturedPhoto": f"{header},{base64.b64encode(image).decode()}"}
+
+
+def percentiles(samples: List[float]) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def analyse(result: Dict[str, Any], start: float) -> Dict[str, Any]:
+    """Splits one request's message timeline into per-stage durations and an outcome."""
+    stages: Dict[str, float] = {}
+    previous = start
+    outcome = "error" if result["error"] else "incomplete"
+    for timestamp, raw in result["events"]:
+        message = json.loads(raw).get("message", "") if raw.startswith("{") else raw
+        if message in STAGES:
+            stages[STAGES[message]] = timestamp - previous
+            previous = timestamp
+        if message == "Report generated":
+            outcome = "completed"
+        elif "Invalid" in message:
+            outcome = "rejected"
+        elif message == "Server busy":
+            outcome = "busy"
+    return {"outcome": outcome, "stages": stages, "total": previous - start}
+
+
+async def run_closed(args, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    records: List[Dict[str, Any]] = []
+    issued = 0
+
+    async def client():
+        nonlocal issued
+        while (deadline is None and issued < args.requests) or (deadline is not None and time.perf_counter() < deadline):
+            if args.multiplex > 1:
+                batch = [unique_payload(payloads[(issued + i) % len(payloads)], issued + i) for i in range(args.multiplex)]
+                issued += len(batch)
+                results = await call_api_session(args.url, batch, binary=args.protocol == "binary", verbose=False, encoding=args.encoding)
+                records.extend(analyse(result, result["start"]) for result in results)
+                continue
+
+            payload = unique_payload(payloads[issued % len(payloads)], issued)
+            issued += 1
+            result = await call_api(args.url, payload, semaphore, binary=args.protocol == "binary", verbose=False, encoding=args.encoding)
+            records.append(analyse(result, result["start"]))
+
+    await asyncio.gather(*[client() for _ in range(args.concurrency)])
+    return records
+
+
+async def run_open(args, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(sys.maxsize)  # Arrivals are never held back in open-loop mode
+    interval = 1.0 / args.rate
+    total = int(args.duration * args.rate) if args.duration else args.requests
+    records: List[Dict[str, Any]] = []
+    tasks = []
+
+    async def one(payload, scheduled: float):
+        result = await call_api(args.url, payload, semaphore, binary=args.protocol == "binary", verbose=False, encoding=args.encoding)
+        records.append(analyse(result, scheduled))
+
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i * interval
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(one(unique_payload(payloads[i % len(payloads)], i), scheduled)))
+    await asyncio.gather(*tasks)
+    return records
+
+
+def summarise(args, records: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    outcomes: Dict[str, int] = {}
+    for record in records:
+        outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+    completed = [record for record in records if record["outcome"] == "completed"]
+
+    return {
+        "config": {
+            "mode": args.mode,
+            "concurrency": args.concurrency if args.mode == "closed" else None,
+            "rate": args.rate if args.mode == "open" else None,
+            "protocol": args.protocol,
+            "multiplex": args.multiplex,
+            "encoding": args.encoding,
+            "image_size": args.image_size,
+        },
+        "requests": len(records),
+        "outcomes": outcomes,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(completed) / elapsed, 3) if elapsed else 0.0,
+        "latency": {
+            "end_to_end": percentiles([record["total"] for record in completed]),
+            "stages": {stage: percentiles([r["stages"][stage] for r in records if stage in r["stages"]]) for stage in STAGES.values()},
+        },
+    }
+
+
+def start_server(port: int, directory: str) -> subprocess.Popen:
+    """
+    Starts the Django development server with metrics kept local, and waits until it accepts connections.
+
+    The server gets a freshly migrated database and media directory inside `directory`, so benchmark
+    reports and images never land in the real ones.
+    """
+    env = {
+        **os.environ,
+        "AEYE_METRICS_SINK": "null",
+        "AEYE_DB_PATH": os.path.join(directory, "db.sqlite3"),
+        "AEYE_MEDIA_ROOT": os.path.join(directory, "media"),
+    }
+    manage = {"cwd": os.path.join(ROOT, "backend"), "env": env}
+    subprocess.run([sys.executable, "manage.py", "migrate", "--noinput"], check=True, capture_output=True, **manage)
+    server = subprocess.Popen(
+        [sys.executable, "manage.py", "runserver", str(port), "--noreload"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **manage,
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Server did not start")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://localhost:8000/ws/process/")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients in closed-loop mode")
+    parser.add_argument("--rate", type=float, default=10.0, help="Arrivals per second in open-loop mode")
+    parser.add_argument("--requests", type=int, default=100, help="Requests to send (unless --duration is given)")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to generate load for")
+    parser.add_argument("--image-size", type=int, default=512, help="Width and height of the synthetic fundus image")
+    parser.add_argument("--protocol", choices=["text", "binary"], default="text", help="WebSocket upload protocol")
+    parser.add_argument("--encoding", choices=["json", "msgpack"], default="json", help="Progress message encoding to negotiate")
+    parser.add_argument("--multiplex", type=int, default=1, help="Tagged requests per connection in closed-loop mode")
+    parser.add_argument("--payloads", type=int, default=16, help="Fake requests generated up front; each use gets a unique image")
+    parser.add_argument("--start-server", action="store_true", help="Launch a local server on the --url port for the run")
+    parser.add_argument("--output", default=None, help="Write the JSON summary to this file instead of stdout")
+    args = parser.parse_args()
+
+    server_dir = tempfile.TemporaryDirectory(prefix="loadgen-") if args.start_server else None
+    server = start_server(int(args.url.split(":")[2].split("/")[0]), server_dir.name) if server_dir else None
+    try:
+        payloads = [await generate_fake_data(args.image_size) for _ in range(args.payloads)]
+        start = time.perf_counter()
+        records = await (run_closed(args, payloads) if args.mode == "closed" else run_open(args, payloads))
+        summary = summarise(args, records, time.perf_counter() - start)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            server_dir.cleanup()
+
+    output = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
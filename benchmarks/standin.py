@@ -0,0 +1,131 @@
+"""
+Stand-in for the downstream inference APIs, with injectable latency and failures.
+
+Serves POST /aeye/image-quality/ and POST /aeye/diagnose/ over HTTP/1.1 keep-alive with responses
+shaped like the real endpoints, but without touching an image or a model. Every request first
+sleeps `--delay-ms` (plus up to `--jitter-ms`), or `--slow-ms` for a `--slow-rate` fraction of
+requests, then fails with a 503 for an `--error-rate` fraction or has its connection dropped for a
+`--drop-rate` fraction. The injection settings can be changed while it runs:
+
+    GET  /standin/config               returns the current settings and request counts
+    POST /standin/config {"error_rate": 1.0}   updates some of them
+
+Point the backend at it with AEYE_DOWNSTREAM_BASE_URL, e.g. to watch hedging and the circuit breaker. The
+backend calls inference in-process by default, so also select the HTTP transport with
+AEYE_INFERENCE_TRANSPORT=http; otherwise no request reaches the stand-in.
+
+Usage (from the repository root):
+    python benchmarks/standin.py --port 9000 --delay-ms 20 --slow-rate 0.05 --slow-ms 2000
+    AEYE_INFERENCE_TRANSPORT=http AEYE_DOWNSTREAM_BASE_URL=http://localhost:9000 python backend/manage.py runserver
+"""
+
+import argparse, asyncio, json, random
+from typing import Any, Dict, Optional, Tuple
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+class StandIn:
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self.counts = {"requests": 0, "slow": 0, "errors": 0, "dropped": 0}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                response = await self.respond(*request)
+                if response is None:
+                    break  # Dropped: close the connection without answering
+                writer.write(response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return method, path.split("?")[0], body
+
+    async def respond(self, method: str, path: str, body: bytes) -> Optional[bytes]:
+        settings = self.settings
+        if path == "/standin/config":
+            if method == "POST":
+                self.settings.update(json.loads(body or b"{}"))
+            return encode(200, {"settings": self.settings, "counts": self.counts})
+        if method != "POST" or path not in ("/aeye/image-quality/", "/aeye/diagnose/"):
+            return encode(404, {"error": "Not found"})
+
+        self.counts["requests"] += 1
+        if random.random() < settings["slow_rate"]:
+            self.counts["slow"] += 1
+            await asyncio.sleep(settings["slow_ms"] / 1000)
+        else:
+            await asyncio.sleep((settings["delay_ms"] + random.uniform(0, settings["jitter_ms"])) / 1000)
+
+        if random.random() < settings["drop_rate"]:
+            self.counts["dropped"] += 1
+            return None
+        if random.random() < settings["error_rate"]:
+            self.counts["errors"] += 1
+            return encode(503, {"error": "Injected failure"})
+
+        if path == "/aeye/image-quality/":
+            passed = random.random() >= settings["quality_fail_rate"]
+            scores = {"sharpness": 0.8, "exposure": 0.7, "contrast": 0.6, "fov_coverage": 0.9}
+            return encode(200, {"image_quality_passed": passed, "scores": scores})
+        return encode(
+            200, {"diagnose_result": random.random() < 0.4, "confidence": round(random.uniform(0.5, 1.0), 2), "model_version": "standin"}
+        )
+
+
+def encode(status: int, payload: Dict[str, Any]) -> bytes:
+    body = json.dumps(payload).encode()
+    head = f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    return head.encode("latin-1") + body
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--delay-ms", type=float, default=20.0, help="Base latency of every request")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Uniform random latency added to the base")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests taking --slow-ms instead")
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of connections closed without a response")
+    parser.add_argument("--quality-fail-rate", type=float, default=0.0, help="Fraction of images reported as low quality")
+    return parser.parse_args(argv)
+
+
+async def serve(args: argparse.Namespace):
+    settings = {
+        name: getattr(args, name)
+        for name in ("delay_ms", "jitter_ms", "slow_rate", "slow_ms", "error_rate", "drop_rate", "quality_fail_rate")
+    }
+    server = await asyncio.start_server(StandIn(settings).handle_connection, args.host, args.port)
+    print(f"Stand-in listening on http://{args.host}:{args.port} with {settings}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -3,8 +3,12 @@ import websockets
 import json
 import random
 import base64
-import os
+import io
+import time
+import numpy as np
 import requests
+from PIL import Image
+from typing import Any, Dict, List, Tuple
 
 
 def read_credentials():
@@ -13,11 +17,26 @@ def read_credentials():
     return int(data["USER_ID"]), data["API_KEY"]
 
 
-USER_ID, API_KEY = read_credentials()
+def generate_fake_fundus_image(size: int = 512, quality: int = 90) -> bytes:
+    """Draw a synthetic fundus photo (bright disc with vessels on a black surround) and encode it as JPEG."""
+    rng = np.random.default_rng()
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size - 0.5
+    radius = np.sqrt(x**2 + y**2)
 
+    # Reddish-orange disc with darker vessel-like stripes, noise, and a bright optic disc
+    vessels = 0.25 * (np.sin(40 * (x + 0.3 * np.sin(6 * y + rng.uniform(0, 6)))) > 0.92)
+    optic_disc = 0.4 * np.exp(-(((x - 0.15) ** 2 + y**2) / 0.004))
+    brightness = np.clip(0.55 - 0.6 * radius**2 - vessels + optic_disc + rng.normal(0, 0.03, (size, size)), 0, 1)
+    brightness[radius > 0.45] = 0
 
-async def generate_fake_data():
-    """Generate fake form data and encoded image for testing."""
+    rgb = np.stack([brightness, brightness * 0.55, brightness * 0.25], axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray((rgb * 255).astype(np.uint8)).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+async def generate_fake_data(image_size: int = 512):
+    """Generate fake form data and an encoded `image_size` x `image_size` image for testing."""
     form_data = {
         "cameraType": random.choice(["Topcon NW400", "Canon CX-1", "Optos Daytona Plus", "Other"]),
         "age": random.randint(0, 100),
@@ -29,45 +48,119 @@ async def generate_fake_data():
     }
     form_data["customCameraType"] = f"CustomCamera{random.randint(1, 3)}" if form_data["cameraType"] == "Other" else ""
 
-    # Simulate a base64-encoded image (random binary data here for simplicity)
-    fake_image_data = base64.b64encode(os.urandom(1024)).decode("utf-8")
+    # Simulate a base64-encoded fundus photo
+    fake_image_data = base64.b64encode(generate_fake_fundus_image(image_size)).decode("utf-8")
     captured_photo = f"data:image/jpeg;base64,{fake_image_data}"
 
     return {
         "formData": form_data,
         "capturedPhoto": captured_photo,
-        "step_history": [
+        "stepHistory": [
             {"step": 0, "duration": random.uniform(5, 60)},
             {"step": 1, "duration": random.uniform(3, 120)},
             {"step": 2, "duration": random.uniform(2, 30)},
         ],
-        "retake_count": random.randint(0, 3),
+        "retakeCount": random.randint(0, 3),
     }
 
 
-async def call_api(url, fake_data, semaphore):
-    """Send a single request to the WebSocket API with concurrency control."""
+def read_messages(response) -> List[str]:
+    """Returns the messages of a server frame as JSON strings; a MessagePack frame may carry several messages."""
+    if isinstance(response, str):
+        return [response]
+    import msgpack  # Only needed with the "msgpack" encoding
+
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(response)
+    return [json.dumps(message) for message in unpacker]
+
+
+async def call_api(url, fake_data, semaphore, binary: bool = False, verbose: bool = True, encoding: str = "json") -> Dict[str, Any]:
+    """
+    Send a single request to the WebSocket API with concurrency control.
+
+    With `binary`, the image is sent as a raw binary frame after a JSON metadata frame instead of as a
+    base64 data-URL. With `encoding="msgpack"` the server is asked for MessagePack progress messages.
+    Returns when the request started (after the semaphore was acquired), the time each server message
+    arrived (`time.perf_counter()` timestamps) and the error, if any.
+    """
     async with semaphore:  # Limit concurrency
+        result: Dict[str, Any] = {"start": time.perf_counter(), "events": [], "error": None}
+        events: List[Tuple[float, str]] = result["events"]
         try:
-            async with websockets.connect(url) as websocket:
-                # Send the fake data as a JSON string
-                await websocket.send(json.dumps(fake_data))
+            async with websockets.connect(url, subprotocols=[f"aeye.{encoding}"]) as websocket:
+                if binary:
+                    image_data = base64.b64decode(fake_data["capturedPhoto"].split("base64,")[-1])
+                    metadata = {key: value for key, value in fake_data.items() if key != "capturedPhoto"}
+                    await websocket.send(json.dumps({**metadata, "imageSize": len(image_data)}))
+                    await websocket.send(image_data)
+                else:
+                    # Send the fake data as a JSON string
+                    await websocket.send(json.dumps(fake_data))
 
                 # Listen for messages from the server
-                while True:
-                    response = await websocket.recv()
-                    print(f"Received response: {response}")
-                    if response.find("Invalid") != -1:
-                        print("Invalid data detected, exiting...")
-                        break
-                    if response.find("Report generated") != -1:
-                        print("Report generated, exiting...")
-                        break
+                done = False
+                while not done:
+                    for response in read_messages(await websocket.recv()):
+                        events.append((time.perf_counter(), response))
+                        if verbose:
+                            print(f"Received response: {response}")
+                        if response.find("Invalid") != -1:
+                            if verbose:
+                                print("Invalid data detected, exiting...")
+                            done = True
+                        elif response.find("Report generated") != -1:
+                            if verbose:
+                                print("Report generated, exiting...")
+                            done = True
         except Exception as e:
+            result["error"] = str(e)
+            if verbose:
+                print(f"Error in WebSocket connection: {e}")
+        return result
+
+
+async def call_api_session(url, fake_data_list, binary: bool = False, verbose: bool = True, encoding: str = "json") -> List[Dict[str, Any]]:
+    """
+    Send several requests over one WebSocket connection, tagged with request ids so the server processes them concurrently.
+
+    Returns one result per request, in the same format as `call_api`.
+    """
+    results = [{"start": time.perf_counter(), "events": [], "error": None} for _ in fake_data_list]
+    try:
+        async with websockets.connect(url, subprotocols=[f"aeye.{encoding}"]) as websocket:
+            for request_id, fake_data in enumerate(fake_data_list):
+                results[request_id]["start"] = time.perf_counter()
+                if binary:
+                    # Binary uploads are sent one after the other; processing still overlaps on the server
+                    image_data = base64.b64decode(fake_data["capturedPhoto"].split("base64,")[-1])
+                    metadata = {key: value for key, value in fake_data.items() if key != "capturedPhoto"}
+                    await websocket.send(json.dumps({**metadata, "requestId": request_id, "imageSize": len(image_data)}))
+                    await websocket.send(image_data)
+                else:
+                    await websocket.send(json.dumps({**fake_data, "requestId": request_id}))
+
+            pending = set(range(len(fake_data_list)))
+            while pending:
+                for response in read_messages(await websocket.recv()):
+                    request_id = json.loads(response).get("requestId")
+                    if request_id not in pending:
+                        continue  # e.g. the connection greeting
+                    results[request_id]["events"].append((time.perf_counter(), response))
+                    if verbose:
+                        print(f"Received response: {response}")
+                    if "Invalid" in response or "Report generated" in response or "Server busy" in response:
+                        pending.discard(request_id)
+    except Exception as e:
+        for result in results:
+            result["error"] = result["error"] or str(e)
+        if verbose:
             print(f"Error in WebSocket connection: {e}")
+    return results
 
 
 def post_metric(body):
+    USER_ID, API_KEY = read_credentials()  # Only needed when metrics are actually posted
     response = requests.post(
         "https://influx-prod-13-prod-us-east-0.grafana.net/api/v1/push/influx/write",
         headers={